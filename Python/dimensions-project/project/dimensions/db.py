@@ -0,0 +1,10 @@
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created receiver, runs the settings.SQLITE_PRAGMAS {pragma: value} on new SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute('PRAGMA {} = {}'.format(name, value))
@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+from django.db import connections
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, override_settings
+
+
+class SQLitePragmasTests(SimpleTestCase):
+    def get_pragma(self, name, settings_dict):
+        connection = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, 'default')
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA {}'.format(name))
+                return cursor.fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_pragmas(self):
+        """Ensure new SQLite connections run settings.SQLITE_PRAGMAS (dimensions.db.apply_sqlite_pragmas)."""
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connections['default'].settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')}
+
+            self.assertEqual(self.get_pragma('journal_mode', settings_dict), 'wal')
+            self.assertEqual(self.get_pragma('synchronous', settings_dict), 1)  # NORMAL
+            self.assertEqual(self.get_pragma('cache_size', settings_dict), -64 * 1024)
+            self.assertEqual(self.get_pragma('busy_timeout', settings_dict), 5000)
+
+            with override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234}):
+                self.assertEqual(self.get_pragma('busy_timeout', settings_dict), 1234)
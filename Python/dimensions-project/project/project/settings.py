@@ -81,6 +81,16 @@ DATABASES = {
     }
 }
 
+# PRAGMAs run on every new SQLite connection (dimensions.db.apply_sqlite_pragmas): WAL journaling so reads do not
+# wait for writes, fsync at checkpoints only, a 256 MB memory map, a 64 MB page cache and a 5 s wait for locks
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
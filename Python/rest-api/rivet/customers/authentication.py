@@ -0,0 +1,130 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import credentials_cache, token_cache
+
+
+def copy_user(user: User) -> User:
+    """Copy a User and its Customer (if loaded), so a cached User is never shared by two requests."""
+    user = copy.copy(user)
+    if User.customer.is_cached(user) and getattr(user, 'customer', None) is not None:
+        # Setting Customer.user also caches the customer on the user
+        copy.copy(user.customer).user = user
+    return user
+
+
+def copy_token(token: Token) -> Token:
+    """Copy a token, its User and the User's Customer, so a cached token is never shared by two requests."""
+    token = copy.copy(token)
+    token.user = copy_user(token.user)
+    return token
+
+
+def get_cached_token(key: str) -> Token:
+    """Get a token (with its User and Customer) from the token cache, None on a miss or if the cache is disabled."""
+    if not getattr(settings, 'TOKEN_CACHE_TTL', 0):
+        return None
+
+    user_pk = token_cache.get(key)
+    cached = token_cache.get(('user', user_pk)) if user_pk is not None else None
+    if cached is None or cached.key != key:
+        return None
+
+    return copy_token(cached)
+
+
+def cache_token(token: Token):
+    """Cache a token loaded with select_related('user__customer') for settings.TOKEN_CACHE_TTL seconds.
+
+    A user has a single token, it is stored under ('user', User.id) and its key only points to that entry: the
+    Token, User and Customer post_save/post_delete signal handlers (customers.models) drop the token by deleting
+    the user's entry, and an evicted entry can never leave the token reachable.
+    """
+    ttl = getattr(settings, 'TOKEN_CACHE_TTL', 0)
+    if ttl:
+        token_cache.set(('user', token.user_id), copy_token(token), ttl)
+        token_cache.set(token.key, token.user_id, ttl)
+
+
+def get_credentials_key(username: str, password: str) -> str:
+    """HMAC (keyed with settings.SECRET_KEY) of Basic credentials, the cache never holds a password."""
+    return salted_hmac('customers.authentication.credentials', f'{username}\0{password}', algorithm='sha256').hexdigest()
+
+
+def authenticate_basic(request, username: str, password: str) -> User:
+    """Authenticate Basic credentials, None if they are invalid.
+
+    The password hasher (PBKDF2) costs tens of milliseconds of CPU, so successful verifications are cached for
+    settings.BASIC_AUTH_CACHE_TTL seconds (0 disables the cache) with the User and its Customer, keyed by
+    get_credentials_key(). Failed ones are not cached, they always run the hasher.
+    """
+    ttl = getattr(settings, 'BASIC_AUTH_CACHE_TTL', 0)
+    if ttl:
+        key = get_credentials_key(username, password)
+        user_pk = credentials_cache.get(key)
+        cached = credentials_cache.get(('user', user_pk)) if user_pk is not None else None
+        if cached is not None and cached[0] == key:
+            return copy_user(cached[1])
+
+    user = authenticate(request=request, username=username, password=password)
+    if user is not None and ttl:
+        # Loaded now (the views need it), so a cache hit runs no query. Users who are not customers cache None.
+        getattr(user, 'customer', None)
+        # Stored under the user and only pointed to by the key, like cache_token(): the User/Customer signal
+        # handlers (customers.models) drop it with the user's entry, eg: when the password changes
+        credentials_cache.set(('user', user.pk), (key, copy_user(user)), ttl)
+        credentials_cache.set(key, user.pk, ttl)
+
+    return user
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """Basic authentication that caches successful credential verifications, see authenticate_basic()."""
+
+    def authenticate_credentials(self, userid: str, password: str, request=None) -> tuple:
+        user = authenticate_basic(request, userid, password)
+
+        if user is None:
+            raise AuthenticationFailed(_('Invalid username/password.'))
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, None)
+
+
+class CustomerTokenAuthentication(TokenAuthentication):
+    """Token authentication that loads the token, its User and the User's Customer in a single query.
+
+    The Customer is cached on request.user (user.customer) so the views do not have to look it up again.
+    Tokens are also cached across requests for settings.TOKEN_CACHE_TTL seconds (0 disables the cache),
+    a cache hit authenticates the request without any query.
+    """
+
+    def authenticate_credentials(self, key: str) -> tuple:
+        token = get_cached_token(key)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user__customer').get(key=key)
+            except model.DoesNotExist:
+                raise AuthenticationFailed(_('Invalid token.'))
+            cache_token(token)
+
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
+
+    def authenticate_header(self, request) -> str:
+        # The 401 challenge comes from the first authentication class: keep offering Basic to browsers
+        return f'{self.keyword}, Basic realm="{BasicAuthentication.www_authenticate_realm}"'
@@ -0,0 +1,58 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A bounded, thread-safe, process-local LRU cache whose entries expire after a TTL (seconds)."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Get the value stored for key, default if it is missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        """Store value for key for ttl seconds, evicting the least recently used entries if full."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Customers by User.id, see invoices.views.get_customer()
+customer_cache = TTLCache()
+
+# Tokens (with their User and Customer) by ('user', User.id) and their User.id by Token.key,
+# see customers.authentication.cache_token()
+token_cache = TTLCache(maxsize=10000)
+
+# (HMAC of their Basic credentials, User with its Customer) by ('user', User.id) and their User.id by the HMAC,
+# see customers.authentication.authenticate_basic()
+credentials_cache = TTLCache(maxsize=10000)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customers.cache import customer_cache
+from customers.models import Customer, get_full_name
+
+
+class Command(BaseCommand):
+    help = 'Fills in the denormalized Customer.name from the first and last name of the customer users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of customers updated per query.')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute the name of every customer, not only the ones without a name.')
+
+    def handle(self, *args, **options):
+        queryset = Customer.objects.select_related('user').order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(name__isnull=True)
+
+        updated = 0
+        last_pk = 0
+        while True:
+            customers = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not customers:
+                break
+            last_pk = customers[-1].pk
+
+            changed = []
+            for customer in customers:
+                name = get_full_name(customer.user)
+                if customer.name != name:
+                    customer.name = name
+                    changed.append(customer)
+
+            with transaction.atomic():
+                # bulk_update does not send the Customer post_save signal
+                Customer.objects.bulk_update(changed, ['name'])
+            for customer in changed:
+                customer_cache.delete(customer.user_id)
+            updated += len(changed)
+
+        self.stdout.write(f'Updated the name of {updated} customers')
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=301, null=True),
+        ),
+    ]
@@ -1,12 +1,19 @@
 import uuid
 
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from .cache import credentials_cache, customer_cache, token_cache
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
+
+
+def get_full_name(user: User) -> str:
+    return f'{user.first_name} {user.last_name}'
 
 
 class Customer(models.Model):
@@ -20,6 +27,15 @@ class Customer(models.Model):
         editable=False,
         unique=True
     )
+    # Denormalized User first and last name, so invoice and payment reads do not need the auth_user row.
+    # Kept in sync by the sync_customer_name User signal handler, NULL until backfilled (backfill_customer_names).
+    name = models.CharField(
+        max_length=301,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True
+    )
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
@@ -40,11 +56,77 @@ class Customer(models.Model):
 
     @property
     def full_name(self):
-        return f'{self.first_name} {self.last_name}'
+        if self.name is not None:
+            return self.name
+
+        return get_full_name(self.user)
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     """Create Auth token for Customer."""
     if created:
-        Token.objects.create(user=instance)
\ No newline at end of file
+        Token.objects.create(user=instance)
+
+
+def invalidate_user_credentials(user_pk: int):
+    """Drop the token and Basic credentials of a user from the process-local caches (both embed the User)."""
+    # The keys only point to the user's entry
+    for cache in (token_cache, credentials_cache):
+        cache.delete(('user', user_pk))
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_customer_cache(sender, instance, **kwargs):
+    """Drop the Customer from the process-local customer, token and credentials caches."""
+    customer_cache.delete(instance.user_id)
+    invalidate_user_credentials(instance.user_id)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token_cache(sender, instance, **kwargs):
+    """Drop a saved or deleted (eg: revoked, or its User deleted) Token from the process-local token cache."""
+    token_cache.delete(instance.key)
+    token_cache.delete(('user', instance.user_id))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_authentication_cache(sender, instance, created=False, update_fields=None, **kwargs):
+    """User post_save/post_delete signal handler that drops the user's cached token and credentials (eg: a new
+    password)."""
+    # New users have no cached token, logins only update last_login
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+
+    invalidate_user_credentials(instance.pk)
+
+
+@receiver(pre_save, sender=Customer)
+def set_customer_name(sender, instance, **kwargs):
+    """Customer pre_save signal handler that fills in the name of new (or not yet backfilled) customers."""
+    if instance.name is None:
+        instance.name = get_full_name(instance.user)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def sync_customer_name(sender, instance, created=False, update_fields=None, **kwargs):
+    """User post_save signal handler that keeps Customer.name in sync with the user's first and last name."""
+    if created or (update_fields is not None and not {'first_name', 'last_name'} & set(update_fields)):
+        return
+
+    name = get_full_name(instance)
+    modified = timezone.now()
+    updated = Customer.objects.filter(user=instance).exclude(name=name).update(name=name, modified=modified)
+    if updated:
+        # update() does not send the Customer post_save signal
+        customer_cache.delete(instance.pk)
+
+    # RelatedObjectDoesNotExist is an AttributeError, users who are not customers get None
+    if User.customer.is_cached(instance) and getattr(instance, 'customer', None) is not None:
+        instance.customer.name = name
+        if updated:
+            # Part of the invoice and payment validators (invoices.conditional)
+            instance.customer.modified = modified
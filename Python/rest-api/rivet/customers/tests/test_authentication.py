@@ -0,0 +1,206 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from django.contrib.auth.models import User
+from customers.authentication import CachedBasicAuthentication, CustomerTokenAuthentication, get_credentials_key
+from customers.cache import credentials_cache, token_cache
+from customers.models import Customer
+
+
+@override_settings(TOKEN_CACHE_TTL=60)
+class CustomerTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+        self.user = User.objects.create(username='customer', password='password', first_name='John', last_name='Doe')
+        self.customer = Customer.objects.create(user=self.user)
+        self.key = Token.objects.get(user=self.user).key
+        self.authentication = CustomerTokenAuthentication()
+
+    def authenticate(self) -> tuple:
+        return self.authentication.authenticate_credentials(self.key)
+
+    def test_cache_hit(self):
+        """Ensure a cached token authenticates without a query and every request gets its own objects."""
+        with self.assertNumQueries(1):
+            user, token = self.authenticate()
+
+        with self.assertNumQueries(0):
+            cached_user, cached_token = self.authenticate()
+            self.assertEqual(cached_user.customer, self.customer)
+            self.assertEqual(cached_user.customer.full_name, 'John Doe')
+
+        self.assertEqual(cached_user, user)
+        self.assertEqual(cached_token.key, self.key)
+        self.assertIs(cached_token.user, cached_user)
+        self.assertIs(cached_user.customer.user, cached_user)
+
+        # Changes made by a request stay in that request
+        cached_user.first_name = 'Changed'
+        cached_user.customer.name = 'Changed'
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertEqual(user.first_name, 'John')
+        self.assertEqual(user.customer.name, 'John Doe')
+
+    def test_users_not_customers(self):
+        user = User.objects.create(username='notcustomer', password='password')
+        self.key = Token.objects.get(user=user).key
+
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertFalse(hasattr(user, 'customer'))
+
+    def test_invalidation(self):
+        """Ensure saving or deleting the token, its User or its Customer drops it from the cache."""
+        self.authenticate()
+        self.user.last_name = 'Smith'
+        self.user.save()
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        self.assertEqual(user.customer.full_name, 'John Smith')
+
+        self.customer.save()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        # Logins do not invalidate it
+        self.user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+        self.user.is_active = True
+        self.user.save()
+        self.authenticate()
+        Token.objects.filter(key=self.key).get().delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_invalidation_evicted_entries(self):
+        """Ensure a token is dropped by its User's changes whichever of its cache entries was evicted."""
+        for key in (self.key, ('user', self.user.pk)):
+            self.authenticate()
+            token_cache.delete(key)
+
+            self.user.is_active = False
+            self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+            self.user.is_active = True
+            self.user.save()
+
+    def test_new_token(self):
+        """Ensure a replaced token is not accepted from the cache."""
+        self.authenticate()
+        old_key = self.key
+        Token.objects.filter(key=old_key).update(key=Token.generate_key())
+        self.key = Token.objects.get(user=self.user).key
+        self.authenticate()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(old_key)
+
+    @override_settings(TOKEN_CACHE_TTL=0)
+    def test_cache_disabled(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.authenticate()
+
+        self.assertEqual(len(token_cache), 0)
+
+
+@override_settings(BASIC_AUTH_CACHE_TTL=60)
+class CachedBasicAuthenticationTests(TestCase):
+    def setUp(self):
+        credentials_cache.clear()
+        self.addCleanup(credentials_cache.clear)
+
+        self.user = User.objects.create_user(username='customer', password='secret', first_name='John', last_name='Doe')
+        self.customer = Customer.objects.create(user=self.user)
+        self.authentication = CachedBasicAuthentication()
+
+    def authenticate(self, password: str = 'secret') -> tuple:
+        return self.authentication.authenticate_credentials('customer', password)
+
+    def test_cache_hit(self):
+        """Ensure verified credentials are cached (by HMAC, not in clear) with the User and its Customer."""
+        # user, customer
+        with self.assertNumQueries(2):
+            user, _ = self.authenticate()
+
+        with self.assertNumQueries(0):
+            cached_user, _ = self.authenticate()
+            self.assertEqual(cached_user.customer, self.customer)
+
+        self.assertEqual(cached_user, user)
+        self.assertIsNot(cached_user, user)
+        self.assertIsNotNone(credentials_cache.get(get_credentials_key('customer', 'secret')))
+        self.assertNotEqual(get_credentials_key('customer', 'secret'), get_credentials_key('customer', 'secret2'))
+
+    def test_invalid_credentials(self):
+        """Ensure failed verifications are not cached and do not match cached credentials."""
+        self.authenticate()
+
+        for _ in range(2):
+            with self.assertNumQueries(1), self.assertRaises(AuthenticationFailed):
+                self.authenticate('wrong')
+
+    def test_invalidation(self):
+        """Ensure changing the password or deactivating the user drops the cached credentials."""
+        self.authenticate()
+        self.user.set_password('new secret')
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+        self.authenticate('new secret')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate('new secret')
+
+        self.user.is_active = True
+        self.user.save()
+        self.authenticate('new secret')
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate('new secret')
+
+    def test_invalidation_evicted_entries(self):
+        """Ensure a new password drops the cached credentials whichever of their cache entries was evicted."""
+        evicted = (('secret', get_credentials_key('customer', 'secret')), ('new secret', ('user', self.user.pk)))
+        for password, key in evicted:
+            self.authenticate(password)
+            credentials_cache.delete(key)
+
+            self.user.set_password('new ' + password)
+            self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(password)
+
+    @override_settings(BASIC_AUTH_CACHE_TTL=0)
+    def test_cache_disabled(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.authenticate()
+
+        self.assertEqual(len(credentials_cache), 0)
+
+    def test_challenge(self):
+        """Ensure Token authentication comes first and the 401 challenge still offers Basic to browsers."""
+        response = self.client.get(reverse('invoice-list'), SERVER_NAME='localhost')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token, Basic realm="api"')
@@ -0,0 +1,40 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from customers.cache import TTLCache
+
+
+class TTLCacheTests(SimpleTestCase):
+    def test_get_set_delete(self):
+        cache = TTLCache()
+        cache.set('key', 'value', 60)
+
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertIsNone(cache.get('missing'))
+
+        cache.delete('key')
+        self.assertIsNone(cache.get('key'))
+
+    def test_expiry(self):
+        cache = TTLCache()
+        with mock.patch('customers.cache.time.monotonic', return_value=100):
+            cache.set('key', 'value', 10)
+            self.assertEqual(cache.get('key'), 'value')
+
+        with mock.patch('customers.cache.time.monotonic', return_value=110):
+            self.assertIsNone(cache.get('key'))
+            self.assertEqual(len(cache), 0)
+
+    def test_eviction(self):
+        """Ensure the least recently used entry is evicted once the cache is full."""
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        cache.get('a')
+        cache.set('c', 3, 60)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
@@ -1,5 +1,7 @@
+import os
 import uuid
 
+from django.core.management import call_command
 from django.test import TestCase
 
 from django.contrib.auth.models import User
@@ -32,6 +34,52 @@ class CustomerTestCase(TestCase):
         self.assertEqual(customer.last_name, 'Doe')
         self.assertEqual(customer.full_name, 'John Doe')
 
+    def test_customer_name_denormalized(self):
+        """Ensure Customer.name is set on create and follows the user's first and last name."""
+        user = User.objects.get(username='customer')
+        customer = Customer.objects.get(user=user)
+        self.assertEqual(customer.name, 'John Doe')
+
+        user.first_name = 'Jane'
+        user.save()
+        customer.refresh_from_db()
+        self.assertEqual(customer.name, 'Jane Doe')
+        self.assertEqual(customer.full_name, 'Jane Doe')
+
+        # The customer cached on the user is kept in sync too
+        user = User.objects.select_related('customer').get(username='customer')
+        user.last_name = 'Smith'
+        user.save(update_fields=['last_name'])
+        self.assertEqual(user.customer.name, 'Jane Smith')
+        self.assertEqual(Customer.objects.get(user=user).name, 'Jane Smith')
+
+        # Saving other fields does not touch the customer
+        with self.assertNumQueries(1):
+            user.save(update_fields=['email'])
+
+    def test_customer_name_fallback(self):
+        """Ensure customers that were not backfilled yet still get their name from the user."""
+        Customer.objects.update(name=None)
+        customer = Customer.objects.get(user__username='customer')
+
+        self.assertEqual(customer.full_name, 'John Doe')
+
+    def test_backfill_customer_names(self):
+        for i in range(5):
+            user = User.objects.create(username=f'backfill{i}', first_name='Back', last_name=f'Fill{i}')
+            Customer.objects.create(user=user)
+        Customer.objects.update(name=None)
+        Customer.objects.filter(user__username='backfill0').update(name='Stale Name')
+
+        call_command('backfill_customer_names', batch_size=2, stdout=open(os.devnull, 'w'))
+
+        self.assertFalse(Customer.objects.filter(name__isnull=True).exists())
+        self.assertEqual(Customer.objects.get(user__username='backfill1').name, 'Back Fill1')
+        self.assertEqual(Customer.objects.get(user__username='backfill0').name, 'Stale Name')
+
+        call_command('backfill_customer_names', all=True, stdout=open(os.devnull, 'w'))
+        self.assertEqual(Customer.objects.get(user__username='backfill0').name, 'Back Fill0')
+
     def test_user_not_customer(self):
         user_not_customer = User.objects.create(
             username='user_not_customer',
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Invoice, Payment
+from .models import CustomerAccountSummary, IdempotencyKey, Invoice, Payment, PaymentBatchJob
 
 
 @admin.register(Invoice)
@@ -9,3 +9,20 @@ class InvoiceAdmin(admin.ModelAdmin):
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('id', 'customer', 'invoice', 'payment_id', 'amount', 'modified', 'created')
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer', 'key', 'status_code', 'created')
+
+
+@admin.register(CustomerAccountSummary)
+class CustomerAccountSummaryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer', 'total_billed', 'open_balance', 'open_invoices', 'last_payment', 'modified')
+
+
+@admin.register(PaymentBatchJob)
+class PaymentBatchJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer', 'job_id', 'status', 'processed', 'total', 'created', 'finished')
+    list_filter = ('status',)
+    exclude = ('items',)
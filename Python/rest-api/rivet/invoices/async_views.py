@@ -0,0 +1,194 @@
+"""ASGI-native versions of the invoice and payment read endpoints.
+
+The views are plain Django async views built on the async ORM (aget, acount, async for), so under ASGI
+a worker process can serve many slow clients at once instead of parking each request in a thread. That only
+holds while every middleware is async capable: a sync only one (eg: the debug toolbar, left out by rivet.asgi)
+makes the handler run the whole chain, and these views, in a thread.
+They mirror the JSON of InvoiceListView, InvoiceDetailView, PaymentListView (GET) and PaymentDetailView,
+rows are encoded with invoices.encoders instead of the DRF serializers.
+"""
+import math
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import Http404, JsonResponse
+
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from customers.models import Customer
+from .encoders import INVOICE_ROW_FIELDS, PAYMENT_ROW_FIELDS, RowEncoder, customer_constants
+from .filters import filter_payments
+from .models import Invoice, Payment
+from .pagination import KeysetPagination
+
+
+def get_drf_request(request: 'HttpRequest') -> Request:
+    """Wrap the request with the configured authentication classes, like APIView.initialize_request()."""
+    return Request(
+        request, authenticators=[authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+
+
+def authenticate(drf_request: Request) -> User:
+    """Authenticate the request with its authentication classes, as APIView.perform_authentication does.
+
+    Raises NotAuthenticated for anonymous requests (the IsAuthenticated permission of the sync views).
+    """
+    user = drf_request.user
+    if not user or not user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+
+    return user
+
+
+async def get_request_customer(drf_request: Request) -> Customer:
+    """Authenticate the request and get the Customer of its user."""
+    user = await sync_to_async(authenticate)(drf_request)
+
+    if User.customer.is_cached(user):
+        # Loaded with the cached token or Basic credentials
+        customer = getattr(user, 'customer', None)
+    else:
+        customer = await Customer.objects.select_related('user').filter(user=user).afirst()
+
+    if customer is None:
+        raise exceptions.PermissionDenied(f"User '{user}' is not a customer.")
+
+    return customer
+
+
+def async_api_view(view):
+    """Authenticate the customer and turn API exceptions into JSON responses, like DRF does for the sync views."""
+    @functools.wraps(view)
+    async def wrapper(request: 'HttpRequest', *args, **kwargs) -> JsonResponse:
+        drf_request = get_drf_request(request)
+        try:
+            if request.method != 'GET':
+                raise exceptions.MethodNotAllowed(request.method)
+
+            customer = await get_request_customer(drf_request)
+            return await view(request, customer, *args, **kwargs)
+        except Http404:
+            exc = exceptions.NotFound()
+        except exceptions.APIException as e:
+            exc = e
+
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = JsonResponse(data, status=exc.status_code, safe=False)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            # APIView.handle_exception(): a 401 with the first authentication class' challenge, else a 403
+            authenticators = drf_request.authenticators
+            authenticate_header = authenticators[0].authenticate_header(drf_request) if authenticators else None
+            if authenticate_header:
+                response.status_code = 401
+                response['WWW-Authenticate'] = authenticate_header
+            else:
+                response.status_code = 403
+        return response
+
+    return wrapper
+
+
+async def encode_rows(queryset: 'QuerySet', encoder: RowEncoder, extra: tuple = ()) -> list:
+    """Fetch and encode the rows of a queryset, extra lookups are appended to each (unencoded) row."""
+    return [
+        (encoder.encode_dict(row[:len(encoder.lookups)]), row[len(encoder.lookups):])
+        async for row in queryset.values_list(*encoder.lookups, *extra)
+    ]
+
+
+async def paginate(request: 'HttpRequest', queryset: 'QuerySet', encoder: RowEncoder) -> dict:
+    """Page number (default) or keyset (?pagination=cursor) pagination, same response as the sync views."""
+    page_size = api_settings.PAGE_SIZE
+    url = request.build_absolute_uri()
+
+    if request.GET.get('pagination') == 'cursor' or request.GET.get('cursor'):
+        keyset = KeysetPagination()
+        queryset = queryset.order_by(*keyset.ordering)
+        encoded = request.GET.get(keyset.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(keyset.get_position_filter(keyset.decode_position(encoded)))
+
+        ordering_fields = tuple(field.lstrip('-') for field in keyset.ordering)
+        rows = await encode_rows(queryset[:page_size + 1], encoder, extra=ordering_fields)
+
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_url = replace_query_param(url, keyset.cursor_query_param, keyset.encode_cursor(rows[-1][1]))
+
+        return {'next': next_url, 'results': [row for row, _ in rows]}
+
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        raise exceptions.NotFound('Invalid page.')
+
+    count = await queryset.acount()
+    num_pages = max(math.ceil(count / page_size), 1)
+    if not 1 <= page <= num_pages:
+        raise exceptions.NotFound('Invalid page.')
+
+    offset = (page - 1) * page_size
+    rows = await encode_rows(queryset[offset:offset + page_size], encoder)
+
+    next_url = replace_query_param(url, 'page', page + 1) if page < num_pages else None
+    previous_url = None
+    if page == 2:
+        previous_url = remove_query_param(url, 'page')
+    elif page > 2:
+        previous_url = replace_query_param(url, 'page', page - 1)
+
+    return {
+        'count': count,
+        'next': next_url,
+        'previous': previous_url,
+        'results': [row for row, _ in rows],
+    }
+
+
+@async_api_view
+async def invoice_list(request: 'HttpRequest', customer: Customer) -> JsonResponse:
+    """GET a list of invoices for a customer, see InvoiceListView."""
+    encoder = RowEncoder(INVOICE_ROW_FIELDS, constants=customer_constants(customer))
+    queryset = Invoice.objects.filter(customer=customer)
+
+    return JsonResponse(await paginate(request, queryset, encoder))
+
+
+@async_api_view
+async def invoice_detail(request: 'HttpRequest', customer: Customer, invoice_id: 'UUID') -> JsonResponse:
+    """GET a specific customer invoice, see InvoiceDetailView."""
+    encoder = RowEncoder(INVOICE_ROW_FIELDS, constants=customer_constants(customer))
+    queryset = Invoice.objects.filter(customer=customer, invoice_id=invoice_id)
+
+    rows = await encode_rows(queryset, encoder)
+    if not rows:
+        raise Http404
+
+    return JsonResponse(rows[0][0])
+
+
+@async_api_view
+async def payment_list(request: 'HttpRequest', customer: Customer) -> JsonResponse:
+    """GET a list of payments made by a customer (amount, created and invoice filters), see PaymentListView."""
+    encoder = RowEncoder(PAYMENT_ROW_FIELDS, constants=customer_constants(customer))
+    queryset = await sync_to_async(filter_payments)(Payment.objects.filter(customer=customer), request.GET)
+
+    return JsonResponse(await paginate(request, queryset, encoder))
+
+
+@async_api_view
+async def payment_detail(request: 'HttpRequest', customer: Customer, payment_id: 'UUID') -> JsonResponse:
+    """GET the payments sharing a payment_id, see PaymentDetailView."""
+    encoder = RowEncoder(PAYMENT_ROW_FIELDS, constants=customer_constants(customer))
+    queryset = Payment.objects.filter(customer=customer, payment_id=payment_id)
+
+    if not await queryset.aexists():
+        raise Http404
+
+    return JsonResponse(await paginate(request, queryset, encoder))
@@ -0,0 +1,704 @@
+"""Load-testing benchmark harness for the rivet REST API.
+
+seed() populates the database with benchmark customers, invoices and payments and run() drives the
+API endpoints in-process with the DRF test client, measuring latency percentiles, queries per request
+and rows per second for every scenario in SCENARIOS.
+
+run_serializers() is a micro-benchmark of the list serializers: the ModelSerializers against the
+.values() RowSerializers used by the list endpoints.
+
+run_concurrency() compares the sync (DRF) read endpoints with their async counterparts (invoices.async_views)
+when requests are sent concurrently through the ASGI handler.
+
+run_connections() measures the connection setup persistent connections (CONN_MAX_AGE) save every request.
+
+run_auth() compares the CPU cost of Basic and Token authentication, with and without their caches.
+
+run_sqlite_stress() compares the read/write throughput of concurrent connections to a copy of the SQLite database
+with SQLite's default settings and with settings.SQLITE_PRAGMAS.
+
+run_hot_invoice() measures the throughput of many clients POSTing payments to the same invoice at once.
+
+See the seed_benchmark and run_benchmark management commands.
+"""
+import math
+import time
+import uuid
+import random
+import sqlite3
+import base64
+import asyncio
+import decimal
+import tempfile
+import threading
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from rivet.db import set_pragmas
+
+from customers.cache import credentials_cache, token_cache
+from customers.models import Customer, get_full_name
+from . import summary
+from .models import Invoice, Payment
+from .serializers import InvoiceRowSerializer, InvoiceSerializer, PaymentRowSerializer, PaymentSerializer
+
+
+USERNAME_PREFIX = 'benchmark'
+PASSWORD = 'password'
+BATCH_SIZE = 1000
+
+
+def seed(customers: int, invoices: int, payments: int, seed: int = 0) -> dict:
+    """Create benchmark customers, each with invoices and payments (two invoices per payment_id).
+
+    customers - number of customers.
+    invoices - number of invoices per customer.
+    payments - number of invoices per customer with a payment applied to them.
+    Rows are written with bulk_create, so balances are computed here instead of by the model signals.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+
+    start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+    usernames = [f'{USERNAME_PREFIX}{i}' for i in range(start, start + customers)]
+    User.objects.bulk_create(
+        [
+            User(username=username, password=password, first_name='Benchmark', last_name=username)
+            for username in usernames
+        ],
+        batch_size=BATCH_SIZE
+    )
+    users = list(User.objects.filter(username__in=usernames).order_by('id'))
+
+    # bulk_create does not send the post_save signal that creates the auth tokens
+    Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users], batch_size=BATCH_SIZE)
+    Customer.objects.bulk_create(
+        [Customer(user=user, name=get_full_name(user)) for user in users],
+        batch_size=BATCH_SIZE
+    )
+
+    counts = {'customers': len(users), 'invoices': 0, 'payments': 0}
+    for customer in Customer.objects.filter(user__in=users):
+        new_invoices = []
+        new_payments = []
+        payment_id = None
+        for i in range(invoices):
+            amount = decimal.Decimal(rng.randint(10000, 1000000)) / 100
+            invoice = Invoice(customer=customer, amount=amount, balance=amount)
+            new_invoices.append(invoice)
+
+            if i < payments:
+                if i % 2 == 0:
+                    payment_id = uuid.uuid4()
+                paid = (amount / 2).quantize(decimal.Decimal('0.01'))
+                invoice.balance = amount - paid
+                new_payments.append(Payment(customer=customer, invoice=invoice, payment_id=payment_id, amount=paid))
+
+        Invoice.objects.bulk_create(new_invoices, batch_size=BATCH_SIZE)
+        Payment.objects.bulk_create(new_payments, batch_size=BATCH_SIZE)
+        counts['invoices'] += len(new_invoices)
+        counts['payments'] += len(new_payments)
+
+    # bulk_create does not maintain the account summaries either
+    summary.rebuild(list(Customer.objects.filter(user__in=users).values_list('pk', flat=True)))
+
+    return counts
+
+
+def percentile(values: list, percent: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class Context:
+    """The benchmark customers and the ids the scenarios need to build their requests."""
+
+    def __init__(self, max_customers: int = 10):
+        self.customers = []
+        queryset = Customer.objects.filter(
+            user__username__startswith=USERNAME_PREFIX
+        ).select_related('user__auth_token').order_by('id')[:max_customers]
+
+        for customer in queryset:
+            invoices = Invoice.objects.filter(customer=customer)
+            payments = Payment.objects.filter(customer=customer)
+            self.customers.append({
+                'customer': customer,
+                'token': customer.user.auth_token.key,
+                'invoice_ids': [str(invoice_id) for invoice_id in invoices.values_list('invoice_id', flat=True)[:100]],
+                'paid_invoice_ids': [
+                    str(invoice_id) for invoice_id in payments.values_list('invoice__invoice_id', flat=True)[:100]
+                ],
+                'payment_ids': [str(payment_id) for payment_id in payments.values_list('payment_id', flat=True)[:100]],
+            })
+
+        if not self.customers:
+            raise ValueError('No benchmark customers found, seed the database first.')
+
+    def get(self, i: int) -> dict:
+        """Get the customer used for the i-th request of a scenario."""
+        return self.customers[i % len(self.customers)]
+
+
+def count_rows(response) -> int:
+    """Number of invoices/payments returned by a response."""
+    if response.streaming:
+        return b''.join(response.streaming_content).count(b'\n')
+
+    data = response.data
+    if isinstance(data, dict) and 'results' in data:
+        return len(data['results'])
+    if isinstance(data, list):
+        return len(data)
+    return 1
+
+
+def get_request(name: str, get_url):
+    """Build a GET scenario, get_url(customer, i) returns the URL of the i-th request."""
+    def request(client: APIClient, customer: dict, i: int):
+        return client.get(get_url(customer, i), format='json')
+
+    return name, request
+
+
+def post_payments(batch_size: int):
+    """Build a POST /api/payments/ scenario paying 0.01 to batch_size invoices per request."""
+    def request(client: APIClient, customer: dict, i: int):
+        invoice_ids = customer['invoice_ids'][:batch_size]
+        payload = [{'invoice': invoice_id, 'amount': '0.01'} for invoice_id in invoice_ids]
+        return client.post(reverse('payment-list'), payload, format='json')
+
+    return f'payment-list-post-{batch_size}', request
+
+
+def pick(ids: list, i: int) -> str:
+    return ids[i % len(ids)]
+
+
+SCENARIOS = dict([
+    get_request('invoice-list', lambda c, i: reverse('invoice-list')),
+    get_request('invoice-list-page-10', lambda c, i: reverse('invoice-list') + '?page=10'),
+    get_request('invoice-list-cursor', lambda c, i: reverse('invoice-list') + '?pagination=cursor'),
+    get_request('invoice-detail', lambda c, i: reverse('invoice-detail', args=[pick(c['invoice_ids'], i)])),
+    get_request('invoice-export', lambda c, i: reverse('invoice-export')),
+    get_request('payment-list', lambda c, i: reverse('payment-list')),
+    get_request('payment-list-page-10', lambda c, i: reverse('payment-list') + '?page=10'),
+    get_request('payment-list-cursor', lambda c, i: reverse('payment-list') + '?pagination=cursor'),
+    get_request(
+        'payment-list-invoice',
+        lambda c, i: reverse('payment-list') + f'?invoice={pick(c["paid_invoice_ids"], i)}'
+    ),
+    get_request('payment-list-amount', lambda c, i: reverse('payment-list') + '?amount_gte=100&amount_lte=1000'),
+    get_request('payment-detail', lambda c, i: reverse('payment-detail', args=[pick(c['payment_ids'], i)])),
+    get_request('payment-export', lambda c, i: reverse('payment-export')),
+    get_request('payment-group-list', lambda c, i: reverse('payment-group-list')),
+    get_request('account-summary', lambda c, i: reverse('account-summary')),
+    post_payments(1),
+    post_payments(100),
+])
+
+
+def run_scenario(request, context: Context, requests: int) -> dict:
+    """Send requests requests and return their latency/queries/rows statistics."""
+    client = APIClient(SERVER_NAME='localhost', REMOTE_ADDR='10.0.0.1')
+    latencies = []
+    queries = rows = 0
+
+    for i in range(requests):
+        customer = context.get(i)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {customer["token"]}')
+
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = request(client, customer, i)
+            rows += count_rows(response)
+            latencies.append(time.perf_counter() - start)
+
+        if response.status_code >= 400:
+            raise RuntimeError(f'Request failed with status {response.status_code}: {response.content[:200]}')
+        queries += len(captured)
+
+    total = sum(latencies)
+    return {
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(total / requests * 1000, 3),
+        'queries_per_request': round(queries / requests, 2),
+        'rows_per_second': round(rows / total, 1) if total else 0,
+    }
+
+
+def run(requests: int = 100, scenarios: list = None, max_customers: int = 10) -> dict:
+    """Run the benchmark scenarios (all of them by default) and return their results by name."""
+    context = Context(max_customers=max_customers)
+    names = scenarios or list(SCENARIOS)
+
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+    return {name: run_scenario(SCENARIOS[name], context, requests) for name in names}
+
+
+# Sync/async pairs of read endpoints for run_concurrency(), name: get_url(customer, i)
+CONCURRENCY_SCENARIOS = {
+    'invoice-list': lambda c, i: reverse('invoice-list'),
+    'async-invoice-list': lambda c, i: reverse('async-invoice-list'),
+    'invoice-detail': lambda c, i: reverse('invoice-detail', args=[pick(c['invoice_ids'], i)]),
+    'async-invoice-detail': lambda c, i: reverse('async-invoice-detail', args=[pick(c['invoice_ids'], i)]),
+    'payment-list': lambda c, i: reverse('payment-list'),
+    'async-payment-list': lambda c, i: reverse('async-payment-list'),
+    'payment-detail': lambda c, i: reverse('payment-detail', args=[pick(c['payment_ids'], i)]),
+    'async-payment-detail': lambda c, i: reverse('async-payment-detail', args=[pick(c['payment_ids'], i)]),
+}
+
+
+async def run_concurrent_scenario(get_url, context: Context, requests: int, concurrency: int) -> dict:
+    """Send requests requests through the ASGI handler, concurrency of them at a time."""
+    # The client address keeps the debug toolbar (INTERNAL_IPS) out of the way
+    client = AsyncClient(client=('10.0.0.1', 0))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def send(i: int):
+        customer = context.get(i)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(
+                get_url(customer, i), authorization=f'Token {customer["token"]}', accept='application/json'
+            )
+            latencies.append(time.perf_counter() - start)
+
+        if response.status_code >= 400:
+            raise RuntimeError(f'Request failed with status {response.status_code}: {response.content[:200]}')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(requests)))
+    total = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'requests_per_second': round(requests / total, 1) if total else 0,
+    }
+
+
+def get_async_middleware() -> list:
+    """settings.MIDDLEWARE without the sync only middleware (eg: the debug toolbar under runserver).
+
+    A single sync only middleware makes the ASGI handler adapt the whole chain, and run every view in a thread.
+    """
+    return [path for path in settings.MIDDLEWARE if getattr(import_string(path), 'async_capable', False)]
+
+
+def run_concurrency(requests: int = 100, concurrency: int = 10, scenarios: list = None, max_customers: int = 10) -> dict:
+    """Run the sync and async read endpoints (all of CONCURRENCY_SCENARIOS by default) under concurrent load.
+
+    Sync views are run by the ASGI handler in a single thread (sync_to_async(thread_sensitive=True)),
+    async views run on the event loop and only hand their queries (and authentication) to that thread.
+    The requests go through the async capable middleware only (get_async_middleware()), like rivet.asgi.
+    """
+    context = Context(max_customers=max_customers)
+    names = scenarios or list(CONCURRENCY_SCENARIOS)
+
+    unknown = set(names) - set(CONCURRENCY_SCENARIOS)
+    if unknown:
+        raise ValueError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+    # async_to_sync() runs the thread sensitive code (the ORM) in this thread, on this thread's connection
+    run_scenario = async_to_sync(run_concurrent_scenario)
+    # AsyncClient sends Host: testserver
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], MIDDLEWARE=get_async_middleware()):
+        return {
+            name: run_scenario(CONCURRENCY_SCENARIOS[name], context, requests, concurrency) for name in names
+        }
+
+
+def serialize_instances(serializer_class: type, queryset: 'QuerySet'):
+    """Build a serializer of model instances, run_serializers() times the serializers only."""
+    instances = list(queryset)
+    return lambda customer: serializer_class(instances, many=True)
+
+
+def serialize_rows(serializer_class: type, queryset: 'QuerySet'):
+    rows = list(queryset.values('id', *serializer_class.get_lookups()))
+    return lambda customer: serializer_class(rows, many=True, customer=customer)
+
+
+# name: (serializer factory, queryset of a customer's rows)
+SERIALIZER_SCENARIOS = {
+    'invoice-serializer': (
+        lambda queryset: serialize_instances(InvoiceSerializer, queryset.select_related('customer')),
+        lambda customer: Invoice.objects.filter(customer=customer),
+    ),
+    'invoice-row-serializer': (
+        lambda queryset: serialize_rows(InvoiceRowSerializer, queryset),
+        lambda customer: Invoice.objects.filter(customer=customer),
+    ),
+    'payment-serializer': (
+        lambda queryset: serialize_instances(PaymentSerializer, queryset.select_related('customer', 'invoice')),
+        lambda customer: Payment.objects.filter(customer=customer),
+    ),
+    'payment-row-serializer': (
+        lambda queryset: serialize_rows(PaymentRowSerializer, queryset),
+        lambda customer: Payment.objects.filter(customer=customer),
+    ),
+}
+
+
+def run_serializers(rows: int = 100, repeat: int = 50) -> dict:
+    """Time serializing and rendering (JSON) pages of rows already fetched from the database, repeat times."""
+    customer = Context(max_customers=1).get(0)['customer']
+    renderer = JSONRenderer()
+
+    results = {}
+    for name, (get_serializer, get_queryset) in SERIALIZER_SCENARIOS.items():
+        serializer = get_serializer(get_queryset(customer)[:rows])
+        count = len(serializer(customer).data)
+
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            renderer.render(serializer(customer).data)
+            latencies.append(time.perf_counter() - start)
+
+        total = sum(latencies)
+        results[name] = {
+            'rows': count,
+            'repeat': repeat,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'rows_per_second': round(count * repeat / total, 1) if total else 0,
+        }
+
+    return results
+
+
+# Cheap requests, where opening a connection is a large part of the latency
+CONNECTION_SCENARIOS = ['invoice-detail', 'payment-detail', 'account-summary', 'invoice-list']
+
+
+def run_connection_scenario(request, context: Context, requests: int, persistent: bool) -> list:
+    """Send requests requests on the current connection or, like CONN_MAX_AGE = 0, each on a new connection."""
+    client = APIClient(SERVER_NAME='localhost', REMOTE_ADDR='10.0.0.1')
+    original = connections[DEFAULT_DB_ALIAS]
+    latencies = []
+
+    try:
+        for i in range(requests):
+            customer = context.get(i)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {customer["token"]}')
+
+            start = time.perf_counter()
+            if not persistent:
+                # Connect (and run the connection_created hooks, eg: SQLITE_PRAGMAS) on the request's first query
+                connections[DEFAULT_DB_ALIAS] = connections.create_connection(DEFAULT_DB_ALIAS)
+            response = request(client, customer, i)
+            if not persistent:
+                connections[DEFAULT_DB_ALIAS].close()
+            latencies.append(time.perf_counter() - start)
+
+            if response.status_code >= 400:
+                raise RuntimeError(f'Request failed with status {response.status_code}: {response.content[:200]}')
+    finally:
+        connections[DEFAULT_DB_ALIAS] = original
+
+    return latencies
+
+
+def run_connections(requests: int = 100, scenarios: list = None, max_customers: int = 10) -> dict:
+    """Compare a new connection per request (CONN_MAX_AGE = 0) with a persistent connection (CONN_MAX_AGE > 0).
+
+    saved_ms_per_request is the mean connection setup (connect, session setup, SQLite PRAGMAs) a persistent
+    connection saves every request. The test database must be shared by connections (eg: committed data).
+    """
+    context = Context(max_customers=max_customers)
+    names = scenarios or CONNECTION_SCENARIOS
+
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+    results = {}
+    for name in names:
+        new = run_connection_scenario(SCENARIOS[name], context, requests, persistent=False)
+        persistent = run_connection_scenario(SCENARIOS[name], context, requests, persistent=True)
+        results[name] = {
+            'requests': requests,
+            'new_p50_ms': round(percentile(new, 50) * 1000, 3),
+            'new_mean_ms': round(sum(new) / requests * 1000, 3),
+            'persistent_p50_ms': round(percentile(persistent, 50) * 1000, 3),
+            'persistent_mean_ms': round(sum(persistent) / requests * 1000, 3),
+            'saved_ms_per_request': round((sum(new) - sum(persistent)) / requests * 1000, 3),
+        }
+
+    return results
+
+
+# What a connection gets without SQLITE_PRAGMAS: a rollback journal, fsync on every commit and Django's 5 s timeout
+SQLITE_DEFAULT_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full', 'busy_timeout': 5000}
+
+# A payment: the invoice balance and the account summary, updated in one transaction
+STRESS_WRITE = [
+    'UPDATE invoices_invoice SET balance = balance - 0.01 WHERE id = ?',
+    'UPDATE invoices_customeraccountsummary SET open_balance = open_balance - 0.01 WHERE customer_id = ?',
+]
+# A page of the invoice list
+STRESS_READ = [
+    'SELECT COUNT(*) FROM invoices_invoice WHERE customer_id = ?',
+    'SELECT id, invoice_id, amount, balance, created, modified FROM invoices_invoice '
+    'WHERE customer_id = ? ORDER BY id DESC LIMIT 10',
+]
+
+
+def stress_read(sqlite_connection: sqlite3.Connection, invoice: tuple):
+    for sql in STRESS_READ:
+        sqlite_connection.execute(sql, [invoice[1]]).fetchall()
+
+
+def stress_write(sqlite_connection: sqlite3.Connection, invoice: tuple):
+    sqlite_connection.execute('BEGIN IMMEDIATE')
+    try:
+        for sql, param in zip(STRESS_WRITE, invoice):
+            sqlite_connection.execute(sql, [param])
+    except sqlite3.Error:
+        sqlite_connection.execute('ROLLBACK')
+        raise
+    sqlite_connection.execute('COMMIT')
+
+
+def run_stress_profile(path: str, pragmas: dict, readers: int, writers: int, duration: float) -> dict:
+    """Run readers + writers threads, each on its own connection, on the database file for duration seconds."""
+    with sqlite3.connect(path, isolation_level=None) as sqlite_connection:
+        # The journal mode is stored in the database file, set it once (changing it needs the only connection)
+        sqlite_connection.execute(f'PRAGMA journal_mode = {pragmas.get("journal_mode", "delete")}')
+        invoices = sqlite_connection.execute('SELECT id, customer_id FROM invoices_invoice LIMIT 1000').fetchall()
+    sqlite_connection.close()
+
+    if not invoices:
+        raise ValueError('No invoices found, seed the database first.')
+
+    connection_pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+    stop = threading.Event()
+    latencies = {stress_read: [], stress_write: []}
+    errors = []
+
+    def work(operation, seed: int):
+        sqlite_connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        set_pragmas(sqlite_connection, connection_pragmas)
+        rng = random.Random(seed)
+        done = []
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    operation(sqlite_connection, rng.choice(invoices))
+                except sqlite3.OperationalError:
+                    # database is locked: the busy timeout ran out
+                    errors.append(operation)
+                else:
+                    done.append(time.perf_counter() - start)
+        finally:
+            sqlite_connection.close()
+            latencies[operation].extend(done)
+
+    threads = [threading.Thread(target=work, args=(stress_read, i)) for i in range(readers)]
+    threads += [threading.Thread(target=work, args=(stress_write, readers + i)) for i in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    reads, writes = latencies[stress_read], latencies[stress_write]
+    return {
+        'readers': readers,
+        'writers': writers,
+        'reads_per_second': round(len(reads) / elapsed, 1),
+        'writes_per_second': round(len(writes) / elapsed, 1),
+        'read_p99_ms': round(percentile(reads, 99) * 1000, 3) if reads else None,
+        'write_p99_ms': round(percentile(writes, 99) * 1000, 3) if writes else None,
+        'errors': len(errors),
+    }
+
+
+def run_sqlite_stress(readers: int = 4, writers: int = 2, duration: float = 5.0) -> dict:
+    """Stress copies of the (SQLite) database with SQLite's default settings and with settings.SQLITE_PRAGMAS.
+
+    The threads use sqlite3 directly, each profile runs on its own copy so the database itself is left untouched.
+    """
+    if connection.vendor != 'sqlite':
+        raise ValueError('The stress test needs an SQLite database.')
+
+    profiles = {'default': SQLITE_DEFAULT_PRAGMAS, 'sqlite-pragmas': settings.SQLITE_PRAGMAS}
+    connection.ensure_connection()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, pragmas in profiles.items():
+            path = f'{directory}/{name}.sqlite3'
+            copy = sqlite3.connect(path)
+            connection.connection.backup(copy)
+            copy.close()
+
+            results[name] = run_stress_profile(path, pragmas, readers, writers, duration)
+
+    return results
+
+
+def post_hot_payments(token: str, invoice_id: str, payments: int, results: dict):
+    """POST payments payments of 1.00 to an invoice one at a time (api/payments/), on the thread's connection.
+
+    A 201 is an applied payment, a 400 one the balance could not cover. Anything else, including a
+    'database is locked' OperationalError, is an error: there are no retries.
+    """
+    client = APIClient(SERVER_NAME='localhost', REMOTE_ADDR='10.0.0.1')
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+    url = reverse('payment-list')
+    applied = rejected = errors = 0
+    try:
+        for _ in range(payments):
+            try:
+                response = client.post(url, [{'invoice': invoice_id, 'amount': '1.00'}], format='json')
+            except OperationalError:
+                errors += 1
+                continue
+
+            if response.status_code == 201:
+                applied += 1
+            elif response.status_code == 400:
+                rejected += 1
+            else:
+                errors += 1
+    finally:
+        connection.close()
+
+    with results['lock']:
+        results['applied'] += applied
+        results['rejected'] += rejected
+        results['errors'] += errors
+
+
+def run_hot_invoice(customer: Customer, writers: int = 8, payments: int = 10, balance: int = None) -> dict:
+    """POST payments payments of 1.00 from each of writers threads (each on its own connection) to a new invoice.
+
+    The invoice balance is balance (default: enough for every payment), the payments it cannot cover are rejected.
+    errors counts the requests that failed (eg: 'database is locked'), consistent is False if the invoice balance
+    does not match the payments applied.
+    """
+    total = writers * payments
+    balance = total if balance is None else balance
+    invoice = Invoice.objects.create(customer=customer, amount=max(balance, 1), balance=balance)
+    token = Token.objects.get_or_create(user=customer.user)[0].key
+
+    results = {'lock': threading.Lock(), 'applied': 0, 'rejected': 0, 'errors': 0}
+    threads = [
+        threading.Thread(target=post_hot_payments, args=(token, str(invoice.invoice_id), payments, results))
+        for _ in range(writers)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    del results['lock']
+
+    invoice.refresh_from_db()
+    return {
+        'writers': writers,
+        'payments': total,
+        **results,
+        'elapsed_s': round(elapsed, 3),
+        'payments_per_second': round(results['applied'] / elapsed, 1) if elapsed else 0,
+        'consistent': invoice.balance == balance - results['applied'],
+        'invoice_id': str(invoice.invoice_id),
+    }
+
+
+def basic_credentials(customer: dict) -> str:
+    credentials = f'{customer["customer"].user.username}:{PASSWORD}'.encode('utf-8')
+    return 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+
+def token_credentials(customer: dict) -> str:
+    return f'Token {customer["token"]}'
+
+
+# Authorization header of a benchmark customer and the settings enabling/disabling the authentication caches
+AUTH_SCENARIOS = {
+    'basic': (basic_credentials, {'BASIC_AUTH_CACHE_TTL': 0}),
+    'basic-cached': (basic_credentials, {'BASIC_AUTH_CACHE_TTL': 60}),
+    'token': (token_credentials, {'TOKEN_CACHE_TTL': 0}),
+    'token-cached': (token_credentials, {'TOKEN_CACHE_TTL': 60}),
+}
+
+
+def run_auth(requests: int = 100, max_customers: int = 10) -> dict:
+    """Send the same cheap request (invoice-detail) authenticated each way, one at a time.
+
+    requests_per_cpu_second (requests / CPU time of the process) is the throughput of a single core:
+    the Basic password hasher (PBKDF2) is CPU bound and its cost does not overlap with other requests.
+    """
+    context = Context(max_customers=max_customers)
+    client = APIClient(SERVER_NAME='localhost', REMOTE_ADDR='10.0.0.1')
+
+    results = {}
+    for name, (get_credentials, overrides) in AUTH_SCENARIOS.items():
+        credentials_cache.clear()
+        token_cache.clear()
+        latencies = []
+        queries = 0
+
+        with override_settings(**overrides):
+            cpu_start = time.process_time()
+            for i in range(requests):
+                customer = context.get(i)
+                client.credentials(HTTP_AUTHORIZATION=get_credentials(customer))
+                url = reverse('invoice-detail', args=[pick(customer['invoice_ids'], i)])
+
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.get(url, format='json')
+                    latencies.append(time.perf_counter() - start)
+
+                if response.status_code >= 400:
+                    raise RuntimeError(f'Request failed with status {response.status_code}: {response.content[:200]}')
+                queries += len(captured)
+            cpu = time.process_time() - cpu_start
+
+        total = sum(latencies)
+        results[name] = {
+            'requests': requests,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'queries_per_request': round(queries / requests, 2),
+            'requests_per_second': round(requests / total, 1) if total else 0,
+            'requests_per_cpu_second': round(requests / cpu, 1) if cpu else 0,
+        }
+
+    credentials_cache.clear()
+    token_cache.clear()
+    return results
@@ -0,0 +1,92 @@
+"""Read-through cache of serialized customer invoice list pages.
+
+Pages are stored with their ETag/Last-Modified validators under a per-customer version number which is bumped
+whenever one of the customer's invoices changes, so stale pages are not served: they are simply not looked up
+anymore and expire.
+
+The version keys live in the INVOICE_LIST_CACHE cache, so it must be shared by every process serving the API (eg:
+Redis or Memcached). The default local memory cache is per process: a change only bumps the version in the process
+making it, other processes serve their stale pages for up to INVOICE_LIST_CACHE_TIMEOUT seconds. It is only fine for a
+single process (eg: runserver), see CACHE_BACKEND in the settings.
+"""
+import time
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache() -> 'BaseCache':
+    return caches[getattr(settings, 'INVOICE_LIST_CACHE', 'default')]
+
+
+def version_key(customer_pk: int) -> str:
+    return f'invoices:list:version:{customer_pk}'
+
+
+def get_version(customer_pk: int) -> int:
+    """Get the current version of a customer's invoice list pages."""
+    cache = get_cache()
+    key = version_key(customer_pk)
+    version = cache.get(key)
+    if version is None:
+        # A (new or evicted) version starts from the current time, so it is always greater
+        # than any version used before and pages cached under old versions cannot be reached.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(customer_pk: int):
+    cache = get_cache()
+    key = version_key(customer_pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def invalidate(customer_pk: int):
+    """Invalidate a customer's invoice list pages, now and when the current transaction commits.
+
+    Bumping again on commit makes sure a page read from the database before the changes were
+    committed is not cached under the new version.
+    """
+    bump_version(customer_pk)
+    transaction.on_commit(lambda: bump_version(customer_pk))
+
+
+def page_key(customer_pk: int, request: 'Request') -> str:
+    """Get the cache key of the page requested by request (path, query params and media type)."""
+    media_type = getattr(request, 'accepted_media_type', '')
+    digest = hashlib.md5(f'{request.build_absolute_uri()}:{media_type}'.encode('utf-8')).hexdigest()
+    return f'invoices:list:{customer_pk}:{get_version(customer_pk)}:{digest}'
+
+
+def get_page(key: str):
+    """Get a cached page, None on a cache miss."""
+    data = get_cache().get(key)
+    with _stats_lock:
+        _stats['hits' if data is not None else 'misses'] += 1
+    return data
+
+
+def set_page(key: str, data):
+    get_cache().set(key, data, timeout=getattr(settings, 'INVOICE_LIST_CACHE_TIMEOUT', 60))
+
+
+def stats() -> dict:
+    """Get this process' invoice list cache hit and miss counters."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
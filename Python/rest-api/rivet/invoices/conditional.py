@@ -0,0 +1,65 @@
+import hashlib
+import functools
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def get_validators(queryset: 'QuerySet', request: 'Request', customer: 'Customer' = None) -> tuple:
+    """Get the (ETag, Last-Modified timestamp) validators of the rows of a queryset.
+
+    Both come from a single aggregate query: max(modified) and the row count (so deleted rows change the ETag).
+    The ETag also depends on the user, the full path (eg: the page) and the media type of the response, and on the
+    name of the customer rendered in the rows (whose Customer.modified also moves Last-Modified).
+    """
+    stats = queryset.order_by().aggregate(last_modified=Max('modified'), count=Count('pk'))
+    last_modified = stats['last_modified']
+    name = ''
+    if customer is not None:
+        name = customer.full_name
+        if customer.modified is not None:
+            last_modified = max(last_modified, customer.modified) if last_modified else customer.modified
+
+    media_type = getattr(request, 'accepted_media_type', '')
+    data = f'{request.user.pk}:{request.get_full_path()}:{media_type}:{stats["count"]}:{last_modified}:{name}'
+    etag = '"%s"' % hashlib.md5(data.encode('utf-8')).hexdigest()
+
+    return etag, int(last_modified.timestamp()) if last_modified else None
+
+
+def conditional_response(request: 'Request', validators: tuple, get_response) -> 'Response':
+    """A 304 if the request's If-None-Match/If-Modified-Since match the (ETag, Last-Modified) validators,
+    else get_response(). Successful responses carry the ETag and Last-Modified headers.
+    """
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = get_response()
+
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+
+    return response
+
+
+class ConditionalGetMixin:
+    """Answer GET requests with If-None-Match/If-Modified-Since with a 304 when nothing changed.
+
+    The validators are computed from get_validator_queryset() before anything is serialized, so a 304
+    costs one aggregate query. They are kept in self.validators, eg: to be cached with the response.
+    """
+
+    def get_validator_queryset(self) -> 'QuerySet':
+        """The rows the response is built from (ignoring pagination)."""
+        return self.filter_queryset(self.get_queryset())
+
+    def get(self, request: 'Request', *args, **kwargs) -> 'Response':
+        queryset = self.get_validator_queryset()
+        # Loaded on the user by get_queryset() (invoices.views.get_customer())
+        customer = getattr(request.user, 'customer', None)
+        self.validators = get_validators(queryset, request, customer)
+
+        return conditional_response(request, self.validators, functools.partial(super().get, request, *args, **kwargs))
@@ -0,0 +1,80 @@
+import decimal
+
+from django.utils import timezone
+
+
+CENT = decimal.Decimal('0.01')
+
+
+def encode_uuid(value) -> str:
+    return str(value)
+
+
+def encode_decimal(value: decimal.Decimal) -> str:
+    """Encode a 2 decimal places amount the way rest_framework.serializers.DecimalField does."""
+    return str(value.quantize(CENT))
+
+
+def encode_datetime(value) -> str:
+    """Encode a datetime the way rest_framework.serializers.DateTimeField does."""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class RowEncoder:
+    """Encode queryset .values_list() rows without a ModelSerializer.
+
+    fields - (name, lookup, encode) tuples, rows must be fetched with .values_list(*encoder.lookups).
+    constants - fields with the same value on every row (eg: the customer), they come first.
+    """
+
+    def __init__(self, fields: tuple, constants: dict = None):
+        self.fields = fields
+        self.constants = constants or {}
+        self.names = list(self.constants) + [name for name, _, _ in fields]
+        self.lookups = [lookup for _, lookup, _ in fields]
+        self.encoders = [encode for _, _, encode in fields]
+
+    def encode(self, row: tuple) -> list:
+        """Encode a row to a list of values in the order of self.names."""
+        return list(self.constants.values()) + [encode(value) for encode, value in zip(self.encoders, row)]
+
+    def encode_dict(self, row: tuple) -> dict:
+        return dict(zip(self.names, self.encode(row)))
+
+    def encode_values(self, row: dict) -> dict:
+        """Encode a .values() row (keyed by lookup) to a dict keyed by name."""
+        data = dict(self.constants)
+        for name, lookup, encode in self.fields:
+            data[name] = encode(row[lookup])
+        return data
+
+
+# Same fields as InvoiceSerializer/PaymentSerializer minus the customer fields (passed as constants)
+INVOICE_ROW_FIELDS = (
+    ('invoice_id', 'invoice_id', encode_uuid),
+    ('amount', 'amount', encode_decimal),
+    ('balance', 'balance', encode_decimal),
+    ('created', 'created', encode_datetime),
+    ('modified', 'modified', encode_datetime),
+)
+
+PAYMENT_ROW_FIELDS = (
+    ('invoice_id', 'invoice__invoice_id', encode_uuid),
+    ('payment_id', 'payment_id', encode_uuid),
+    ('amount', 'amount', encode_decimal),
+    ('created', 'created', encode_datetime),
+    ('modified', 'modified', encode_datetime),
+)
+
+
+def customer_constants(customer: 'Customer') -> dict:
+    return {
+        'customer_full_name': customer.full_name,
+        'customer_id': encode_uuid(customer.customer_id),
+    }
@@ -0,0 +1,61 @@
+import csv
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from rest_framework.exceptions import ValidationError
+
+from .encoders import RowEncoder
+
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """A file-like object that returns what is written to it, for streaming csv.writer output."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_rows(queryset: 'QuerySet', encoder: RowEncoder):
+    """Iterate over the queryset rows in chunks without caching them on the queryset."""
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    return queryset.values_list(*encoder.lookups).iterator(chunk_size=chunk_size)
+
+
+def stream_ndjson(queryset: 'QuerySet', encoder: RowEncoder):
+    """Yield one JSON document per row."""
+    for row in iter_rows(queryset, encoder):
+        yield json.dumps(encoder.encode_dict(row)) + '\n'
+
+
+def stream_csv(queryset: 'QuerySet', encoder: RowEncoder):
+    """Yield a CSV header line followed by one line per row."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(encoder.names)
+    for row in iter_rows(queryset, encoder):
+        yield writer.writerow(encoder.encode(row))
+
+
+def export_response(queryset: 'QuerySet', encoder: RowEncoder, output: str, filename: str) -> StreamingHttpResponse:
+    """Stream the queryset rows as NDJSON (default) or CSV.
+
+    Memory use does not depend on the number of rows, rows are fetched in chunks of
+    settings.EXPORT_CHUNK_SIZE and encoded as they are sent to the client.
+    """
+    output = output or 'ndjson'
+    if output == 'ndjson':
+        content = stream_ndjson(queryset, encoder)
+    elif output == 'csv':
+        content = stream_csv(queryset, encoder)
+    else:
+        raise ValidationError("Param 'output' must be one of: ndjson, csv.")
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
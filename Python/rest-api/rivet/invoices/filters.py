@@ -0,0 +1,130 @@
+import uuid
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .payments import parse_decimal
+
+
+# Most invoices a payments query can be filtered by (the size of its IN list)
+MAX_INVOICE_FILTER = 100
+
+
+def parse_invoice_ids(query_params: 'QueryDict') -> list:
+    """Parse the invoice params, repeated (invoice=a&invoice=b) and/or comma separated (invoice=a,b), to UUIDs."""
+    invoice_ids = []
+    for value in query_params.getlist('invoice'):
+        for invoice_id in value.split(','):
+            invoice_id = invoice_id.strip()
+            if not invoice_id:
+                continue
+            try:
+                invoice_ids.append(uuid.UUID(invoice_id))
+            except ValueError:
+                raise ValidationError("Param 'invoice' must be a valid invoice id.")
+
+    if len(invoice_ids) > MAX_INVOICE_FILTER:
+        raise ValidationError(f"Param 'invoice' accepts at most {MAX_INVOICE_FILTER} invoice ids.")
+
+    return invoice_ids
+
+
+def parse_created(name: str, value: str, end_of_day: bool = False) -> tuple:
+    """Parse an ISO 8601 datetime or date param to an aware datetime (in UTC), return (datetime, is_date).
+
+    Dates are the start of the day, or the start of the next day if end_of_day (an exclusive bound including the
+    whole day). Datetimes without a timezone are in the current timezone (settings.TIME_ZONE).
+    Values out of the datetime range once in UTC (eg: 9999-12-31T23:59:59-05:00) are invalid.
+    """
+    try:
+        # Dates first: parse_datetime() also accepts a date, as midnight
+        date = parse_date(value)
+    except ValueError:
+        date = None
+
+    try:
+        if date is not None:
+            if end_of_day:
+                date += datetime.timedelta(days=1)
+            created = datetime.datetime.combine(date, datetime.time())
+        else:
+            created = parse_datetime(value)
+            if created is None:
+                raise ValueError()
+
+        if timezone.is_naive(created):
+            created = timezone.make_aware(created)
+        # The database converts to UTC, which must not overflow
+        created = created.astimezone(datetime.timezone.utc)
+    except (ValueError, OverflowError):
+        raise ValidationError(f"Param '{name}' must be an ISO 8601 date or datetime.")
+
+    return created, date is not None
+
+
+def filter_payments(queryset: 'QuerySet', query_params: 'QueryDict') -> 'QuerySet':
+    """Filter a customer's Payment queryset by the params of a request, in the same single query.
+
+    amount_gte, amount_lte - payment amount range (decimal).
+    created_gte, created_lte - payment creation range (ISO 8601 date or datetime, dates include the whole day).
+    invoice - payments of these invoices (UUID), repeated or comma separated, at most MAX_INVOICE_FILTER.
+    The invoices are matched by joining the invoices table (invoice__invoice_id__in), ids of unknown invoices
+    or of other customers' invoices simply match no payment.
+    """
+    # Validate params passed in API request
+    # amount_gte: decimal
+    amount_gte = query_params.get('amount_gte')
+    if amount_gte:
+        amount_gte = parse_decimal('amount_gte', amount_gte)
+        if amount_gte <= 0:
+            raise ValidationError("Param 'amount_gte' must be greater than 0.")
+        queryset = queryset.filter(amount__gte=amount_gte)
+
+    # amount_lte: decimal
+    amount_lte = query_params.get('amount_lte')
+    if amount_lte:
+        amount_lte = parse_decimal('amount_lte', amount_lte)
+        if amount_lte <= 0:
+            raise ValidationError("Param 'amount_lte' must be greater than 0.")
+        queryset = queryset.filter(amount__lte=amount_lte)
+
+    if amount_gte and amount_lte and amount_gte > amount_lte:
+        raise ValidationError("Param 'amount_gte' must be less than or equal to amount_lte.")
+
+    # created_gte: date/datetime
+    created_gte = query_params.get('created_gte')
+    if created_gte:
+        created_gte, _ = parse_created('created_gte', created_gte)
+        queryset = queryset.filter(created__gte=created_gte)
+
+    # created_lte: date/datetime, a date includes the whole day
+    created_lte = query_params.get('created_lte')
+    is_date = False
+    if created_lte:
+        created_lte, is_date = parse_created('created_lte', created_lte, end_of_day=True)
+        if is_date:
+            # The start of the next day, excluded
+            queryset = queryset.filter(created__lt=created_lte)
+        else:
+            queryset = queryset.filter(created__lte=created_lte)
+
+    if created_gte and created_lte and (created_gte >= created_lte if is_date else created_gte > created_lte):
+        raise ValidationError("Param 'created_gte' must be less than or equal to created_lte.")
+
+    # invoice: UUID, one or more
+    invoice_ids = parse_invoice_ids(query_params)
+    if invoice_ids:
+        queryset = queryset.filter(invoice__invoice_id__in=invoice_ids)
+
+    return queryset
+
+
+class PaymentFilterBackend(BaseFilterBackend):
+    """Filters the payment list with filter_payments() (amount, created and invoice params)."""
+
+    def filter_queryset(self, request: 'Request', queryset: 'QuerySet', view) -> 'QuerySet':
+        return filter_payments(queryset, request.query_params)
@@ -0,0 +1,107 @@
+"""Idempotency-Key support for POST /api/payments/.
+
+The first request sent with a given key stores its successful response, 201 or 202 (mode=async), in the
+transaction that applies the payments or creates the job. Requests retried with the same key and payload replay the
+stored response, with its Location header, without validating the payload or touching the invoices. Keys expire after settings.IDEMPOTENCY_KEY_TTL seconds, see purge_idempotency_keys.
+"""
+import json
+import hashlib
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from customers.models import Customer
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Response headers stored and replayed with the response (the job of a 202 response)
+STORED_HEADERS = ('Location',)
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = f'{HEADER} has already been used with a different request payload.'
+    default_code = 'idempotency_key_mismatch'
+
+
+def get_key(request: 'Request') -> str:
+    """Get the Idempotency-Key header of a request, None if it was not sent."""
+    key = request.headers.get(HEADER)
+    if key is None:
+        return None
+
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValidationError(f'{HEADER} must be between 1 and {MAX_KEY_LENGTH} characters long.')
+
+    return key
+
+
+def get_request_hash(request_data) -> str:
+    """sha256 of the request payload (key order and whitespace do not matter)."""
+    data = json.dumps(request_data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def get_expiry() -> datetime.datetime:
+    """Keys created before the expiry are not replayed anymore."""
+    return timezone.now() - datetime.timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def replay(customer: Customer, key: str, request_hash: str) -> Response:
+    """Get the stored response of a key, None if the key has not been used (or has expired).
+
+    Raises IdempotencyKeyMismatch if the key was used with a different payload.
+    """
+    try:
+        idempotency_key = IdempotencyKey.objects.get(customer=customer, key=key)
+    except IdempotencyKey.DoesNotExist:
+        return None
+
+    if idempotency_key.created < get_expiry():
+        # Free the key for this request, the purge command may not have run yet
+        idempotency_key.delete()
+        return None
+
+    if idempotency_key.request_hash != request_hash:
+        raise IdempotencyKeyMismatch()
+
+    headers = {**idempotency_key.headers, 'Idempotent-Replayed': 'true'}
+    return Response(idempotency_key.response, status=idempotency_key.status_code, headers=headers)
+
+
+def store(customer: Customer, key: str, request_hash: str, response: Response):
+    """Store the response of a key, call it in the transaction that made the changes.
+
+    Concurrent requests with the same key fail with an IntegrityError (unique customer/key) and roll back.
+    """
+    IdempotencyKey.objects.create(
+        customer=customer,
+        key=key,
+        request_hash=request_hash,
+        status_code=response.status_code,
+        response=response.data,
+        headers={name: response[name] for name in STORED_HEADERS if response.has_header(name)}
+    )
+
+
+def purge(batch_size: int = 1000, limit: int = None) -> int:
+    """Delete expired keys batch_size at a time (at most limit of them), return the number of keys deleted."""
+    expiry = get_expiry()
+    deleted = 0
+    while limit is None or deleted < limit:
+        size = batch_size if limit is None else min(batch_size, limit - deleted)
+        pks = list(IdempotencyKey.objects.filter(created__lt=expiry).order_by('created').values_list('pk', flat=True)[:size])
+        if not pks:
+            break
+
+        deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
+
+    return deleted
@@ -0,0 +1,209 @@
+"""Bulk invoice upserts: POST /api/invoices/import/ and the import_invoices command.
+
+The whole batch is parsed and validated column by column before anything is written, including the
+balance <= amount rule of check_invoice_amount_balance() (bulk_create sends no pre_save signal). Invalid rows are
+reported with their index and skipped, the valid ones are upserted chunk_size at a time with
+bulk_create(update_conflicts=True) on invoice_id: each chunk, its ownership check and its account summary update
+run in one transaction, so a failing chunk is reported and the next chunks are still imported.
+"""
+import uuid
+import logging
+import decimal
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from rest_framework.exceptions import ValidationError
+
+from customers.models import Customer
+from . import cache, summary
+from .models import Invoice
+from .payments import CENT, MAX_AMOUNT, parse_amount, parse_decimal, parse_invoice_id
+
+
+logger = logging.getLogger(__name__)
+
+ZERO = decimal.Decimal('0.00')
+
+
+def get_chunk_size() -> int:
+    return getattr(settings, 'INVOICE_IMPORT_CHUNK_SIZE', 1000)
+
+
+def parse_balance(name: str, value) -> decimal.Decimal:
+    """Parse an invoice balance to a Decimal quantized to cents, between 0 and 100000."""
+    balance = parse_decimal(name, value)
+    if balance > MAX_AMOUNT:
+        raise ValidationError(f"Param '{name}' must be less than or equal to 100000.")
+    if balance < 0:
+        raise ValidationError(f"Param '{name}' must be greater than or equal to 0.")
+
+    return balance.quantize(CENT)
+
+
+def add_error(errors: dict, index: int, message: str):
+    errors.setdefault(index, []).append(message)
+
+
+def get_error(e: ValidationError) -> str:
+    detail = e.detail
+    if isinstance(detail, list):
+        return ' '.join(str(message) for message in detail)
+    return str(detail)
+
+
+def parse_column(rows: list, name: str, parse, errors: dict, required: bool = True) -> list:
+    """Parse the name values of every row, None for missing or invalid values (reported in errors)."""
+    values = []
+    for index, row in enumerate(rows):
+        value = row.get(name) if isinstance(row, dict) else None
+        # Empty CSV cells are missing values
+        if value is None or value == '':
+            if required and isinstance(row, dict):
+                add_error(errors, index, f"Param '{name}' is required.")
+            values.append(None)
+            continue
+
+        try:
+            values.append(parse(name, value))
+        except ValidationError as e:
+            add_error(errors, index, get_error(e))
+            values.append(None)
+
+    return values
+
+
+def parse_rows(rows) -> tuple:
+    """Validate an invoices payload, return ([(index, invoice_id, amount, balance), ...], {index: [error, ...]}).
+
+    rows - a single {"invoice_id": UUID (optional, a new invoice gets one), "amount": number, "balance": number}
+    dict or a list of them. Only the payload shape raises a ValidationError, invalid rows are left out of the
+    returned items and reported in the errors.
+    """
+    if isinstance(rows, dict):
+        rows = [rows]
+
+    if not isinstance(rows, list) or not rows:
+        raise ValidationError('Expected an invoice or a non-empty list of invoices.')
+
+    errors = {}
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            add_error(errors, index, 'Expected an invoice.')
+
+    invoice_ids = parse_column(rows, 'invoice_id', parse_invoice_id, errors, required=False)
+    amounts = parse_column(rows, 'amount', parse_amount, errors)
+    balances = parse_column(rows, 'balance', parse_balance, errors)
+
+    # Invoice.balance <= Invoice.amount, across the batch
+    for index in [
+        index for index, (amount, balance) in enumerate(zip(amounts, balances))
+        if amount is not None and balance is not None and balance > amount
+    ]:
+        add_error(errors, index, 'Invoice.balance cannot be greater than Invoice.amount.')
+
+    # An upsert cannot change the same row twice
+    seen = set()
+    for index, invoice_id in enumerate(invoice_ids):
+        if invoice_id is None:
+            continue
+        if invoice_id in seen:
+            add_error(errors, index, f'Invoice {invoice_id} is repeated in the batch.')
+        seen.add(invoice_id)
+
+    items = [
+        (index, invoice_id or uuid.uuid4(), amount, balance)
+        for index, (invoice_id, amount, balance) in enumerate(zip(invoice_ids, amounts, balances))
+        if index not in errors
+    ]
+    return items, errors
+
+
+def upsert_chunk(customer: Customer, chunk: list, errors: dict) -> tuple:
+    """Upsert the (index, invoice_id, amount, balance) items of a chunk, return (created, updated).
+
+    Call it in a transaction: the existing invoices are locked while they are checked and overwritten, and the
+    account summary is updated with the differences in the same transaction.
+    """
+    existing = {
+        row['invoice_id']: row
+        for row in Invoice.objects.select_for_update().order_by().filter(
+            invoice_id__in=[invoice_id for _, invoice_id, _, _ in chunk]
+        ).values('invoice_id', 'customer_id', 'amount', 'balance')
+    }
+
+    invoices = []
+    updated = 0
+    total_billed = open_balance = ZERO
+    open_invoices = 0
+    for index, invoice_id, amount, balance in chunk:
+        loaded = existing.get(invoice_id)
+        if loaded is not None:
+            # Other customers' invoices are not found, like in the rest of the API
+            if loaded['customer_id'] != customer.pk:
+                add_error(errors, index, f'Invoice {invoice_id} not found.')
+                continue
+
+            updated += 1
+            total_billed -= loaded['amount']
+            open_balance -= loaded['balance']
+            open_invoices -= int(loaded['balance'] > 0)
+
+        invoices.append(Invoice(customer=customer, invoice_id=invoice_id, amount=amount, balance=balance))
+        total_billed += amount
+        open_balance += balance
+        open_invoices += int(balance > 0)
+
+    if not invoices:
+        return 0, 0
+
+    Invoice.objects.bulk_create(
+        invoices,
+        update_conflicts=True,
+        unique_fields=['invoice_id'],
+        update_fields=['amount', 'balance', 'modified'],
+    )
+    summary.update(
+        customer.pk,
+        total_billed=F('total_billed') + total_billed,
+        open_balance=F('open_balance') + open_balance,
+        open_invoices=F('open_invoices') + open_invoices,
+    )
+
+    return len(invoices) - updated, updated
+
+
+def import_invoices(customer: Customer, rows, chunk_size: int = None) -> dict:
+    """Create or update a customer's invoices in bulk, see parse_rows() for the rows.
+
+    Returns {"created": n, "updated": n, "errors": [{"index": row index, "errors": [message, ...]}, ...]}.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    items, errors = parse_rows(rows)
+
+    created = updated = 0
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        try:
+            with transaction.atomic():
+                chunk_created, chunk_updated = upsert_chunk(customer, chunk, errors)
+        except DatabaseError:
+            logger.exception('Invoice import chunk of customer %s failed', customer.pk)
+            for index, *_ in chunk:
+                if index not in errors:
+                    add_error(errors, index, 'Internal error, the invoice was not imported.')
+            continue
+
+        created += chunk_created
+        updated += chunk_updated
+
+    if created or updated:
+        # bulk_create sends no post_save signal
+        cache.invalidate(customer.pk)
+
+    return {
+        'created': created,
+        'updated': updated,
+        'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+    }
@@ -0,0 +1,161 @@
+"""Payment batch jobs: POST /api/payments/?mode=async payloads applied in the background.
+
+The request validates the payload and checks it against the customer's invoices and their balances, then stores it
+as a PaymentBatchJob and returns 202. The run_payment_worker command claims pending jobs from the database (no broker)
+and applies them chunk_size items at a time, each chunk and the job progress in one transaction. A chunk can still fail
+if payments were made in between: it fails the job, the chunks applied before it stay applied (job.processed payments,
+reported in job.error).
+
+A job left running by a worker that died is claimed again once it has not progressed for
+settings.PAYMENT_BATCH_JOB_TIMEOUT seconds, it resumes after its last applied chunk.
+"""
+import time
+import uuid
+import logging
+import datetime
+import decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from rest_framework.exceptions import APIException
+
+from customers.models import Customer
+from .models import Invoice, PaymentBatchJob
+from .payments import apply_payments, check_balances
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_job(customer: Customer, items: list) -> PaymentBatchJob:
+    """Store the (invoice_id, amount) items of parse_payment_items() as a pending job.
+
+    The payload gets the checks of apply_payments() against the current balances, so it is rejected up front
+    (NotFound, ValidationError) like a synchronous POST. Payments made in between can still fail the job when it runs.
+    """
+    invoice_ids = {invoice_id for invoice_id, _ in items}
+    balances = dict(
+        Invoice.objects.filter(customer=customer, invoice_id__in=invoice_ids).values_list('invoice_id', 'balance')
+    )
+    check_balances(items, balances)
+
+    return PaymentBatchJob.objects.create(
+        customer=customer,
+        items=[[str(invoice_id), str(amount)] for invoice_id, amount in items],
+        total=len(items)
+    )
+
+
+def get_chunk_size(chunk_size: int = None) -> int:
+    """chunk_size, settings.PAYMENT_BATCH_CHUNK_SIZE if None. Raises ValueError if it is not greater than 0."""
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'PAYMENT_BATCH_CHUNK_SIZE', 500)
+    if chunk_size < 1:
+        raise ValueError('The chunk size must be greater than 0.')
+
+    return chunk_size
+
+
+def get_stale_before() -> datetime.datetime:
+    """Running jobs not modified since are considered abandoned by their worker."""
+    return timezone.now() - datetime.timedelta(seconds=getattr(settings, 'PAYMENT_BATCH_JOB_TIMEOUT', 300))
+
+
+def claim() -> PaymentBatchJob:
+    """Claim the oldest pending (or abandoned) job, None if there is none.
+
+    A conditional UPDATE marks the job running, so concurrent workers never claim the same job.
+    """
+    claimable = PaymentBatchJob.objects.filter(
+        Q(status=PaymentBatchJob.PENDING) | Q(status=PaymentBatchJob.RUNNING, modified__lt=get_stale_before())
+    )
+
+    for pk in claimable.order_by('created').values_list('pk', flat=True)[:10]:
+        now = timezone.now()
+        # Same conditions again: another worker may have claimed it since
+        if claimable.filter(pk=pk).update(status=PaymentBatchJob.RUNNING, started=now, modified=now):
+            return PaymentBatchJob.objects.select_related('customer').get(pk=pk)
+
+    return None
+
+
+class JobTakenOver(Exception):
+    """Another worker claimed the job (it looked abandoned) and applied the chunk first."""
+
+
+def run_job(job: PaymentBatchJob, chunk_size: int = None):
+    """Apply the remaining items of a claimed job, chunk_size at a time."""
+    chunk_size = get_chunk_size(chunk_size)
+    items = [(uuid.UUID(invoice_id), decimal.Decimal(amount)) for invoice_id, amount in job.items]
+
+    while job.processed < job.total:
+        chunk = items[job.processed:job.processed + chunk_size]
+        try:
+            with transaction.atomic():
+                apply_payments(job.customer, chunk, payment_id=job.payment_id)
+                # Conditional on the progress we started from, so a chunk is never applied twice
+                progressed = PaymentBatchJob.objects.filter(pk=job.pk, processed=job.processed).update(
+                    processed=job.processed + len(chunk),
+                    modified=timezone.now()
+                )
+                if not progressed:
+                    raise JobTakenOver()
+        except JobTakenOver:
+            logger.warning('Payment batch job %s was taken over by another worker', job.job_id)
+            return
+        except APIException as e:
+            fail(job, get_error(e) + get_applied(job))
+            return
+        except Exception:
+            logger.exception('Payment batch job %s failed', job.job_id)
+            fail(job, 'Internal error.' + get_applied(job))
+            return
+
+        job.processed += len(chunk)
+
+    job.status = PaymentBatchJob.SUCCEEDED
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'finished', 'modified'])
+
+
+def get_error(e: APIException) -> str:
+    detail = e.detail
+    if isinstance(detail, list):
+        return ' '.join(str(message) for message in detail)
+    return str(detail)
+
+
+def get_applied(job: PaymentBatchJob) -> str:
+    """A failed job is not rolled back: its first processed payments stay applied."""
+    if not job.processed:
+        return ' No payment was applied.'
+    return f' The first {job.processed} payments were applied and stay applied, the others were not.'
+
+
+def fail(job: PaymentBatchJob, error: str):
+    job.status = PaymentBatchJob.FAILED
+    job.error = error
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished', 'modified'])
+
+
+def work(chunk_size: int = None, burst: bool = False, poll_interval: float = 1.0, max_jobs: int = None) -> int:
+    """Claim and run jobs until max_jobs jobs ran, or until there is none left if burst, return the number of jobs."""
+    # Checked before a job is claimed
+    chunk_size = get_chunk_size(chunk_size)
+    ran = 0
+    while max_jobs is None or ran < max_jobs:
+        job = claim()
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        run_job(job, chunk_size)
+        ran += 1
+
+    return ran
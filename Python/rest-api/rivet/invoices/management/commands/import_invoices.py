@@ -0,0 +1,94 @@
+import csv
+import sys
+import json
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customers.models import Customer
+from invoices import imports
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates invoices in bulk from an NDJSON or CSV file (the format of the invoice export)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON or CSV file of invoices, '-' reads stdin.")
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default=None,
+                            help='File format (default: csv for .csv files, else ndjson).')
+        parser.add_argument('--customer', type=uuid.UUID, default=None,
+                            help="Customer id the invoices belong to (default: each row's customer_id column, which "
+                                 "the invoice export includes). Required for rows without a customer_id.")
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Invoices upserted per transaction (default: settings.INVOICE_IMPORT_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be greater than 0')
+
+        path = options['path']
+        format = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+
+        if path == '-':
+            rows = self.read_rows(sys.stdin, format)
+        else:
+            with open(path, newline='') as file:
+                rows = self.read_rows(file, format)
+
+        if not rows:
+            raise CommandError('No invoices to import')
+
+        # Row indexes of every customer, imported one customer at a time
+        errors = {}
+        customer_rows = {}
+        for index, row in enumerate(rows):
+            customer_id = options['customer'] or (row.get('customer_id') if isinstance(row, dict) else None)
+            if not customer_id:
+                errors[index] = ["Param 'customer_id' is required (or pass --customer)."]
+                continue
+            try:
+                customer_id = uuid.UUID(str(customer_id))
+            except ValueError:
+                errors[index] = ["Param 'customer_id' must be a valid customer id."]
+                continue
+            customer_rows.setdefault(customer_id, []).append(index)
+
+        customers = {
+            customer.customer_id: customer for customer in Customer.objects.filter(customer_id__in=list(customer_rows))
+        }
+
+        created = updated = 0
+        for customer_id, indexes in customer_rows.items():
+            customer = customers.get(customer_id)
+            if customer is None:
+                for index in indexes:
+                    errors[index] = [f'Customer {customer_id} not found.']
+                continue
+
+            result = imports.import_invoices(customer, [rows[index] for index in indexes], options['chunk_size'])
+            created += result['created']
+            updated += result['updated']
+            for error in result['errors']:
+                errors[indexes[error['index']]] = error['errors']
+
+        for index in sorted(errors):
+            self.stderr.write(f"Row {index + 1}: {' '.join(errors[index])}")
+
+        self.stdout.write(f'Created {created} invoices, updated {updated} invoices')
+        if errors:
+            raise CommandError(f'{len(errors)} invoices were not imported')
+
+    def read_rows(self, file, format: str) -> list:
+        if format == 'csv':
+            return list(csv.DictReader(file))
+
+        rows = []
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise CommandError(f'Line {number} is not valid JSON')
+
+        return rows
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from invoices import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Deletes the payment Idempotency-Keys older than settings.IDEMPOTENCY_KEY_TTL in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of keys deleted per query.')
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of keys deleted (default: all).')
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge(batch_size=options['batch_size'], limit=options['limit'])
+
+        self.stdout.write(f'Deleted {deleted} expired idempotency keys')
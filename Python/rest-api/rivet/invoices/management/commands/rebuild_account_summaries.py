@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from invoices import summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the customer account summaries from the invoices and payments, or verifies them (--verify)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare the summaries with the invoices and report the differences.')
+        parser.add_argument('--customer', type=int, action='append', dest='customers',
+                            help='Customer pk to rebuild/verify, can be repeated (default: all).')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            differences = summary.verify(options['customers'])
+            for customer_pk, fields in sorted(differences.items()):
+                for field, (stored, expected) in fields.items():
+                    self.stdout.write(f'Customer {customer_pk}: {field} is {stored}, expected {expected}')
+
+            if differences:
+                raise CommandError(f'{len(differences)} account summaries differ from the invoices')
+            self.stdout.write('Account summaries are up to date')
+            return
+
+        with transaction.atomic():
+            rebuilt = summary.rebuild(options['customers'])
+
+        self.stdout.write(f'Rebuilt {rebuilt} account summaries')
@@ -0,0 +1,178 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from invoices import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Drives the REST API endpoints in-process and reports latency, queries per request and rows per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Number of requests per scenario.')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=list(benchmark.SCENARIOS),
+                            help='Scenario to run, can be repeated (default: all).')
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help='Compare the sync and async read endpoints with this many concurrent requests '
+                                 '(through the ASGI handler) instead of running the scenarios.')
+        parser.add_argument('--serializers', action='store_true',
+                            help='Compare the list serializers (rows per second) instead of running the scenarios.')
+        parser.add_argument('--connections', action='store_true',
+                            help='Compare a new database connection per request with a persistent connection '
+                                 'instead of running the scenarios (--scenario picks the requests).')
+        parser.add_argument('--auth', action='store_true',
+                            help='Compare Basic and Token authentication, with and without their caches, in requests '
+                                 'per second (per core) instead of running the scenarios.')
+        parser.add_argument('--sqlite-stress', type=float, default=0, metavar='SECONDS',
+                            help='Compare the read/write throughput of concurrent connections to a copy of the '
+                                 'SQLite database with its default settings and with SQLITE_PRAGMAS, for this many '
+                                 'seconds each, instead of running the scenarios.')
+        parser.add_argument('--hot-invoice', type=int, default=0, metavar='WRITERS',
+                            help='Measure the throughput of this many threads POSTing --requests payments each to '
+                                 'the same (new) invoice instead of running the scenarios.')
+        parser.add_argument('--readers', type=int, default=4, help='Reading threads of --sqlite-stress.')
+        parser.add_argument('--writers', type=int, default=2, help='Writing threads of --sqlite-stress.')
+        parser.add_argument('--output', default='benchmark.json', help='JSON file the results are written to.')
+        parser.add_argument('--use-existing', action='store_true',
+                            help='Benchmark the configured database (seeded with seed_benchmark) '
+                                 'instead of a fresh test database.')
+        parser.add_argument('--customers', type=int, default=10, help='Customers to seed in the test database.')
+        parser.add_argument('--invoices', type=int, default=1000, help='Invoices per customer to seed.')
+        parser.add_argument('--payments', type=int, default=500, help='Paid invoices per customer to seed.')
+
+    def handle(self, *args, **options):
+        if options['use_existing']:
+            results = self.run(options)
+        else:
+            # Seed and benchmark a throwaway test database, the configured one is left untouched
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                call_command(
+                    'seed_benchmark',
+                    customers=options['customers'],
+                    invoices=options['invoices'],
+                    payments=options['payments'],
+                    stdout=self.stdout
+                )
+                results = self.run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'results': results,
+        }
+        if options['concurrency']:
+            report['concurrency'] = options['concurrency']
+        if options['serializers']:
+            report['serializers'] = True
+        if options['connections']:
+            report['connections'] = True
+        if options['auth']:
+            report['auth'] = True
+        if options['sqlite_stress']:
+            report['sqlite_stress'] = options['sqlite_stress']
+        if options['hot_invoice']:
+            report['hot_invoice'] = options['hot_invoice']
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        if options['serializers']:
+            self.write_serializers(results)
+        elif options['connections']:
+            self.write_connections(results)
+        elif options['auth']:
+            self.write_auth(results)
+        elif options['sqlite_stress']:
+            self.write_sqlite_stress(results)
+        elif options['hot_invoice']:
+            self.write_hot_invoice(results)
+        elif options['concurrency']:
+            self.write_concurrency(results)
+        else:
+            self.write_results(results)
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def write_results(self, results: dict):
+        self.stdout.write(f"{'scenario':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'rows/s':>12}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['queries_per_request']:>10}{result['rows_per_second']:>12}"
+            )
+
+    def write_concurrency(self, results: dict):
+        self.stdout.write(f"{'endpoint':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>12}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['requests_per_second']:>12}"
+            )
+
+    def write_serializers(self, results: dict):
+        self.stdout.write(f"{'serializer':<28}{'rows':>10}{'p50 ms':>10}{'p99 ms':>10}{'rows/s':>12}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28}{result['rows']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['rows_per_second']:>12}"
+            )
+
+    def write_connections(self, results: dict):
+        self.stdout.write(f"{'scenario':<28}{'new p50':>10}{'reused p50':>12}{'saved ms/req':>14}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28}{result['new_p50_ms']:>10}{result['persistent_p50_ms']:>12}"
+                f"{result['saved_ms_per_request']:>14}"
+            )
+
+    def write_auth(self, results: dict):
+        self.stdout.write(f"{'authentication':<20}{'p50 ms':>10}{'p99 ms':>10}{'queries':>10}{'req/s':>10}{'req/cpu s':>12}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<20}{result['p50_ms']:>10}{result['p99_ms']:>10}{result['queries_per_request']:>10}"
+                f"{result['requests_per_second']:>10}{result['requests_per_cpu_second']:>12}"
+            )
+
+    def write_sqlite_stress(self, results: dict):
+        self.stdout.write(
+            f"{'pragmas':<20}{'reads/s':>10}{'writes/s':>10}{'read p99':>10}{'write p99':>11}{'errors':>8}"
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<20}{result['reads_per_second']:>10}{result['writes_per_second']:>10}"
+                f"{str(result['read_p99_ms']):>10}{str(result['write_p99_ms']):>11}{result['errors']:>8}"
+            )
+
+    def write_hot_invoice(self, result: dict):
+        self.stdout.write(
+            f"{'writers':>8}{'applied':>10}{'rejected':>10}{'errors':>10}{'elapsed s':>11}{'payments/s':>12}"
+            f"{'consistent':>12}"
+        )
+        self.stdout.write(
+            f"{result['writers']:>8}{result['applied']:>10}{result['rejected']:>10}{result['errors']:>10}"
+            f"{result['elapsed_s']:>11}{result['payments_per_second']:>12}{str(result['consistent']):>12}"
+        )
+
+    def run(self, options: dict) -> dict:
+        try:
+            if options['serializers']:
+                return benchmark.run_serializers(repeat=options['requests'])
+            if options['auth']:
+                return benchmark.run_auth(requests=options['requests'])
+            if options['sqlite_stress']:
+                return benchmark.run_sqlite_stress(
+                    readers=options['readers'], writers=options['writers'], duration=options['sqlite_stress']
+                )
+            if options['hot_invoice']:
+                customer = benchmark.Context(max_customers=1).get(0)['customer']
+                return benchmark.run_hot_invoice(customer, writers=options['hot_invoice'], payments=options['requests'])
+            if options['connections']:
+                return benchmark.run_connections(requests=options['requests'], scenarios=options['scenarios'])
+            if options['concurrency']:
+                return benchmark.run_concurrency(requests=options['requests'], concurrency=options['concurrency'])
+            return benchmark.run(requests=options['requests'], scenarios=options['scenarios'])
+        except ValueError as e:
+            raise CommandError(e)
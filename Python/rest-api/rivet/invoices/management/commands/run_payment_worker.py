@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices import jobs
+
+
+class Command(BaseCommand):
+    help = 'Applies the payment batch jobs of POST /api/payments/?mode=async, polling the database for new jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Payments applied per transaction (default: settings.PAYMENT_BATCH_CHUNK_SIZE).')
+        parser.add_argument('--burst', action='store_true', help='Exit once there are no jobs left.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls for new jobs.')
+        parser.add_argument('--max-jobs', type=int, default=None, help='Exit after running this many jobs.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be greater than 0')
+
+        ran = jobs.work(
+            chunk_size=options['chunk_size'],
+            burst=options['burst'],
+            poll_interval=options['poll_interval'],
+            max_jobs=options['max_jobs']
+        )
+
+        self.stdout.write(f'Ran {ran} payment batch jobs')
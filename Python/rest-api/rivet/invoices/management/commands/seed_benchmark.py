@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from invoices import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Seeds the database with benchmark customers, invoices and payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=100, help='Number of customers.')
+        parser.add_argument('--invoices', type=int, default=1000, help='Number of invoices per customer.')
+        parser.add_argument('--payments', type=int, default=500, help='Number of paid invoices per customer.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the invoice amounts.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = benchmark.seed(
+                customers=options['customers'],
+                invoices=options['invoices'],
+                payments=min(options['payments'], options['invoices']),
+                seed=options['seed']
+            )
+
+        self.stdout.write(
+            f"Created {counts['customers']} customers, {counts['invoices']} invoices and {counts['payments']} payments"
+        )
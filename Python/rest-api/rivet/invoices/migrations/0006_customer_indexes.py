@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0005_alter_invoice_amount_alter_invoice_balance_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['customer', '-created'], name='invoices_in_custome_faa1f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['customer', '-created'], name='invoices_pa_custome_672175_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['customer', 'payment_id'], name='invoices_pa_custome_48ae52_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['customer', 'invoice', '-created'], name='invoices_pa_custome_6cfa07_idx'),
+        ),
+    ]
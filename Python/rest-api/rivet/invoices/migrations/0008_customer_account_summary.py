@@ -0,0 +1,27 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_customer_name'),
+        ('invoices', '0007_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerAccountSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_billed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('open_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('open_invoices', models.PositiveIntegerField(default=0)),
+                ('last_payment', models.DateTimeField(blank=True, null=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='account_summary', to='customers.customer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_customer_name'),
+        ('invoices', '0008_customer_account_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentBatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('payment_id', models.UUIDField(default=uuid.uuid4, editable=False)),
+                ('items', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('total', models.PositiveIntegerField()),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_batch_jobs', to='customers.customer')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='paymentbatchjob',
+            index=models.Index(fields=['status', 'created'], name='invoices_pa_status_579b0c_idx'),
+        ),
+    ]
@@ -3,11 +3,48 @@ import uuid
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 
-from django.db.models.signals import post_save, pre_save
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 from customers.models import Customer
+from . import cache, summary
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+
+class InvoiceQuerySet(models.QuerySet):
+    def decrement_balance(self, amount) -> int:
+        """Subtract amount from the balance of every invoice in the queryset that can cover it.
+
+        Runs a single conditional UPDATE ... SET balance = balance - amount WHERE balance >= amount
+        so the balance is never read in Python and concurrent payments cannot overwrite each other.
+        Returns the number of invoices updated.
+        """
+        return self.filter(balance__gte=amount).update(
+            balance=F('balance') - amount,
+            modified=timezone.now()
+        )
+
+    def decrement_balances(self, amounts: dict) -> int:
+        """Subtract {invoice_id: amount} from the balances of the invoices in the queryset that can cover them.
+
+        The same conditional UPDATE as decrement_balance(), for several invoices and amounts in a single query.
+        Returns the number of invoices updated, less than len(amounts) if an invoice is missing or short.
+        """
+        covered = Q()
+        for invoice_id, amount in amounts.items():
+            covered |= Q(invoice_id=invoice_id, balance__gte=amount)
+
+        amount = Case(
+            *[When(invoice_id=invoice_id, then=Value(amount)) for invoice_id, amount in amounts.items()],
+            output_field=models.DecimalField(max_digits=8, decimal_places=2)
+        )
+        return self.filter(covered).update(
+            balance=F('balance') - amount,
+            modified=timezone.now()
+        )
 
 
 class Invoice(models.Model):
@@ -36,13 +73,28 @@ class Invoice(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    objects = InvoiceQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created']
-        indexes = [models.Index(fields=['-created'])]
+        indexes = [
+            models.Index(fields=['-created']),
+            # Customer invoice lists (InvoiceListView)
+            models.Index(fields=['customer', '-created']),
+        ]
 
     def __str__(self):
         return str(self.invoice_id)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The amount and balance in the database, the account summary is updated with the difference on save
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in ('amount', 'balance')
+        }
+        return instance
+
 
 class Payment(models.Model):
     # customer = Customer.objects.get(customer_id=uuid.UUID('6056d964-ba2e-4e71-a583-3d56d0f74e89'))
@@ -74,12 +126,116 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-created']
-        indexes = [models.Index(fields=['-created'])]
+        indexes = [
+            models.Index(fields=['-created']),
+            # Customer payment lists (PaymentListView)
+            models.Index(fields=['customer', '-created']),
+            # Customer payment details (PaymentDetailView)
+            models.Index(fields=['customer', 'payment_id']),
+            # Customer payment lists filtered by invoice (PaymentListView ?invoice=)
+            models.Index(fields=['customer', 'invoice', '-created']),
+        ]
 
     def __str__(self):
         return f'{self.payment_id} -- {self.invoice})'
 
 
+class IdempotencyKey(models.Model):
+    """The response of a POST /api/payments/ request sent with an Idempotency-Key header, see invoices.idempotency."""
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    key = models.CharField(max_length=255)
+    # sha256 of the request payload, a key cannot be reused with a different payload
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    # The response headers replayed with it, see idempotency.STORED_HEADERS
+    headers = models.JSONField(default=dict)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'key'], name='unique_customer_idempotency_key'),
+        ]
+        indexes = [
+            # Expired keys purge (purge_idempotency_keys)
+            models.Index(fields=['created']),
+        ]
+
+    def __str__(self):
+        return f'{self.customer} -- {self.key}'
+
+
+class CustomerAccountSummary(models.Model):
+    """Per customer invoice totals, maintained incrementally by the code changing invoices (see invoices.summary)."""
+    customer = models.OneToOneField(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='account_summary'
+    )
+    # Sum of Invoice.amount
+    total_billed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Sum of Invoice.balance
+    open_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Number of invoices with a balance
+    open_invoices = models.PositiveIntegerField(default=0)
+    last_payment = models.DateTimeField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.customer} -- {self.open_balance}'
+
+
+class PaymentBatchJob(models.Model):
+    """A POST /api/payments/?mode=async payload, applied in chunks by the run_payment_worker command (invoices.jobs)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='payment_batch_jobs'
+    )
+    job_id = models.UUIDField(
+        default=uuid.uuid4,
+        editable=False,
+        unique=True
+    )
+    # Shared by all the payments of the job, like the payments of a synchronous POST
+    payment_id = models.UUIDField(default=uuid.uuid4, editable=False)
+    # The validated payload, [[invoice_id, amount], ...]
+    items = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total = models.PositiveIntegerField()
+    # Number of items applied, saved with every chunk
+    processed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Next job to claim (run_payment_worker)
+            models.Index(fields=['status', 'created']),
+        ]
+
+    def __str__(self):
+        return f'{self.customer} -- {self.job_id} ({self.status})'
+
+
 @receiver(pre_save, sender=Invoice)
 def check_invoice_amount_balance(sender, instance, **kwargs):
     """Invoice pre_save signal handler that makes sure that Invoice.amount >= Invoice.balance."""
@@ -89,11 +245,67 @@ def check_invoice_amount_balance(sender, instance, **kwargs):
 
 @receiver(pre_save, sender=Payment)
 def update_invoice_balance(sender, instance, **kwargs):
-    """Payment pre_save signal handler that updates the invoice balance."""
-    if instance.amount > instance.invoice.balance:
+    """Payment pre_save signal handler that updates the invoice balance.
+
+    New payments are subtracted from the balance, saving an existing payment again subtracts the difference with
+    its saved amount. The amount applied is kept in instance._applied_amount for the account summary.
+    """
+    amount = instance.amount
+    if not instance._state.adding:
+        saved = Payment.objects.filter(pk=instance.pk).values('invoice_id', 'amount').first()
+        if saved is not None:
+            if saved['invoice_id'] != instance.invoice_id:
+                raise ValidationError('Payment.invoice cannot be changed')
+            amount -= saved['amount']
+
+    instance._applied_amount = amount
+    if not amount:
+        return
+
+    updated = Invoice.objects.filter(pk=instance.invoice.pk).decrement_balance(amount)
+    if not updated:
         raise ValidationError('Payment.amount cannot be greater than remaining Invoice.balance')
 
-    instance.invoice.balance = instance.invoice.balance - instance.amount
-    instance.invoice.save()
+    # Keep the in-memory invoice in step with the row without reading it back
+    instance.invoice.balance = instance.invoice.balance - amount
+    if 'balance' in getattr(instance.invoice, '_loaded_values', {}):
+        instance.invoice._loaded_values['balance'] = instance.invoice.balance
+    cache.invalidate(instance.invoice.customer_id)
+
+
+@receiver(post_save, sender=Payment)
+def update_payment_account_summary(sender, instance, **kwargs):
+    """Payment post_save signal handler that subtracts the amount applied to the invoice from the account summary."""
+    amount = getattr(instance, '_applied_amount', None)
+    if amount:
+        summary.payment_applied(instance, amount)
+    instance._applied_amount = None
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def invalidate_invoice_list_cache(sender, instance, **kwargs):
+    """Invoice post_save/post_delete signal handler that invalidates the customer's cached invoice list pages."""
+    cache.invalidate(instance.customer_id)
+
+
+@receiver(post_save, sender=Invoice)
+def update_invoice_account_summary(sender, instance, created=False, **kwargs):
+    """Invoice post_save signal handler that adds the amount/balance changes to the customer's account summary."""
+    summary.invoice_saved(instance, created)
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_invoice_account_summary(sender, instance, **kwargs):
+    """Invoice post_delete signal handler that removes the invoice from the customer's account summary."""
+    summary.invoice_deleted(instance)
+
 
+@receiver(post_save, sender=User)
+def invalidate_customer_invoice_list_cache(sender, instance, update_fields=None, **kwargs):
+    """User post_save signal handler that invalidates the cached invoice list pages showing the customer's name."""
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
 
+    for customer_pk in Customer.objects.filter(user=instance).values_list('pk', flat=True):
+        cache.invalidate(customer_pk)
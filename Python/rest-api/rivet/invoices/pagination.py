@@ -0,0 +1,208 @@
+import json
+import uuid
+import base64
+import binascii
+import datetime
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+# Largest value of a 64-bit signed integer column (the pk)
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_position_datetime(value: str) -> datetime.datetime:
+    """Parse a cursor datetime, in UTC so it converts to the database timezone without overflowing."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed.astimezone(datetime.timezone.utc)
+
+
+def parse_position_id(value: str) -> int:
+    parsed = int(value)
+    if not 0 < parsed <= MAX_ID:
+        raise ValueError(value)
+    return parsed
+
+
+# Parsers of the cursor values of each ordering field
+POSITION_PARSERS = {
+    'created': parse_position_datetime,
+    'id': parse_position_id,
+    'payment_id': uuid.UUID,
+}
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (cursor) pagination.
+
+    Pages are selected with a WHERE clause on the ordering fields of the last row of the previous
+    page instead of COUNT(*) and OFFSET n, so every page costs the same however deep it is.
+    The last ordering field must be unique (the pk) to act as a tiebreaker.
+    Only a 'next' link is returned, clients walk the results from newest to oldest.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('-created', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None) -> list:
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        # Fetch one extra row to find out if there is a next page
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        return self.page
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self) -> str:
+        if not self.has_next:
+            return None
+
+        cursor = self.encode_cursor(self.get_position(self.page[-1]))
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_position(self, row) -> list:
+        """Get the values of the ordering fields for a model instance or a .values() dict."""
+        fields = [field.lstrip('-') for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[field] for field in fields]
+
+        return [getattr(row, field) for field in fields]
+
+    def get_position_filter(self, position: list) -> Q:
+        """Build the WHERE clause selecting the rows that come after position.
+
+        For ordering (-a, -b) that is: a < position[0] OR (a = position[0] AND b < position[1]).
+        """
+        position_filter = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            field = field.lstrip('-')
+            position_filter |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+
+        return position_filter
+
+    def encode_cursor(self, position: list) -> str:
+        data = json.dumps([str(value) for value in position])
+        return base64.urlsafe_b64encode(data.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request) -> list:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        return self.decode_position(encoded)
+
+    def decode_position(self, encoded: str) -> list:
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.ordering)
+            or not all(isinstance(value, str) for value in position)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+        # Values of the field types, a tampered cursor must not reach the database
+        try:
+            return [
+                POSITION_PARSERS[field.lstrip('-')](value) for field, value in zip(self.ordering, position)
+            ]
+        except (ValueError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class PaymentGroupPagination(KeysetPagination):
+    """Keyset pagination of payment groups (.values('payment_id').annotate(...) rows), in payment_id order.
+
+    payment_id is the grouped column, so the position filter is a WHERE clause applied before GROUP BY:
+    the (customer, payment_id) index reads the groups of a page in order and stops after page_size + 1 of them,
+    a cursor on an aggregate (eg: the last created) would be a HAVING clause grouping every payment for every page.
+    """
+    ordering = ('payment_id',)
+
+
+class SelectablePagination(BasePagination):
+    """Page number pagination by default, keyset pagination when requested.
+
+    Keyset pagination is selected with ?pagination=cursor (or any request carrying a cursor),
+    eg: /api/invoices/?pagination=cursor
+    """
+    pagination_query_param = 'pagination'
+    keyset_pagination_value = 'cursor'
+    page_number_class = PageNumberPagination
+    keyset_class = KeysetPagination
+
+    def get_paginator(self, request) -> BasePagination:
+        """Pick the pagination for this request."""
+        if (
+            request.query_params.get(self.pagination_query_param) == self.keyset_pagination_value
+            or request.query_params.get(self.keyset_class.cursor_query_param)
+        ):
+            return self.keyset_class()
+
+        return self.page_number_class()
+
+    def paginate_queryset(self, queryset, request, view=None) -> list:
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data) -> Response:
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return self.page_number_class().get_paginated_response_schema(schema)
+
+    @property
+    def display_page_controls(self) -> bool:
+        return getattr(getattr(self, 'paginator', None), 'display_page_controls', False)
+
+    def to_html(self) -> str:
+        return self.paginator.to_html()
+
+    def get_results(self, data: dict) -> list:
+        return data['results']
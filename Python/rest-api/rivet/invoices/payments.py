@@ -0,0 +1,183 @@
+import uuid
+import decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from rest_framework.exceptions import NotFound, ValidationError
+
+from customers.models import Customer
+from . import cache, summary
+from .models import Invoice, Payment
+
+
+CENT = decimal.Decimal('0.01')
+MAX_AMOUNT = decimal.Decimal('100000')
+
+
+def parse_decimal(name: str, value) -> decimal.Decimal:
+    """Parse a request param (str/int/float) to a finite Decimal.
+
+    JSON floats are converted from their shortest repr (eg: 0.1 -> Decimal('0.1')) rather than their binary value.
+    """
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, bool) or not isinstance(value, (str, int, decimal.Decimal)):
+        raise ValidationError(f"Param '{name}' must be a number.")
+
+    try:
+        number = decimal.Decimal(value)
+    except (decimal.InvalidOperation, ValueError):
+        raise ValidationError(f"Param '{name}' must be a number.")
+
+    if not number.is_finite():
+        raise ValidationError(f"Param '{name}' must be a number.")
+
+    return number
+
+
+def parse_amount(name: str, value) -> decimal.Decimal:
+    """Parse a payment amount to a Decimal quantized to cents, between 0.01 and 100000."""
+    amount = parse_decimal(name, value)
+    if amount > MAX_AMOUNT:
+        raise ValidationError(f"Param '{name}' must be less than or equal to 100000.")
+    if amount <= 0:
+        raise ValidationError(f"Param '{name}' must be greater than 0.")
+
+    amount = amount.quantize(CENT)
+    if amount < CENT:
+        raise ValidationError(f"Param '{name}' must be greater than 0.")
+
+    return amount
+
+
+def parse_invoice_id(name: str, value) -> uuid.UUID:
+    try:
+        return uuid.UUID(value) if isinstance(value, str) else uuid.UUID(str(value))
+    except ValueError:
+        raise ValidationError(f"Param '{name}' must be a valid invoice id.")
+
+
+# The payment payload items, (param, parser) in the order they are validated
+PAYMENT_ITEM_SCHEMA = (
+    ('invoice', parse_invoice_id),
+    ('amount', parse_amount),
+)
+
+
+def parse_payment_items(request_data, schema: tuple = PAYMENT_ITEM_SCHEMA) -> list:
+    """Validate a payments payload in a single pass and return a list of (invoice_id, amount) tuples.
+
+    request_data - a single {"invoice": UUID, "amount": number} dict or a list of them.
+    Each item is parsed straight to the values of its schema params, invoice ownership and balances
+    are checked by apply_payments() against the invoices it fetches.
+    """
+    # Wrap the payload in a list if we just got a single dict param
+    if isinstance(request_data, dict):
+        request_data = [request_data]
+
+    if not isinstance(request_data, list) or not request_data:
+        raise ValidationError('Expected a payment or a non-empty list of payments.')
+
+    items = []
+    for item in request_data:
+        if not isinstance(item, dict):
+            raise ValidationError('Expected a payment or a non-empty list of payments.')
+
+        values = []
+        for name, parse in schema:
+            if name not in item:
+                raise ValidationError(f"Param '{name}' is required.")
+            values.append(parse(name, item[name]))
+
+        items.append(tuple(values))
+
+    return items
+
+
+def check_balances(items: list, balances: dict):
+    """Check the (invoice_id, amount) items against the {invoice_id: balance} of the customer's invoices.
+
+    Raises NotFound for an invoice that is not in balances and ValidationError for an amount exceeding the balance
+    left by the previous items (several items may target the same invoice).
+    """
+    balances = dict(balances)
+    for invoice_id, amount in items:
+        balance = balances.get(invoice_id)
+        if balance is None:
+            raise NotFound(f'Invoice {invoice_id} not found.')
+
+        if amount > balance:
+            raise ValidationError(
+                f'Unable to apply a payment in the amount of {amount} to the invoice {invoice_id}. ' +
+                f'The payment amount exceeds the invoice balance of {balance} .'
+            )
+        balances[invoice_id] = balance - amount
+
+
+class BalancesNotCovered(Exception):
+    """An invoice of the payments is missing or its balance cannot cover them, see apply_payments()."""
+
+
+def apply_payments(customer: Customer, items: list, payment_id: uuid.UUID = None) -> list:
+    """Apply payments to a customer's invoices in a constant number of queries.
+
+    items - a list of (invoice_id, amount) tuples as returned by parse_payment_items().
+
+    The amounts are subtracted from the balances first, with a single conditional UPDATE
+    (Invoice.objects.decrement_balances()): the balances are never read in Python, and as the transaction writes
+    before it reads it waits for the database write lock (eg: SQLite's busy_timeout) instead of failing on a stale
+    read snapshot. The updated invoices are then fetched and the payments written with bulk_create.
+    Either all or none of the payments are applied.
+    Returns the list of created Payment objects (in payload order).
+    """
+    if payment_id is None:
+        payment_id = uuid.uuid4()
+
+    # Several items may pay the same invoice
+    amounts = {}
+    for invoice_id, amount in items:
+        amounts[invoice_id] = amounts.get(invoice_id, 0) + amount
+
+    try:
+        with transaction.atomic():
+            updated = Invoice.objects.filter(customer=customer).decrement_balances(amounts)
+            if updated != len(amounts):
+                # Undo the invoices that were updated
+                raise BalancesNotCovered()
+
+            invoices = {
+                invoice.invoice_id: invoice
+                for invoice in Invoice.objects.filter(customer=customer, invoice_id__in=list(amounts))
+            }
+            payments = [
+                Payment(
+                    customer=customer,
+                    invoice=invoices[invoice_id],
+                    payment_id=payment_id,
+                    amount=amount
+                )
+                for invoice_id, amount in items
+            ]
+
+            # bulk_create bypasses the Payment pre_save signal (update_invoice_balance),
+            # the balances have already been applied above.
+            Payment.objects.bulk_create(payments)
+            # The UPDATE does not send the Invoice post_save signal either
+            cache.invalidate(customer.pk)
+            # Every invoice had a balance (it covered a payment), the ones at 0 now were closed by this request
+            summary.payments_applied(
+                customer.pk,
+                payments,
+                closed=sum(1 for invoice in invoices.values() if invoice.balance == 0)
+            )
+    except BalancesNotCovered:
+        # Report the invoice that is missing or short
+        balances = Invoice.objects.filter(customer=customer, invoice_id__in=list(amounts)).values_list(
+            'invoice_id', 'balance'
+        )
+        check_balances(items, dict(balances))
+        # ... unless its balance changed since the UPDATE
+        raise ValidationError('The invoice balances changed while the payments were applied, try again.')
+
+    return payments
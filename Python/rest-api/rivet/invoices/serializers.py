@@ -1,7 +1,9 @@
+import decimal
+
 from rest_framework import serializers
 
-from django.contrib.auth.models import User
-from .models import Invoice, Payment
+from .encoders import INVOICE_ROW_FIELDS, PAYMENT_ROW_FIELDS, RowEncoder, customer_constants
+from .models import CustomerAccountSummary, Invoice, Payment, PaymentBatchJob
 
 
 class InvoiceSerializer(serializers.ModelSerializer):
@@ -53,35 +55,87 @@ class PaymentSerializer(serializers.ModelSerializer):
         ]
 
 
-class PaymentPostSerializer(serializers.ModelSerializer):
-    invoice = serializers.PrimaryKeyRelatedField(queryset=Invoice.objects.filter())
+class CustomerAccountSummarySerializer(serializers.ModelSerializer):
+    customer_full_name = serializers.CharField(source='customer.full_name', read_only=True)
+    customer_id = serializers.UUIDField(source='customer.customer_id', read_only=True)
 
     class Meta:
-        model = Payment
+        model = CustomerAccountSummary
         fields = [
-            'invoice',
-            'amount',
+            'customer_full_name',
+            'customer_id',
+            'total_billed',
+            'open_balance',
+            'open_invoices',
+            'last_payment',
+            'modified'
+        ]
+
+
+class PaymentBatchJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentBatchJob
+        fields = [
+            'job_id',
+            'payment_id',
+            'status',
+            'total',
+            'processed',
+            'error',
+            'created',
+            'started',
+            'finished'
         ]
 
-    def __init__(self, *args, **kwargs):
-        """Populate self.user = User from the Request instance passed in kwargs['context']."""
-        self.user: User = None
 
-        context: dict = kwargs.get('context')
-        if context:
-            request: 'Request' = context.get('request')
-            if hasattr(request, 'user') and isinstance(request.user, User):
-                self.user = request.user
-            if hasattr(request, '_user') and isinstance(request._user, User):
-                self.user = request._user
+class PaymentGroupSerializer(serializers.Serializer):
+    """A payment_id's totals, from the .values('payment_id').annotate(...) rows of PaymentGroupListView."""
+    payment_id = serializers.UUIDField()
+    total_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    invoice_count = serializers.IntegerField()
+    first_created = serializers.DateTimeField()
+    last_created = serializers.DateTimeField()
+
+
+class PaymentPostSerializer(serializers.Serializer):
+    """Describes a POST /api/payments/ payload item (eg: for the browsable API form).
+
+    Payloads are not validated with it, PaymentListView.post() parses them in a single pass with
+    invoices.payments.parse_payment_items() and checks the invoices in apply_payments().
+    """
+    invoice = serializers.UUIDField()
+    amount = serializers.DecimalField(
+        max_digits=8, decimal_places=2, min_value=decimal.Decimal('0.01'), max_value=decimal.Decimal('100000')
+    )
 
+
+class RowSerializer(serializers.BaseSerializer):
+    """Read-only serializer of queryset .values() rows for the list endpoints.
+
+    Renders the same fields as the matching ModelSerializer without per-row field introspection:
+    each row is encoded by a RowEncoder built once per response. Fetch the rows with
+    queryset.values(*serializer_class.get_lookups()) and pass the customer the rows belong to, eg:
+    InvoiceRowSerializer(rows, many=True, customer=customer).data
+    """
+    row_fields = ()
+
+    def __init__(self, *args, customer: 'Customer' = None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.encoder = RowEncoder(self.row_fields, constants=customer_constants(customer))
+
+    @classmethod
+    def get_lookups(cls) -> list:
+        return [lookup for _, lookup, _ in cls.row_fields]
+
+    def to_representation(self, row: dict) -> dict:
+        return self.encoder.encode_values(row)
+
 
-    def get_fields(self) -> list:
-        """Limit queryset results to Customer/User making the request."""
-        fields: list = super().get_fields()
+class InvoiceRowSerializer(RowSerializer):
+    """InvoiceSerializer fields (read-only) from .values() rows."""
+    row_fields = INVOICE_ROW_FIELDS
 
-        if self.user:
-            fields['invoice'].queryset = Invoice.objects.filter(customer__user=self.user)
 
-        return fields
+class PaymentRowSerializer(RowSerializer):
+    """PaymentSerializer fields from .values() rows."""
+    row_fields = PAYMENT_ROW_FIELDS
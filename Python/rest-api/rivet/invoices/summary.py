@@ -0,0 +1,180 @@
+"""Per customer account summaries (CustomerAccountSummary), maintained incrementally.
+
+Every code path changing invoices updates the customer's summary with a single UPDATE of the differences:
+the Invoice post_save/post_delete and Payment post_save signal handlers and apply_payments() (bulk payments).
+A missing summary is rebuilt from the invoices, rebuild() and verify() back the rebuild_account_summaries command.
+"""
+import decimal
+
+from django.db.models import Case, Count, DateTimeField, Exists, F, IntegerField, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from customers.models import Customer
+from . import models
+
+
+ZERO = decimal.Decimal('0.00')
+FIELDS = ('total_billed', 'open_balance', 'open_invoices', 'last_payment')
+
+
+def update(customer_pk: int, **changes):
+    """Update the summary of a customer with F() expressions, or build it if it does not exist yet.
+
+    Call it after the invoice changes were made (in the same transaction), so a rebuild includes them.
+    """
+    summaries = models.CustomerAccountSummary.objects.filter(customer_id=customer_pk)
+    if not summaries.update(modified=timezone.now(), **changes):
+        rebuild([customer_pk])
+
+
+def invoice_saved(invoice: 'Invoice', created: bool):
+    """Add the difference between the saved invoice and the invoice loaded from the database."""
+    loaded = getattr(invoice, '_loaded_values', {})
+    if not created and not {'amount', 'balance'} <= set(loaded):
+        # Unknown previous values (eg: the invoice was loaded with only())
+        rebuild([invoice.customer_id])
+    else:
+        amount = loaded.get('amount', ZERO)
+        balance = loaded.get('balance', ZERO)
+        was_open = not created and balance > 0
+
+        if created or invoice.amount != amount or invoice.balance != balance:
+            update(
+                invoice.customer_id,
+                total_billed=F('total_billed') + (invoice.amount - amount),
+                open_balance=F('open_balance') + (invoice.balance - balance),
+                open_invoices=F('open_invoices') + (int(invoice.balance > 0) - int(was_open)),
+            )
+
+    invoice._loaded_values = {'amount': invoice.amount, 'balance': invoice.balance}
+
+
+def invoice_deleted(invoice: 'Invoice'):
+    loaded = getattr(invoice, '_loaded_values', {})
+    amount = loaded.get('amount', invoice.amount)
+    balance = loaded.get('balance', invoice.balance)
+
+    update(
+        invoice.customer_id,
+        total_billed=F('total_billed') - amount,
+        open_balance=F('open_balance') - balance,
+        open_invoices=F('open_invoices') - int(balance > 0),
+    )
+
+
+def latest(field: str, value: 'datetime') -> Greatest:
+    """The later of a (nullable) datetime field and value."""
+    value = Value(value, output_field=DateTimeField())
+    return Greatest(Coalesce(field, value), value)
+
+
+def payment_applied(payment: 'Payment', amount: decimal.Decimal = None):
+    """Subtract a saved payment already applied to its invoice balance (Invoice.objects.decrement_balance()).
+
+    amount - the amount applied (default: payment.amount), negative when a payment saved again was lowered.
+    The invoice is counted as closed (or open again) in the same UPDATE from its current balance, so its balance
+    is never read.
+    """
+    if amount is None:
+        amount = payment.amount
+
+    if amount > 0:
+        # Closed if the balance is now 0
+        changed = Exists(models.Invoice.objects.filter(pk=payment.invoice_id, balance=0))
+        sign = -1
+    else:
+        # Open again if the balance was 0
+        changed = Exists(models.Invoice.objects.filter(pk=payment.invoice_id, balance=-amount))
+        sign = 1
+
+    update(
+        payment.customer_id,
+        open_balance=F('open_balance') - amount,
+        open_invoices=F('open_invoices') + sign * Case(When(changed, then=1), default=0, output_field=IntegerField()),
+        last_payment=latest('last_payment', payment.created),
+    )
+
+
+def payments_applied(customer_pk: int, payments: list, closed: int):
+    """Subtract payments saved and applied in bulk (apply_payments()), closed - number of invoices now paid."""
+    update(
+        customer_pk,
+        open_balance=F('open_balance') - sum(payment.amount for payment in payments),
+        open_invoices=F('open_invoices') - closed,
+        last_payment=latest('last_payment', max(payment.created for payment in payments)),
+    )
+
+
+def compute(customer_pks: list = None) -> dict:
+    """Compute the summaries from the invoices and payments, {customer pk: {field: value}}.
+
+    Two grouped aggregate queries, customers without invoices get zeros.
+    """
+    customers = Customer.objects.all()
+    invoices = models.Invoice.objects.order_by()
+    payments = models.Payment.objects.order_by()
+    if customer_pks is not None:
+        customers = customers.filter(pk__in=customer_pks)
+        invoices = invoices.filter(customer__in=customer_pks)
+        payments = payments.filter(customer__in=customer_pks)
+
+    summaries = {
+        pk: {'total_billed': ZERO, 'open_balance': ZERO, 'open_invoices': 0, 'last_payment': None}
+        for pk in customers.values_list('pk', flat=True)
+    }
+
+    totals = invoices.values('customer').annotate(
+        total_billed=Sum('amount'),
+        open_balance=Sum('balance'),
+        open_invoices=Count('pk', filter=Q(balance__gt=0)),
+    )
+    for row in totals:
+        summaries[row['customer']].update(
+            total_billed=row['total_billed'],
+            open_balance=row['open_balance'],
+            open_invoices=row['open_invoices'],
+        )
+
+    for row in payments.values('customer').annotate(last_payment=Max('created')):
+        summaries[row['customer']]['last_payment'] = row['last_payment']
+
+    return summaries
+
+
+def rebuild(customer_pks: list = None, batch_size: int = 1000) -> int:
+    """Recompute and upsert the summaries of some (default: all) customers, return the number of summaries."""
+    summaries = [
+        models.CustomerAccountSummary(customer_id=pk, **values) for pk, values in compute(customer_pks).items()
+    ]
+    models.CustomerAccountSummary.objects.bulk_create(
+        summaries,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['customer'],
+        update_fields=[*FIELDS, 'modified'],
+    )
+    return len(summaries)
+
+
+def verify(customer_pks: list = None) -> dict:
+    """Compare the summaries with the invoices, {customer pk: {field: (summary, expected)}} of the differences."""
+    summaries = models.CustomerAccountSummary.objects.all()
+    if customer_pks is not None:
+        summaries = summaries.filter(customer__in=customer_pks)
+    stored = {row['customer']: row for row in summaries.values('customer', *FIELDS)}
+
+    differences = {}
+    for pk, expected in compute(customer_pks).items():
+        summary = stored.get(pk)
+        if summary is None:
+            differences[pk] = {field: (None, value) for field, value in expected.items()}
+            continue
+
+        fields = {
+            field: (summary[field], value) for field, value in expected.items() if summary[field] != value
+        }
+        if fields:
+            differences[pk] = fields
+
+    return differences
@@ -0,0 +1,116 @@
+import os
+import json
+import tempfile
+
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+
+from customers.models import Customer
+from invoices import benchmark
+from invoices.models import Invoice, Payment
+
+
+class BenchmarkTests(TestCase):
+    def test_seed(self):
+        """Ensure seed_benchmark creates consistent customers, invoices and payments."""
+        call_command('seed_benchmark', customers=2, invoices=10, payments=4, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertEqual(Invoice.objects.count(), 20)
+        self.assertEqual(Payment.objects.count(), 8)
+        self.assertEqual(
+            Payment.objects.values('payment_id').distinct().count(),
+            4,
+            'Expected two invoices per payment_id.'
+        )
+
+        for payment in Payment.objects.select_related('invoice'):
+            self.assertEqual(payment.invoice.balance, payment.invoice.amount - payment.amount)
+
+    def test_run_benchmark(self):
+        """Ensure run_benchmark reports every scenario to the output file."""
+        benchmark.seed(customers=2, invoices=100, payments=100)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command('run_benchmark', requests=3, use_existing=True, output=output, stdout=open(os.devnull, 'w'))
+
+            with open(output) as f:
+                report = json.load(f)
+
+        self.assertEqual(set(report['results']), set(benchmark.SCENARIOS))
+        for name, result in report['results'].items():
+            self.assertEqual(result['requests'], 3, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'], name)
+            self.assertGreater(result['queries_per_request'], 0, name)
+
+    def test_run_serializers(self):
+        """Ensure run_serializers compares the model and row serializers on the same rows."""
+        benchmark.seed(customers=1, invoices=20, payments=20)
+
+        results = benchmark.run_serializers(rows=10, repeat=3)
+
+        self.assertEqual(set(results), set(benchmark.SERIALIZER_SCENARIOS))
+        for name, result in results.items():
+            self.assertEqual(result['rows'], 10, name)
+            self.assertGreater(result['rows_per_second'], 0, name)
+
+    def test_run_auth(self):
+        """Ensure run_auth sends the same requests with every authentication scenario."""
+        benchmark.seed(customers=1, invoices=5, payments=0)
+
+        results = benchmark.run_auth(requests=2)
+
+        self.assertEqual(set(results), set(benchmark.AUTH_SCENARIOS))
+        for name, result in results.items():
+            self.assertEqual(result['requests'], 2, name)
+            self.assertGreater(result['requests_per_cpu_second'], 0, name)
+        # The second request hits the caches
+        self.assertLess(results['basic-cached']['queries_per_request'], results['basic']['queries_per_request'])
+        self.assertLess(results['token-cached']['queries_per_request'], results['token']['queries_per_request'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 95), 95)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 99), 7)
+
+
+class ConnectionBenchmarkTests(TransactionTestCase):
+    def test_run_connections(self):
+        """Ensure run_connections times the same requests on new and persistent connections."""
+        # Committed (TransactionTestCase), so the new connections see the data
+        benchmark.seed(customers=1, invoices=10, payments=5)
+
+        results = benchmark.run_connections(requests=3, scenarios=['invoice-detail', 'account-summary'])
+
+        self.assertEqual(set(results), {'invoice-detail', 'account-summary'})
+        for name, result in results.items():
+            self.assertEqual(result['requests'], 3, name)
+            self.assertGreater(result['new_p50_ms'], 0, name)
+            self.assertGreater(result['persistent_p50_ms'], 0, name)
+
+        with self.assertRaises(ValueError):
+            benchmark.run_connections(requests=1, scenarios=['unknown'])
+
+    def test_run_sqlite_stress(self):
+        """Ensure run_sqlite_stress reads and writes copies of the database under both profiles."""
+        benchmark.seed(customers=1, invoices=10, payments=5)
+        balance = Invoice.objects.aggregate(balance=Sum('balance'))['balance']
+
+        results = benchmark.run_sqlite_stress(readers=2, writers=1, duration=0.2)
+
+        self.assertEqual(set(results), {'default', 'sqlite-pragmas'})
+        for name, result in results.items():
+            self.assertGreater(result['reads_per_second'], 0, name)
+            self.assertGreater(result['writes_per_second'], 0, name)
+            self.assertEqual(result['errors'], 0, name)
+
+        self.assertEqual(
+            Invoice.objects.aggregate(balance=Sum('balance'))['balance'],
+            balance,
+            'Expected the database to be left untouched.'
+        )
@@ -0,0 +1,136 @@
+import uuid
+
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices import cache
+from invoices.models import Invoice, Payment
+
+
+class InvoiceListCacheTests(APITestCase):
+    def setUp(self):
+        self.domain = 'http://localhost:8000'
+        self.user = User.objects.create(
+            username='customer',
+            password='password',
+            first_name='John',
+            last_name='Doe'
+        )
+        self.customer = Customer.objects.create(
+            user=self.user
+        )
+        for value in range(1, 16):
+            Invoice.objects.create(
+                customer=self.customer,
+                amount=value,
+                balance=value
+            )
+
+        self.client.force_authenticate(user=self.user)
+        cache.reset_stats()
+        self.addCleanup(cache.reset_stats)
+
+    def get(self, url: str) -> 'Response':
+        response = self.client.get(self.domain + url, format='json')
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+        return response
+
+    def test_hit_miss(self):
+        """Ensure repeated reads of a page are served from the cache."""
+        url = reverse('invoice-list')
+
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        expected = response.json()
+
+        with self.assertNumQueries(0):
+            # The validators are cached with the page
+            response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json(), expected)
+        self.assertIn('ETag', response)
+
+        # Conditional requests for a cached page
+        with self.assertNumQueries(0):
+            response = self.client.get(self.domain + url, format='json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED, 'Expected a 304 Not Modified.')
+
+        # Every page is cached on its own
+        response = self.get(url + '?page=2')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 5)
+
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 2})
+
+    def test_invalidation(self):
+        """Ensure changes to the customer invoices and name are never hidden by the cache."""
+        url = reverse('invoice-list')
+        invoice = Invoice.objects.filter(customer=self.customer).first()
+        self.get(url)
+
+        # Invoice PATCH
+        self.client.patch(
+            self.domain + reverse('invoice-detail', args=[invoice.invoice_id]),
+            {'balance': '1.00'},
+            format='json'
+        )
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['balance'], '1.00')
+
+        # Payments POST
+        self.client.post(
+            self.domain + reverse('payment-list'),
+            [{'invoice': str(invoice.invoice_id), 'amount': '1.00'}],
+            format='json'
+        )
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['balance'], '0.00')
+
+        # Payment saved through the model
+        other = Invoice.objects.filter(customer=self.customer)[1]
+        Payment.objects.create(customer=self.customer, invoice=other, payment_id=uuid.uuid4(), amount=1)
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][1]['balance'], str(other.balance))
+
+        # Customer name
+        self.user.first_name = 'Jane'
+        self.user.save()
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['customer_full_name'], 'Jane Doe')
+
+        # New invoice
+        Invoice.objects.create(customer=self.customer, amount=100, balance=100)
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 16)
+
+    def test_customers_do_not_share_pages(self):
+        url = reverse('invoice-list')
+        self.get(url)
+
+        user = User.objects.create(
+            username='other',
+            password='password',
+            first_name='Tom',
+            last_name='Waits'
+        )
+        Customer.objects.create(
+            user=user
+        )
+        self.client.force_authenticate(user=user)
+
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 0)
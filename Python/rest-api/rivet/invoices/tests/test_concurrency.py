@@ -0,0 +1,57 @@
+from django.test import TransactionTestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices import benchmark, summary
+from invoices.models import Invoice, Payment
+
+
+class ConcurrentPaymentTests(TransactionTestCase):
+    """Load test many clients POSTing payments to the same invoice at once (see invoices.benchmark.run_hot_invoice)."""
+    writers = 8
+    payments_per_writer = 10
+
+    def setUp(self):
+        user = User.objects.create(
+            username='customer',
+            password='password',
+            first_name='John',
+            last_name='Doe'
+        )
+        self.customer = Customer.objects.create(
+            user=user
+        )
+
+    def run_writers(self, balance: int) -> dict:
+        results = benchmark.run_hot_invoice(self.customer, self.writers, self.payments_per_writer, balance=balance)
+        self.assertEqual(results['errors'], 0, 'Expected every request to succeed without retries.')
+        self.assertGreater(results['payments_per_second'], 0, 'Expected the throughput to be measured.')
+        self.assertTrue(results['consistent'], 'Incorrect value for Invoice.balance.')
+        return results
+
+    def test_concurrent_payments(self):
+        """Ensure no payment is lost when many writers pay the same invoice."""
+        total = self.writers * self.payments_per_writer
+
+        results = self.run_writers(balance=total + 10)
+
+        invoice = Invoice.objects.get(invoice_id=results['invoice_id'])
+        self.assertEqual(results['applied'], total, 'Not all payments were applied.')
+        self.assertEqual(invoice.balance, 10, 'Incorrect value for Invoice.balance.')
+        self.assertEqual(Payment.objects.filter(invoice=invoice).count(), total, 'Incorrect number of payments.')
+        self.assertEqual(summary.verify(), {}, 'Incorrect account summary.')
+
+    def test_concurrent_payments_overdraw(self):
+        """Ensure concurrent writers can never take an invoice balance below zero."""
+        results = self.run_writers(balance=50)
+
+        invoice = Invoice.objects.get(invoice_id=results['invoice_id'])
+        self.assertEqual(results['applied'], 50, 'Incorrect number of payments applied.')
+        self.assertEqual(
+            results['rejected'],
+            self.writers * self.payments_per_writer - 50,
+            'Incorrect number of payments rejected.'
+        )
+        self.assertEqual(invoice.balance, 0, 'Incorrect value for Invoice.balance.')
+        self.assertEqual(Payment.objects.filter(invoice=invoice).count(), 50, 'Incorrect number of payments.')
+        self.assertEqual(summary.verify(), {}, 'Incorrect account summary.')
@@ -0,0 +1,91 @@
+import decimal
+
+from unittest import mock
+
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices.models import Invoice, Payment
+from invoices.pagination import PaymentGroupPagination
+from invoices.payments import apply_payments
+
+
+class PaymentGroupTests(APITestCase):
+    def setUp(self):
+        """Populate test database with two Customers with 5 invoices each, and payments of several invoices."""
+        self.domain = 'http://localhost:8000'
+        self.url = self.domain + reverse('payment-group-list')
+        self.customers = []
+        self.payment_ids = []
+        for username in ('bobdylan', 'tomwaits'):
+            user = User.objects.create(username=username, password='password', first_name='First', last_name='Last')
+            customer = Customer.objects.create(user=user)
+            invoices = [Invoice.objects.create(customer=customer, amount=100, balance=100) for _ in range(5)]
+            self.customers.append(customer)
+
+            # One payment per invoice count, the last one pays an invoice twice
+            for count in range(1, 6):
+                items = [(invoice.invoice_id, decimal.Decimal(count)) for invoice in invoices[:count]]
+                if count == 5:
+                    items.append((invoices[0].invoice_id, decimal.Decimal('0.5')))
+                payments = apply_payments(customer, items)
+                if customer == self.customers[0]:
+                    self.payment_ids.append(payments[0].payment_id)
+
+        self.client.force_authenticate(user=self.customers[0].user)
+
+    def test_get_payment_groups(self):
+        """Ensure GET retrieves one row per payment_id with its totals."""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful GET request.')
+        self.assertIsNone(response.data['next'])
+
+        groups = {group['payment_id']: group for group in response.data['results']}
+        self.assertEqual(set(groups), {str(payment_id) for payment_id in self.payment_ids}, 'Expected own payments only.')
+        self.assertEqual(
+            [group['payment_id'] for group in response.data['results']],
+            sorted(str(payment_id) for payment_id in self.payment_ids),
+            'Expected the groups in payment_id order.'
+        )
+
+        for count, payment_id in enumerate(self.payment_ids, start=1):
+            group = groups[str(payment_id)]
+            payments = Payment.objects.filter(payment_id=payment_id)
+            self.assertEqual(group['invoice_count'], count)
+            self.assertEqual(decimal.Decimal(group['total_amount']), sum(payment.amount for payment in payments))
+            created = [payment.created.isoformat().replace('+00:00', 'Z') for payment in payments]
+            self.assertEqual(group['first_created'], min(created))
+            self.assertEqual(group['last_created'], max(created))
+
+        self.assertEqual(decimal.Decimal(groups[str(self.payment_ids[4])]['total_amount']), decimal.Decimal('25.50'))
+
+    @mock.patch.object(PaymentGroupPagination, 'page_size', 2)
+    def test_get_payment_groups_cursor(self):
+        """Ensure the 'next' links walk all the groups once."""
+        payment_ids = []
+        url = self.url
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful GET request.')
+            self.assertLessEqual(len(response.data['results']), 2)
+            payment_ids += [group['payment_id'] for group in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(payment_ids, sorted(str(payment_id) for payment_id in self.payment_ids))
+
+        for cursor in ('abc', PaymentGroupPagination().encode_cursor(['notauuid'])):
+            response = self.client.get(self.url + '?cursor=' + cursor, format='json')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, 'Expected a failed GET request.')
+
+    def test_get_payment_groups_not_customer(self):
+        """Ensure users who are not customers cannot list payment groups."""
+        self.client.force_authenticate(user=User.objects.create(username='johnlennon', password='password'))
+
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN, 'Expected a failed GET request.')
@@ -0,0 +1,183 @@
+import os
+import uuid
+import datetime
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices import idempotency
+from invoices.models import IdempotencyKey, Invoice, Payment
+
+
+class IdempotencyKeyTests(APITestCase):
+    def setUp(self):
+        """Populate test database with two Customers with 3 invoices each."""
+        self.domain = 'http://localhost:8000'
+        self.url = self.domain + reverse('payment-list')
+        self.customers = []
+        for username in ('bobdylan', 'tomwaits'):
+            user = User.objects.create(username=username, password='password', first_name='First', last_name='Last')
+            customer = Customer.objects.create(user=user)
+            for _ in range(3):
+                Invoice.objects.create(customer=customer, amount=100, balance=100)
+            self.customers.append(customer)
+
+    def get_payload(self, customer: Customer, amount: int = 10) -> list:
+        return [
+            {'invoice': str(invoice_id), 'amount': amount}
+            for invoice_id in Invoice.objects.filter(customer=customer).values_list('invoice_id', flat=True)
+        ]
+
+    def post(self, customer: Customer, payload: list, key: str = None) -> 'Response':
+        # A fresh user every time, so nothing is cached between requests
+        self.client.force_authenticate(user=User.objects.get(pk=customer.user_id))
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key is not None else {}
+        return self.client.post(self.url, payload, format='json', **headers)
+
+    def test_replay(self):
+        """Ensure a request retried with the same key gets the original response and pays only once."""
+        customer = self.customers[0]
+        payload = self.get_payload(customer)
+
+        response = self.post(customer, payload, key='retry-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+        # customer, stored response
+        self.client.force_authenticate(user=User.objects.get(pk=customer.user_id))
+        with self.assertNumQueries(2):
+            replayed = self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        self.assertEqual(replayed.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.json(), response.json(), 'Expected the original response.')
+
+        self.assertEqual(Payment.objects.filter(customer=customer).count(), 3, 'Expected the payments once.')
+        for invoice in Invoice.objects.filter(customer=customer):
+            self.assertEqual(invoice.balance, 90, 'Expected the payments once.')
+
+        # A new key is a new payment
+        response = self.post(customer, payload, key='retry-2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+        self.assertEqual(Payment.objects.filter(customer=customer).count(), 6)
+
+        # Keys without a header are not stored
+        response = self.post(customer, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+        self.assertEqual(IdempotencyKey.objects.count(), 2)
+
+    def test_replay_skips_validation(self):
+        """Ensure a replay does not touch the invoices, even when the payload would not be valid anymore."""
+        customer = self.customers[0]
+        payload = self.get_payload(customer, amount=100)
+
+        response = self.post(customer, payload, key='full')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+
+        # The balances are 0 now, the same payload without a key fails
+        response = self.post(customer, payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+
+        response = self.post(customer, payload, key='full')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+
+    def test_key_mismatch(self):
+        """Ensure a key cannot be reused with a different payload."""
+        customer = self.customers[0]
+
+        response = self.post(customer, self.get_payload(customer, amount=10), key='mismatch')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+
+        response = self.post(customer, self.get_payload(customer, amount=20), key='mismatch')
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            'Expected a failed POST request.'
+        )
+        self.assertEqual(Payment.objects.filter(customer=customer).count(), 3)
+
+    def test_failed_request_not_stored(self):
+        """Ensure failed requests do not store their key, so they can be retried."""
+        customer = self.customers[0]
+        payload = self.get_payload(customer, amount=1000)
+
+        response = self.post(customer, payload, key='failed')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.post(customer, [{'invoice': str(uuid.uuid4()), 'amount': 1}], key='failed')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, 'Expected a failed POST request.')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.post(customer, self.get_payload(customer), key='failed')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+
+    def test_invalid_key(self):
+        customer = self.customers[0]
+        payload = self.get_payload(customer)
+
+        for key in ('', ' ', 'k' * 256):
+            response = self.post(customer, payload, key=key)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+
+        self.assertFalse(Payment.objects.exists())
+
+    def test_keys_per_customer(self):
+        """Ensure customers do not share keys."""
+        for customer in self.customers:
+            response = self.post(customer, self.get_payload(customer), key='shared')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+            self.assertFalse(response.has_header('Idempotent-Replayed'))
+            self.assertEqual(Payment.objects.filter(customer=customer).count(), 3)
+
+    def test_concurrent_key(self):
+        """Ensure a request losing the race on the unique key replays the winner's response and rolls back."""
+        customer = self.customers[0]
+        payload = self.get_payload(customer)
+
+        # The "winner" stored its response between our replay lookup and our insert
+        winner = self.post(customer, payload, key='race')
+        original_replay = idempotency.replay
+        responses = iter([None])
+
+        with mock.patch.object(idempotency, 'replay', side_effect=lambda *args: next(responses, None) or original_replay(*args)):
+            response = self.post(customer, payload, key='race')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+        self.assertEqual(response.json(), winner.json(), 'Expected the original response.')
+        self.assertEqual(Payment.objects.filter(customer=customer).count(), 3, 'Expected the payments once.')
+        for invoice in Invoice.objects.filter(customer=customer):
+            self.assertEqual(invoice.balance, 90, 'Expected the payments once.')
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=60)
+    def test_expired_key(self):
+        """Ensure expired keys are not replayed and are purged."""
+        customer = self.customers[0]
+        payload = self.get_payload(customer)
+
+        response = self.post(customer, payload, key='expired')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+        IdempotencyKey.objects.update(created=timezone.now() - datetime.timedelta(seconds=120))
+
+        response = self.post(customer, payload, key='expired')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Payment.objects.filter(customer=customer).count(), 6)
+
+        # 5 expired keys and a fresh one
+        IdempotencyKey.objects.filter(key='expired').delete()
+        for i in range(6):
+            IdempotencyKey.objects.create(customer=customer, key=f'key-{i}', request_hash='', status_code=201, response=[])
+        IdempotencyKey.objects.exclude(key='key-5').update(created=timezone.now() - datetime.timedelta(seconds=120))
+
+        self.assertEqual(idempotency.purge(batch_size=2, limit=3), 3)
+        call_command('purge_idempotency_keys', batch_size=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['key-5'])
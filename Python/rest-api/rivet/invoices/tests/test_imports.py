@@ -0,0 +1,179 @@
+import io
+import os
+import json
+import uuid
+import decimal
+import tempfile
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices import cache, imports, summary
+from invoices.models import Invoice
+
+
+class InvoiceImportTests(APITestCase):
+    def setUp(self):
+        """Populate test database with two Customers with 3 invoices each."""
+        self.domain = 'http://localhost:8000'
+        self.url = self.domain + reverse('invoice-import')
+        self.customers = []
+        for username in ('bobdylan', 'tomwaits'):
+            user = User.objects.create(username=username, password='password', first_name='First', last_name='Last')
+            customer = Customer.objects.create(user=user)
+            for amount in (10, 20, 30):
+                Invoice.objects.create(customer=customer, amount=amount, balance=amount)
+            self.customers.append(customer)
+
+        self.customer = self.customers[0]
+        self.invoice = Invoice.objects.filter(customer=self.customer).get(amount=10)
+        self.client.force_authenticate(user=self.customer.user)
+
+    def assertSummariesUpToDate(self):
+        self.assertEqual(summary.verify(), {}, 'Expected the account summaries to match the invoices.')
+
+    def test_import_invoices(self):
+        """Ensure POST creates new invoices and updates existing ones."""
+        new_invoice_id = uuid.uuid4()
+        payload = [
+            {'invoice_id': str(self.invoice.invoice_id), 'amount': '15.00', 'balance': '0'},
+            {'invoice_id': str(new_invoice_id), 'amount': 40, 'balance': 25.5},
+            {'amount': 50, 'balance': 50},
+        ]
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful POST request.')
+        self.assertEqual(response.data, {'created': 2, 'updated': 1, 'errors': []})
+
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.amount, decimal.Decimal('15.00'))
+        self.assertEqual(self.invoice.balance, 0)
+        self.assertEqual(Invoice.objects.get(invoice_id=new_invoice_id).balance, decimal.Decimal('25.50'))
+        self.assertEqual(Invoice.objects.filter(customer=self.customer).count(), 5)
+        self.assertSummariesUpToDate()
+
+        # Importing the same invoices again only updates them
+        response = self.client.post(self.url, payload[:2], format='json')
+        self.assertEqual(response.data, {'created': 0, 'updated': 2, 'errors': []})
+        self.assertSummariesUpToDate()
+
+    def test_import_errors(self):
+        """Ensure invalid rows and other customers' invoices are reported by index without stopping the import."""
+        other_invoice = Invoice.objects.filter(customer=self.customers[1]).first()
+        payload = [
+            {'amount': 10, 'balance': 20},
+            {'amount': 'abc', 'balance': 10},
+            {'invoice_id': 'abc', 'amount': 10, 'balance': 10},
+            {'balance': 10},
+            {'invoice_id': str(other_invoice.invoice_id), 'amount': 99, 'balance': 99},
+            {'invoice_id': str(self.invoice.invoice_id), 'amount': 12, 'balance': 12},
+            {'invoice_id': str(self.invoice.invoice_id), 'amount': 13, 'balance': 13},
+            'invoice',
+            {'amount': 60, 'balance': 60},
+        ]
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful POST request.')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 1, 2, 3, 4, 6, 7])
+        self.assertIn('cannot be greater than', response.data['errors'][0]['errors'][0])
+        self.assertIn('not found', response.data['errors'][4]['errors'][0])
+
+        amount = other_invoice.amount
+        other_invoice.refresh_from_db()
+        self.assertEqual(other_invoice.amount, amount, "Expected other customers' invoices to be left unchanged.")
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.amount, 12)
+        self.assertSummariesUpToDate()
+
+        for payload in ([], 'invoices', 10):
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+
+        # Nothing imported
+        payload = [
+            {'amount': 10, 'balance': 20},
+            {'invoice_id': str(other_invoice.invoice_id), 'amount': 9, 'balance': 9},
+        ]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+        self.assertEqual(response.data['created'] + response.data['updated'], 0)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 1])
+
+    def test_import_chunks(self):
+        """Ensure the rows are upserted chunk by chunk, a failing chunk does not stop the next ones."""
+        payload = [{'amount': amount, 'balance': amount} for amount in range(1, 8)]
+
+        # Per chunk: lock the existing invoices, upsert, update the summary (and the test transaction's savepoint)
+        with self.assertNumQueries(5 * 4):
+            result = imports.import_invoices(self.customer, payload, chunk_size=2)
+        self.assertEqual(result, {'created': 7, 'updated': 0, 'errors': []})
+
+        original_upsert_chunk = imports.upsert_chunk
+        chunks = iter([original_upsert_chunk, mock.Mock(side_effect=DatabaseError()), original_upsert_chunk])
+        with mock.patch.object(imports, 'upsert_chunk', side_effect=lambda *args: next(chunks)(*args)):
+            with self.assertLogs('invoices.imports', level='ERROR'):
+                result = imports.import_invoices(self.customer, payload[:6], chunk_size=2)
+
+        self.assertEqual(result['created'], 4)
+        self.assertEqual([error['index'] for error in result['errors']], [2, 3])
+        self.assertEqual(Invoice.objects.filter(customer=self.customer).count(), 3 + 7 + 4)
+        self.assertSummariesUpToDate()
+
+    def test_import_invalidates_cache(self):
+        """Ensure an import invalidates the customer's cached invoice list pages."""
+        with mock.patch.object(cache, 'invalidate') as invalidate:
+            imports.import_invoices(self.customer, [{'amount': 10, 'balance': 10}])
+        invalidate.assert_called_with(self.customer.pk)
+
+    def test_import_invoices_command(self):
+        """Ensure the command imports an export of the invoices, and reports the invalid rows."""
+        response = self.client.get(self.domain + reverse('invoice-export') + '?output=csv')
+        export = b''.join(response.streaming_content).decode('utf-8')
+        export += f'{self.customer.full_name},{self.customer.customer_id},,5,10,,\n'
+        export += f'{self.customer.full_name},{uuid.uuid4()},,5,5,,\n'
+        export += f'{self.customer.full_name},{self.customer.customer_id},,70,70,,\n'
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write(export.replace(',10.00,10.00,', ',10.00,5.00,'))
+        self.addCleanup(os.remove, file.name)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('import_invoices', file.name, '--chunk-size', '2', stdout=stdout, stderr=stderr)
+
+        self.assertIn('Created 1 invoices, updated 3 invoices', stdout.getvalue())
+        self.assertIn('Row 4:', stderr.getvalue())
+        self.assertIn('Row 5: Customer', stderr.getvalue())
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.balance, 5)
+        self.assertSummariesUpToDate()
+
+        # NDJSON rows of the customer given on the command line
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as file:
+            file.write(json.dumps({'invoice_id': str(self.invoice.invoice_id), 'amount': 10, 'balance': 0}) + '\n')
+        self.addCleanup(os.remove, file.name)
+
+        with self.assertRaises(CommandError):
+            call_command('import_invoices', file.name, stdout=stdout, stderr=stderr)
+        self.assertIn('(or pass --customer)', stderr.getvalue())
+
+        call_command(
+            'import_invoices', file.name, '--customer', str(self.customer.customer_id), stdout=stdout, stderr=stderr
+        )
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.balance, 0)
+
+        for chunk_size in ('0', '-1'):
+            with self.assertRaisesMessage(CommandError, '--chunk-size must be greater than 0'):
+                call_command('import_invoices', file.name, '--chunk-size', chunk_size, stdout=stdout, stderr=stderr)
@@ -0,0 +1,109 @@
+import uuid
+import unittest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices.models import Invoice, Payment
+from invoices.pagination import PaymentGroupPagination
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific.')
+class QueryPlanTests(APITestCase):
+    """Ensure no list or detail endpoint falls back to a table scan on a large dataset."""
+    customers = 5
+    invoices_per_customer = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        """Seed customers with many invoices and payments (two invoices per payment_id)."""
+        for i in range(cls.customers):
+            user = User.objects.create(
+                username=f'customer{i}',
+                password='password',
+                first_name='First',
+                last_name=f'Last{i}'
+            )
+            customer = Customer.objects.create(
+                user=user
+            )
+            invoices = Invoice.objects.bulk_create([
+                Invoice(customer=customer, amount=100, balance=50)
+                for _ in range(cls.invoices_per_customer)
+            ])
+            payment_ids = [uuid.uuid4() for _ in range(len(invoices) // 2)]
+            Payment.objects.bulk_create([
+                Payment(customer=customer, invoice=invoice, payment_id=payment_ids[j // 2], amount=50)
+                for j, invoice in enumerate(invoices)
+            ])
+
+        # Let the query planner know about the data distribution
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_query_plans(self, url: str) -> list:
+        """GET url and return the EXPLAIN QUERY PLAN lines of every invoices/payments query it ran."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, format='json')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                if 'invoices_' not in sql or not sql.startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+
+        self.assertTrue(plans, 'Expected queries on the invoices tables.')
+        return plans
+
+    def assertNoTableScan(self, url: str):
+        for sql, plan in self.get_query_plans(url):
+            for line in plan:
+                self.assertFalse(
+                    line.startswith('SCAN'),
+                    f'Table scan in the query plan of {url}:\n{sql}\n' + '\n'.join(plan)
+                )
+
+    def test_query_plans(self):
+        user = User.objects.get(username='customer0')
+        customer = Customer.objects.get(user=user)
+        invoice, other_invoice = Invoice.objects.filter(customer=customer)[:2]
+        payment = Payment.objects.filter(customer=customer).first()
+        cursor = PaymentGroupPagination().encode_cursor([payment.payment_id])
+
+        self.client.force_authenticate(user=user)
+
+        urls = [
+            reverse('invoice-list'),
+            reverse('invoice-list') + '?page=10',
+            reverse('invoice-list') + '?pagination=cursor',
+            reverse('invoice-detail', args=[invoice.invoice_id]),
+            reverse('payment-list'),
+            reverse('payment-list') + '?page=10',
+            reverse('payment-list') + '?pagination=cursor',
+            reverse('payment-list') + f'?invoice={invoice.invoice_id}',
+            reverse('payment-list') + '?amount_gte=10&amount_lte=60',
+            reverse('payment-list') + f'?invoice={invoice.invoice_id},{other_invoice.invoice_id}',
+            reverse('payment-list') + '?created_gte=2023-03-01&created_lte=2023-03-31',
+            reverse('payment-list') + f'?invoice={invoice.invoice_id}&created_gte=2023-03-01&amount_gte=10',
+            reverse('payment-detail', args=[payment.payment_id]),
+            reverse('payment-group-list'),
+            reverse('payment-group-list') + f'?cursor={cursor}',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNoTableScan(url)
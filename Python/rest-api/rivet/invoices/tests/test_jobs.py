@@ -0,0 +1,206 @@
+import os
+import uuid
+import datetime
+from decimal import Decimal
+
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices import jobs, summary
+from invoices.models import Invoice, Payment, PaymentBatchJob
+from invoices.payments import apply_payments
+
+
+class PaymentBatchJobTests(APITestCase):
+    def setUp(self):
+        """Populate test database with two Customers with 5 invoices each."""
+        self.domain = 'http://localhost:8000'
+        self.url = self.domain + reverse('payment-list') + '?mode=async'
+        self.customers = []
+        for username in ('bobdylan', 'tomwaits'):
+            user = User.objects.create(username=username, password='password', first_name='First', last_name='Last')
+            customer = Customer.objects.create(user=user)
+            for _ in range(5):
+                Invoice.objects.create(customer=customer, amount=100, balance=100)
+            self.customers.append(customer)
+
+        self.customer = self.customers[0]
+        self.invoice_ids = [
+            str(invoice_id) for invoice_id in Invoice.objects.filter(customer=self.customer).values_list('invoice_id', flat=True)
+        ]
+        self.client.force_authenticate(user=self.customer.user)
+
+    def post(self, payload: list, **headers) -> 'Response':
+        return self.client.post(self.url, payload, format='json', **headers)
+
+    def run_worker(self, **options):
+        call_command('run_payment_worker', burst=True, stdout=open(os.devnull, 'w'), **options)
+
+    def test_async_post(self):
+        """Ensure an async POST stores a job applied by the worker in chunks, and reports its progress."""
+        payload = [{'invoice': invoice_id, 'amount': 10} for invoice_id in self.invoice_ids]
+        payload.append({'invoice': self.invoice_ids[0], 'amount': '0.5'})
+
+        response = self.post(payload)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, 'Expected an accepted POST request.')
+        self.assertEqual(response.data['status'], PaymentBatchJob.PENDING)
+        self.assertEqual(response.data['total'], 6)
+        self.assertEqual(response.data['processed'], 0)
+        self.assertFalse(Payment.objects.exists(), 'Expected the payments to be applied by the worker.')
+
+        url = self.domain + response['Location']
+        self.assertEqual(url, self.domain + reverse('payment-job-detail', args=[response.data['job_id']]))
+
+        self.run_worker(chunk_size=4)
+
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful GET request.')
+        self.assertEqual(response.data['status'], PaymentBatchJob.SUCCEEDED)
+        self.assertEqual(response.data['processed'], 6)
+        self.assertIsNotNone(response.data['finished'])
+
+        payments = Payment.objects.filter(customer=self.customer)
+        self.assertEqual(payments.count(), 6)
+        self.assertEqual(set(payments.values_list('payment_id', flat=True)), {uuid.UUID(response.data['payment_id'])})
+        self.assertEqual(Invoice.objects.get(invoice_id=self.invoice_ids[0]).balance, Decimal('89.50'))
+        self.assertEqual(summary.verify(), {})
+
+    def test_failed_chunk(self):
+        """Ensure a chunk exceeding a balance fails the job and leaves the chunks before it applied."""
+        payload = [{'invoice': invoice_id, 'amount': 60} for invoice_id in self.invoice_ids]
+
+        response = self.post(payload)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, 'Expected an accepted POST request.')
+
+        # A payment made after the job was submitted
+        apply_payments(self.customer, [(uuid.UUID(self.invoice_ids[4]), Decimal(60))])
+
+        self.run_worker(chunk_size=2)
+
+        job = PaymentBatchJob.objects.get(job_id=response.data['job_id'])
+        self.assertEqual(job.status, PaymentBatchJob.FAILED)
+        self.assertEqual(job.processed, 4)
+        self.assertIn('exceeds the invoice balance', job.error)
+        self.assertIn('The first 4 payments were applied', job.error)
+        self.assertEqual(Payment.objects.filter(customer=self.customer, payment_id=job.payment_id).count(), 4)
+        self.assertEqual(Invoice.objects.get(invoice_id=self.invoice_ids[4]).balance, 40)
+        self.assertEqual(summary.verify(), {})
+
+    def test_invalid_chunk_size(self):
+        """Ensure a chunk size below 1 is rejected before any job is claimed."""
+        response = self.post([{'invoice': self.invoice_ids[0], 'amount': 10}])
+
+        for chunk_size in (0, -1):
+            with self.assertRaisesMessage(CommandError, '--chunk-size must be greater than 0'):
+                self.run_worker(chunk_size=chunk_size)
+            with self.assertRaises(ValueError):
+                jobs.work(chunk_size=chunk_size, burst=True)
+
+        job = PaymentBatchJob.objects.get(job_id=response.data['job_id'])
+        self.assertEqual(job.status, PaymentBatchJob.PENDING)
+
+        with self.assertRaises(ValueError):
+            jobs.run_job(job, chunk_size=-1)
+        self.assertEqual(job.processed, 0)
+
+    def test_invalid_payload(self):
+        """Ensure invalid payloads and other customers' invoices are rejected before a job is stored."""
+        response = self.post([{'invoice': self.invoice_ids[0], 'amount': -1}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+
+        # Payloads the synchronous POST rejects, exceeding a balance alone or together
+        for payload in (
+            [{'invoice': self.invoice_ids[0], 'amount': 101}],
+            [{'invoice': self.invoice_ids[0], 'amount': 60}, {'invoice': self.invoice_ids[0], 'amount': 60}],
+        ):
+            response = self.post(payload)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+            self.assertIn('exceeds the invoice balance', response.data[0])
+
+        other_invoice = Invoice.objects.filter(customer=self.customers[1]).first()
+        response = self.post([{'invoice': str(other_invoice.invoice_id), 'amount': 1}])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, 'Expected a failed POST request.')
+
+        response = self.client.post(
+            self.domain + reverse('payment-list') + '?mode=later',
+            [{'invoice': self.invoice_ids[0], 'amount': 1}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+
+        self.assertFalse(PaymentBatchJob.objects.exists())
+
+    def test_job_per_customer(self):
+        """Ensure customers only see their own jobs."""
+        response = self.post([{'invoice': self.invoice_ids[0], 'amount': 1}])
+        url = self.domain + response['Location']
+
+        self.client.force_authenticate(user=self.customers[1].user)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, 'Expected a failed GET request.')
+
+        response = self.client.get(self.domain + reverse('payment-job-detail', args=[uuid.uuid4()]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, 'Expected a failed GET request.')
+
+    def test_idempotency_key(self):
+        """Ensure a retried async POST gets the original job back, with the Location of the job."""
+        payload = [{'invoice': self.invoice_ids[0], 'amount': 1}]
+
+        response = self.post(payload, HTTP_IDEMPOTENCY_KEY='job-1')
+        replayed = self.post(payload, HTTP_IDEMPOTENCY_KEY='job-1')
+
+        self.assertEqual(replayed.status_code, status.HTTP_202_ACCEPTED, 'Expected an accepted POST request.')
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.json(), response.json(), 'Expected the original response.')
+        self.assertEqual(replayed['Location'], response['Location'], 'Expected the Location of the original job.')
+
+        response = self.client.get(self.domain + replayed['Location'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful GET request.')
+        self.assertEqual(PaymentBatchJob.objects.count(), 1)
+
+    @override_settings(PAYMENT_BATCH_JOB_TIMEOUT=60)
+    def test_abandoned_job(self):
+        """Ensure a running job without progress is claimed again and resumes after its last chunk."""
+        payload = [{'invoice': invoice_id, 'amount': 10} for invoice_id in self.invoice_ids]
+        response = self.post(payload)
+
+        job = jobs.claim()
+        self.assertEqual(str(job.job_id), response.data['job_id'])
+        self.assertIsNone(jobs.claim(), 'Expected a running job not to be claimed twice.')
+
+        # The worker applied a first chunk and died
+        items = [(uuid.UUID(invoice_id), Decimal(amount)) for invoice_id, amount in job.items[:2]]
+        apply_payments(self.customer, items, payment_id=job.payment_id)
+        PaymentBatchJob.objects.filter(pk=job.pk).update(
+            processed=2, modified=timezone.now() - datetime.timedelta(seconds=120)
+        )
+
+        self.assertEqual(jobs.work(burst=True, chunk_size=2), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, PaymentBatchJob.SUCCEEDED)
+        self.assertEqual(job.processed, 5)
+        self.assertEqual(Payment.objects.filter(customer=self.customer).count(), 5)
+        for invoice in Invoice.objects.filter(customer=self.customer):
+            self.assertEqual(invoice.balance, 90, 'Expected every payment once.')
+
+    def test_taken_over(self):
+        """Ensure a worker does not apply a chunk another worker already applied."""
+        payload = [{'invoice': invoice_id, 'amount': 10} for invoice_id in self.invoice_ids]
+        self.post(payload)
+        job = jobs.claim()
+
+        # Another worker took the job over and applied the first chunk
+        PaymentBatchJob.objects.filter(pk=job.pk).update(processed=2)
+
+        with self.assertLogs('invoices.jobs', level='WARNING'):
+            jobs.run_job(job, chunk_size=2)
+
+        self.assertFalse(Payment.objects.exists(), 'Expected the chunk to be rolled back.')
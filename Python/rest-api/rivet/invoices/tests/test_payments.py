@@ -0,0 +1,77 @@
+import uuid
+import decimal
+
+from django.test import SimpleTestCase
+
+from rest_framework.exceptions import ValidationError
+
+from invoices.payments import parse_payment_items
+
+
+class ParsePaymentItemsTests(SimpleTestCase):
+    def test_parse(self):
+        """Ensure items are parsed to (UUID, quantized Decimal) tuples in payload order."""
+        invoice_ids = [uuid.uuid4() for _ in range(4)]
+        payload = [
+            {'invoice': str(invoice_ids[0]), 'amount': 50},
+            {'invoice': str(invoice_ids[1]), 'amount': '10.5'},
+            {'invoice': str(invoice_ids[2]), 'amount': 0.1},
+            {'invoice': invoice_ids[3], 'amount': 100000},
+        ]
+
+        self.assertEqual(
+            parse_payment_items(payload),
+            [
+                (invoice_ids[0], decimal.Decimal('50.00')),
+                (invoice_ids[1], decimal.Decimal('10.50')),
+                (invoice_ids[2], decimal.Decimal('0.10')),
+                (invoice_ids[3], decimal.Decimal('100000.00')),
+            ]
+        )
+        # A single payment
+        self.assertEqual(
+            parse_payment_items({'invoice': str(invoice_ids[0]), 'amount': '1'}),
+            [(invoice_ids[0], decimal.Decimal('1.00'))]
+        )
+
+    def test_float_amounts(self):
+        """Ensure JSON floats are read from their shortest repr, not their binary value."""
+        invoice_id = str(uuid.uuid4())
+
+        # Decimal(2.675) == 2.67499999999999982236431605997495353221893310546875
+        items = parse_payment_items({'invoice': invoice_id, 'amount': 2.675})
+        self.assertEqual(items[0][1], decimal.Decimal('2.675').quantize(decimal.Decimal('0.01')))
+        self.assertEqual(str(items[0][1]), '2.68')
+
+    def test_invalid(self):
+        """Ensure every invalid payload is rejected with a ValidationError (never a server error)."""
+        invoice_id = str(uuid.uuid4())
+        payloads = [
+            None,
+            [],
+            'payment',
+            ['payment'],
+            {'amount': 1},
+            {'invoice': invoice_id},
+            {'invoice': 'not-a-uuid', 'amount': 1},
+            {'invoice': 12, 'amount': 1},
+            {'invoice': invoice_id, 'amount': 'abc'},
+            {'invoice': invoice_id, 'amount': None},
+            {'invoice': invoice_id, 'amount': True},
+            {'invoice': invoice_id, 'amount': [1]},
+            {'invoice': invoice_id, 'amount': 'NaN'},
+            {'invoice': invoice_id, 'amount': 'Infinity'},
+            {'invoice': invoice_id, 'amount': '-1e30'},
+            {'invoice': invoice_id, 'amount': '1e30'},
+            {'invoice': invoice_id, 'amount': 0},
+            {'invoice': invoice_id, 'amount': '0.004'},
+            {'invoice': invoice_id, 'amount': -5},
+            {'invoice': invoice_id, 'amount': '100000.01'},
+            # A valid item does not make up for an invalid one
+            [{'invoice': invoice_id, 'amount': 1}, {'invoice': invoice_id, 'amount': -1}],
+        ]
+
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                with self.assertRaises(ValidationError):
+                    parse_payment_items(payload)
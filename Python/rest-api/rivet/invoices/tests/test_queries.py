@@ -0,0 +1,210 @@
+import uuid
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.cache import customer_cache, token_cache
+from customers.models import Customer
+from invoices.models import Invoice, Payment
+
+
+class QueryCountTests(APITestCase):
+    """Ensure the number of queries per request does not depend on the number of rows returned."""
+
+    def setUp(self):
+        """Populate test database with one Customer with a single invoice/payment and one with many."""
+        self.domain = 'http://localhost:8000'
+        self.persons = [
+            {
+                'username': 'bobdylan',
+                'first_name': 'Bob',
+                'last_name': 'Dylan',
+                'invoices': 1
+            },
+            {
+                'username': 'tomwaits',
+                'first_name': 'Tom',
+                'last_name': 'Waits',
+                'invoices': 25
+            }
+        ]
+
+        for person in self.persons:
+            user = User.objects.create(
+                username=person['username'],
+                password='password',
+                first_name=person['first_name'],
+                last_name=person['last_name']
+            )
+            customer = Customer.objects.create(
+                user=user
+            )
+            payment_id = uuid.uuid4()
+            for _ in range(person['invoices']):
+                invoice = Invoice.objects.create(
+                    customer=customer,
+                    amount=100,
+                    balance=100
+                )
+                Payment.objects.create(
+                    customer=customer,
+                    invoice=invoice,
+                    payment_id=payment_id,
+                    amount=10
+                )
+            person['payment_id'] = payment_id
+
+    def assertQueriesPerPerson(self, num: int, get_url):
+        """Ensure a GET request to get_url(person) runs num queries for every person."""
+        for person in self.persons:
+            user = User.objects.get(username=person['username'])
+            self.client.force_authenticate(user=user)
+
+            url = self.domain + get_url(person)
+            with self.assertNumQueries(num):
+                response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+
+    def test_invoice_list_queries(self):
+        """customer, validators, count, page."""
+        self.assertQueriesPerPerson(4, lambda person: reverse('invoice-list'))
+
+    def test_invoice_list_cursor_queries(self):
+        """customer, validators, page."""
+        self.assertQueriesPerPerson(3, lambda person: reverse('invoice-list') + '?pagination=cursor')
+
+    def test_invoice_detail_queries(self):
+        """customer, validators, invoice."""
+        def get_url(person):
+            invoice = Invoice.objects.filter(customer__user__username=person['username']).first()
+            return reverse('invoice-detail', args=[invoice.invoice_id])
+
+        self.assertQueriesPerPerson(3, get_url)
+
+    def test_payment_list_queries(self):
+        """customer, validators, count, page."""
+        self.assertQueriesPerPerson(4, lambda person: reverse('payment-list'))
+
+    def test_payment_list_cursor_queries(self):
+        """customer, validators, page."""
+        self.assertQueriesPerPerson(3, lambda person: reverse('payment-list') + '?pagination=cursor')
+
+    def test_payment_detail_queries(self):
+        """customer, validators, payments."""
+        self.assertQueriesPerPerson(
+            3,
+            lambda person: reverse('payment-detail', args=[person['payment_id']])
+        )
+
+    @override_settings(TOKEN_CACHE_TTL=0)
+    def test_token_authentication_queries(self):
+        """token, user and customer (one query), validators, count, page."""
+        for person in self.persons:
+            token = Token.objects.get(user__username=person['username'])
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+            url = self.domain + reverse('invoice-list')
+            with self.assertNumQueries(4):
+                response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+
+    @override_settings(TOKEN_CACHE_TTL=60)
+    def test_token_cache_queries(self):
+        """Ensure requests authenticated with a cached token run no authentication query: validators, count, page."""
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+        for person in self.persons:
+            token = Token.objects.get(user__username=person['username'])
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+            url = self.domain + reverse('payment-list')
+            self.client.get(url, format='json')
+            with self.assertNumQueries(3):
+                response = self.client.get(url, format='json')
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful GET request.')
+
+    @override_settings(CUSTOMER_CACHE_TTL=60)
+    def test_customer_cache_queries(self):
+        """Ensure get_customer() only queries the database on a cache miss."""
+        from invoices.views import get_customer
+
+        customer_cache.clear()
+        self.addCleanup(customer_cache.clear)
+
+        username = self.persons[0]['username']
+        user = User.objects.get(username=username)
+        with self.assertNumQueries(1):
+            customer = get_customer(user)
+
+        user = User.objects.get(username=username)
+        with self.assertNumQueries(0):
+            cached = get_customer(user)
+            self.assertEqual(cached.user, user, 'Customer.user must be the requesting User.')
+            # Resolved once, then cached on the User
+            self.assertIs(get_customer(user), cached)
+
+        self.assertEqual(cached.pk, customer.pk)
+        self.assertEqual(cached.customer_id, customer.customer_id)
+
+        # Saving the Customer invalidates the cache
+        customer.save()
+        user = User.objects.get(username=username)
+        with self.assertNumQueries(1):
+            get_customer(user)
+
+    def test_reads_do_not_join_users(self):
+        """Ensure invoice and payment reads take the customer name from Customer.name, not auth_user."""
+        person = self.persons[1]
+        invoice = Invoice.objects.filter(customer__user__username=person['username']).first()
+        urls = [
+            reverse('invoice-list'),
+            reverse('invoice-list') + '?pagination=cursor',
+            reverse('invoice-detail', args=[invoice.invoice_id]),
+            reverse('payment-list'),
+            reverse('payment-detail', args=[person['payment_id']]),
+        ]
+
+        for url in urls:
+            self.client.force_authenticate(user=User.objects.get(username=person['username']))
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(self.domain + url, format='json')
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful GET request.')
+            data = response.data['results'][0] if 'results' in response.data else response.data
+            self.assertEqual(data['customer_full_name'], 'Tom Waits', 'Incorrect value for customer_full_name.')
+            for query in captured:
+                self.assertNotIn('auth_user', query['sql'], url)
+
+    def test_not_modified_queries(self):
+        """customer, validators: a 304 is answered without paginating or serializing."""
+        user = User.objects.get(username=self.persons[1]['username'])
+
+        # The invoice list pages are cached with their validators: customer only
+        for url, queries in ((reverse('invoice-list'), 1), (reverse('payment-list'), 2)):
+            self.client.force_authenticate(user=user)
+            etag = self.client.get(self.domain + url, format='json')['ETag']
+
+            self.client.force_authenticate(user=User.objects.get(pk=user.pk))
+            with self.assertNumQueries(queries):
+                response = self.client.get(self.domain + url, format='json', HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
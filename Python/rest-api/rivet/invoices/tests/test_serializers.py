@@ -0,0 +1,59 @@
+import uuid
+import decimal
+import datetime
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.renderers import JSONRenderer
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices.models import Invoice, Payment
+from invoices.serializers import InvoiceRowSerializer, InvoiceSerializer, PaymentRowSerializer, PaymentSerializer
+
+
+class RowSerializerTests(TestCase):
+    """Ensure the .values() row serializers render the same JSON bytes as the ModelSerializers."""
+
+    def setUp(self):
+        user = User.objects.create(username='bjork', password='password', first_name='Björk', last_name='Guðmundsdóttir')
+        self.customer = Customer.objects.create(user=user)
+
+        amounts = [decimal.Decimal(amount) for amount in ('0.01', '1', '10.5', '99.99', '1234.56', '100000')]
+        for amount in amounts:
+            invoice = Invoice.objects.create(customer=self.customer, amount=amount, balance=amount)
+            Payment.objects.create(customer=self.customer, invoice=invoice, payment_id=uuid.uuid4(), amount=decimal.Decimal('0.01'))
+
+        # Timestamps with and without microseconds
+        Invoice.objects.filter(amount=1).update(created=datetime.datetime(2023, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc))
+        Payment.objects.filter(invoice__amount=1).update(
+            modified=datetime.datetime(2023, 6, 30, 23, 59, 59, 999999, tzinfo=datetime.timezone.utc)
+        )
+
+    def assertSameJSON(self, serializer_class, row_serializer_class, queryset):
+        renderer = JSONRenderer()
+        expected = renderer.render(serializer_class(queryset, many=True).data)
+        rows = queryset.values('id', *row_serializer_class.get_lookups())
+        rendered = renderer.render(row_serializer_class(rows, many=True, customer=self.customer).data)
+
+        self.assertEqual(rendered, expected, 'Expected byte-identical JSON.')
+
+    def test_invoice_rows(self):
+        self.assertSameJSON(InvoiceSerializer, InvoiceRowSerializer, Invoice.objects.filter(customer=self.customer))
+
+    def test_payment_rows(self):
+        self.assertSameJSON(PaymentSerializer, PaymentRowSerializer, Payment.objects.filter(customer=self.customer))
+
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_time_zone(self):
+        """Ensure datetimes are converted to the current time zone like DRF does."""
+        with timezone.override('America/New_York'):
+            self.assertSameJSON(InvoiceSerializer, InvoiceRowSerializer, Invoice.objects.filter(customer=self.customer))
+            self.assertSameJSON(PaymentSerializer, PaymentRowSerializer, Payment.objects.filter(customer=self.customer))
+
+    def test_single_row(self):
+        invoice = Invoice.objects.filter(customer=self.customer).first()
+        row = Invoice.objects.filter(pk=invoice.pk).values(*InvoiceRowSerializer.get_lookups()).get()
+
+        self.assertEqual(InvoiceRowSerializer(row, customer=self.customer).data, InvoiceSerializer(invoice).data)
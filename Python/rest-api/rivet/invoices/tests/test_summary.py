@@ -0,0 +1,209 @@
+import os
+import uuid
+import decimal
+
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices import summary
+from invoices.models import CustomerAccountSummary, Invoice, Payment
+
+
+class AccountSummaryTests(APITestCase):
+    def setUp(self):
+        """Populate test database with two Customers with 5 invoices each."""
+        self.domain = 'http://localhost:8000'
+        self.customers = []
+        for username in ('bobdylan', 'tomwaits'):
+            user = User.objects.create(username=username, password='password', first_name='First', last_name='Last')
+            customer = Customer.objects.create(user=user)
+            for amount in (10, 20, 30, 40, 50):
+                Invoice.objects.create(customer=customer, amount=amount, balance=amount)
+            self.customers.append(customer)
+
+    def assertSummariesUpToDate(self):
+        self.assertEqual(summary.verify(), {}, 'Expected the account summaries to match the invoices.')
+
+    def get_summary(self, customer: Customer) -> CustomerAccountSummary:
+        return CustomerAccountSummary.objects.get(customer=customer)
+
+    def test_invoices(self):
+        """Ensure creating, updating and deleting invoices maintains the summary."""
+        customer = self.customers[0]
+        account_summary = self.get_summary(customer)
+        self.assertEqual(account_summary.total_billed, 150)
+        self.assertEqual(account_summary.open_balance, 150)
+        self.assertEqual(account_summary.open_invoices, 5)
+        self.assertIsNone(account_summary.last_payment)
+
+        invoice = Invoice.objects.filter(customer=customer).get(amount=10)
+        invoice.balance = 0
+        invoice.save()
+        self.assertEqual(self.get_summary(customer).open_invoices, 4)
+
+        # Saving an invoice loaded before the previous save
+        invoice.amount = 15
+        invoice.save()
+        self.assertEqual(self.get_summary(customer).total_billed, 155)
+        self.assertSummariesUpToDate()
+
+        invoice.delete()
+        Invoice.objects.filter(customer=customer).get(amount=20).delete()
+        account_summary = self.get_summary(customer)
+        self.assertEqual(account_summary.total_billed, 120)
+        self.assertEqual(account_summary.open_invoices, 3)
+        self.assertSummariesUpToDate()
+
+        # Invoices loaded without their amount/balance
+        invoice = Invoice.objects.filter(customer=customer).only('id', 'customer', 'invoice_id').get(amount=30)
+        invoice.balance = 5
+        invoice.save(update_fields=['balance'])
+        self.assertSummariesUpToDate()
+
+    def test_payments(self):
+        """Ensure payments applied one at a time (signal) and in bulk (POST) maintain the summary."""
+        customer = self.customers[0]
+        invoices = {invoice.amount: invoice for invoice in Invoice.objects.filter(customer=customer)}
+
+        payment = Payment.objects.create(customer=customer, invoice=invoices[10], payment_id=uuid.uuid4(), amount=10)
+        account_summary = self.get_summary(customer)
+        self.assertEqual(account_summary.open_balance, 140)
+        self.assertEqual(account_summary.open_invoices, 4)
+        self.assertEqual(account_summary.last_payment, payment.created)
+
+        Payment.objects.create(customer=customer, invoice=invoices[20], payment_id=uuid.uuid4(), amount=5)
+        self.assertEqual(self.get_summary(customer).open_invoices, 4)
+        self.assertSummariesUpToDate()
+
+        self.client.force_authenticate(user=customer.user)
+        payload = [
+            {'invoice': str(invoices[20].invoice_id), 'amount': 15},
+            {'invoice': str(invoices[30].invoice_id), 'amount': 10},
+            {'invoice': str(invoices[30].invoice_id), 'amount': 20},
+            {'invoice': str(invoices[40].invoice_id), 'amount': 1},
+        ]
+        response = self.client.post(self.domain + reverse('payment-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, 'Expected a successful POST request.')
+
+        account_summary = self.get_summary(customer)
+        self.assertEqual(account_summary.open_balance, 89)
+        self.assertEqual(account_summary.open_invoices, 2)
+        self.assertSummariesUpToDate()
+
+        # A failed POST changes nothing
+        payload = [{'invoice': str(invoices[50].invoice_id), 'amount': 1}, {'invoice': str(invoices[10].invoice_id), 'amount': 1}]
+        response = self.client.post(self.domain + reverse('payment-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, 'Expected a failed POST request.')
+        self.assertEqual(self.get_summary(customer).open_balance, 89)
+
+    def test_payment_saved_again(self):
+        """Ensure saving a payment again applies only the difference with its saved amount."""
+        customer = self.customers[0]
+        invoice = Invoice.objects.filter(customer=customer).get(amount=10)
+        payment = Payment.objects.create(customer=customer, invoice=invoice, payment_id=uuid.uuid4(), amount=4)
+
+        payment.save()
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.balance, 6)
+        self.assertEqual(self.get_summary(customer).open_balance, 146)
+        self.assertSummariesUpToDate()
+
+        # Paid, then lowered again
+        payment.amount = 10
+        payment.save()
+        self.assertEqual(self.get_summary(customer).open_invoices, 4)
+        self.assertSummariesUpToDate()
+
+        payment.amount = 3
+        payment.save()
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.balance, 7)
+        account_summary = self.get_summary(customer)
+        self.assertEqual(account_summary.open_balance, 147)
+        self.assertEqual(account_summary.open_invoices, 5)
+        self.assertSummariesUpToDate()
+
+        payment.amount = 20
+        with self.assertRaises(ValidationError):
+            payment.save()
+
+        payment.amount = 3
+        payment.invoice = Invoice.objects.filter(customer=customer).get(amount=20)
+        with self.assertRaises(ValidationError):
+            payment.save()
+        self.assertSummariesUpToDate()
+
+    def test_patch(self):
+        """Ensure PATCHing an invoice maintains the summary."""
+        customer = self.customers[0]
+        invoice = Invoice.objects.filter(customer=customer).get(amount=50)
+
+        self.client.force_authenticate(user=customer.user)
+        url = self.domain + reverse('invoice-detail', args=[invoice.invoice_id])
+        response = self.client.patch(url, {'amount': '60.00', 'balance': '0.00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful PATCH request.')
+
+        account_summary = self.get_summary(customer)
+        self.assertEqual(account_summary.total_billed, 160)
+        self.assertEqual(account_summary.open_balance, 100)
+        self.assertEqual(account_summary.open_invoices, 4)
+        self.assertSummariesUpToDate()
+
+    def test_get_summary(self):
+        """Ensure GET reads the customer summary with a single query."""
+        customer = self.customers[1]
+        Payment.objects.create(
+            customer=customer,
+            invoice=Invoice.objects.filter(customer=customer).get(amount=10),
+            payment_id=uuid.uuid4(),
+            amount=decimal.Decimal('2.50')
+        )
+
+        self.client.force_authenticate(user=User.objects.get(pk=customer.user_id))
+        url = self.domain + reverse('account-summary')
+        # customer, summary
+        with self.assertNumQueries(2):
+            response = self.client.get(url, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful GET request.')
+        self.assertEqual(response.data['customer_id'], str(customer.customer_id))
+        self.assertEqual(response.data['customer_full_name'], 'First Last')
+        self.assertEqual(response.data['total_billed'], '150.00')
+        self.assertEqual(response.data['open_balance'], '147.50')
+        self.assertEqual(response.data['open_invoices'], 5)
+        self.assertIsNotNone(response.data['last_payment'])
+
+        # Missing summaries are rebuilt
+        CustomerAccountSummary.objects.all().delete()
+        self.client.force_authenticate(user=User.objects.get(pk=customer.user_id))
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Expected a successful GET request.')
+        self.assertEqual(response.data['open_balance'], '147.50')
+
+        # Users who are not customers
+        self.client.force_authenticate(user=User.objects.create(username='nocustomer'))
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN, 'Expected a forbidden request.')
+
+    def test_rebuild_account_summaries(self):
+        """Ensure the command reports summaries that drifted and rebuilds them."""
+        CustomerAccountSummary.objects.filter(customer=self.customers[0]).update(open_balance=1)
+        CustomerAccountSummary.objects.filter(customer=self.customers[1]).delete()
+        devnull = open(os.devnull, 'w')
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_account_summaries', verify=True, stdout=devnull)
+
+        call_command('rebuild_account_summaries', customers=[self.customers[0].pk], stdout=devnull)
+        self.assertEqual(summary.verify([self.customers[0].pk]), {})
+        self.assertNotEqual(summary.verify(), {})
+
+        call_command('rebuild_account_summaries', stdout=devnull)
+        call_command('rebuild_account_summaries', verify=True, stdout=devnull)
+        self.assertSummariesUpToDate()
@@ -1,6 +1,12 @@
+import csv
+import json
 import uuid
+import datetime
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
 from django.core.exceptions import ValidationError
 
 from rest_framework import status
@@ -12,6 +18,8 @@ from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
 from customers.models import Customer
 from invoices.models import Invoice, Payment
+from invoices.pagination import KeysetPagination
+from invoices.serializers import InvoiceSerializer, PaymentSerializer
 
 
 class InvoiceAPITests(APITestCase):
@@ -167,6 +175,95 @@ class InvoiceAPITests(APITestCase):
                 # get next page of paginated list of invoices
                 url = response.data.get('next')
 
+    def test_get_invoice_list_cursor(self):
+        """Ensure GET with keyset pagination walks every customer invoice once, newest first."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        expected = [str(invoice_id) for invoice_id in Invoice.objects.filter(
+            customer=customer
+        ).order_by('-created', '-id').values_list('invoice_id', flat=True)]
+
+        self.client.force_authenticate(user=user)
+
+        invoice_ids = []
+        url = self.domain + reverse('invoice-list') + '?pagination=cursor'
+        while url:
+            response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+            self.assertNotIn('count', response.data, 'Keyset pagination must not count rows.')
+            self.assertLessEqual(
+                len(response.data['results']),
+                10,
+                'Incorrect number of paginated invoices returned.'
+            )
+
+            invoice_ids += [invoice['invoice_id'] for invoice in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(invoice_ids, expected, 'Incorrect invoices returned.')
+
+        # Invalid and tampered cursors
+        for position in (None, ['abc', 'x'], ['2023-03-01 12:00:00+00:00', 'x'], ['9999-12-31T23:59:59-05:00', '1'],
+                         ['2023-03-01 12:00:00+00:00', str(2 ** 64)]):
+            cursor = 'invalid' if position is None else KeysetPagination().encode_cursor(position)
+            url = self.domain + reverse('invoice-list') + '?cursor=' + cursor
+            response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_404_NOT_FOUND,
+                'Expected a failed GET request.'
+            )
+
+    def test_export_invoices(self):
+        """Ensure GET streams every customer invoice as NDJSON or CSV."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        expected = InvoiceSerializer(Invoice.objects.filter(customer=customer), many=True).data
+
+        self.client.force_authenticate(user=user)
+
+        # NDJSON rows are identical to the InvoiceSerializer representation
+        url = self.domain + reverse('invoice-export')
+        response = self.client.get(url)
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [dict(invoice) for invoice in expected], 'Incorrect invoices exported.')
+
+        # CSV
+        url = self.domain + reverse('invoice-export') + '?output=csv'
+        response = self.client.get(url, HTTP_ACCEPT='text/csv')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows, [dict(invoice) for invoice in expected], 'Incorrect invoices exported.')
+
+        # Unknown output format
+        url = self.domain + reverse('invoice-export') + '?output=xml'
+        response = self.client.get(url)
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            'Expected a failed GET request.'
+        )
+
     def test_get_invoice_detail(self):
         """Ensure GET retreives a detailed invoice."""
         user = User.objects.get(username=self.persons[0]['username'])
@@ -202,6 +299,84 @@ class InvoiceAPITests(APITestCase):
             'Expected a failed GET request.'
         )
 
+    def test_get_invoice_conditional(self):
+        """Ensure conditional GETs return 304 until the invoices change."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        invoice = Invoice.objects.filter(customer=customer).first()
+
+        self.client.force_authenticate(user=user)
+
+        for url in [
+            self.domain + reverse('invoice-list'),
+            self.domain + reverse('invoice-list') + '?page=2',
+            self.domain + reverse('invoice-detail', args=[invoice.invoice_id]),
+        ]:
+            response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+            etag = response['ETag']
+            last_modified = response['Last-Modified']
+
+            response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_304_NOT_MODIFIED,
+                'Expected a not modified GET request.'
+            )
+            self.assertEqual(response['ETag'], etag)
+            self.assertFalse(response.content)
+
+            response = self.client.get(url, format='json', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_304_NOT_MODIFIED,
+                'Expected a not modified GET request.'
+            )
+
+            # Another page or customer does not match
+            other_url = url + ('&' if '?' in url else '?') + 'format=json'
+            response = self.client.get(other_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+
+            # Modified invoice
+            invoice.balance -= 1
+            invoice.save()
+            response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+            self.assertNotEqual(response['ETag'], etag)
+
+        # Renamed customer, rendered in every response
+        for url in [
+            self.domain + reverse('invoice-list'),
+            self.domain + reverse('invoice-detail', args=[invoice.invoice_id]),
+            self.domain + reverse('payment-list'),
+        ]:
+            etag = self.client.get(url, format='json')['ETag']
+
+            user.first_name += 'x'
+            user.save()
+            response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+            modified = Customer.objects.get(user=user).modified
+            self.assertEqual(response['Last-Modified'], http_date(int(modified.timestamp())))
+
     def test_patch_invoice_detail(self):
         """Ensure PATCH updates invoices as expected."""
         user = User.objects.get(username=self.persons[0]['username'])
@@ -430,6 +605,90 @@ class PaymentAPITests(APITestCase):
                 # get next page of paginated list of invoices
                 url = response.data.get('next')
 
+    def test_get_payment_list_cursor(self):
+        """Ensure GET with keyset pagination walks every customer payment once, newest first."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        expected = [str(invoice_id) for invoice_id in Payment.objects.filter(
+            customer=customer
+        ).order_by('-created', '-id').values_list('invoice__invoice_id', flat=True)]
+
+        self.client.force_authenticate(user=user)
+
+        invoice_ids = []
+        url = self.domain + reverse('payment-list') + '?pagination=cursor'
+        while url:
+            response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+            invoice_ids += [payment['invoice_id'] for payment in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(invoice_ids, expected, 'Incorrect payments returned.')
+
+        # Past the last payment: an empty page, not the unpaginated list
+        cursor = KeysetPagination().encode_cursor(['2000-01-01T00:00:00+00:00', 1])
+        url = self.domain + reverse('payment-list') + '?pagination=cursor&cursor=' + cursor
+        response = self.client.get(url, format='json')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+        self.assertEqual(response.data['results'], [])
+        self.assertIsNone(response.data['next'])
+
+        # Tampered cursor
+        cursor = KeysetPagination().encode_cursor(['abc', 'x'])
+        url = self.domain + reverse('payment-list') + '?pagination=cursor&cursor=' + cursor
+        response = self.client.get(url, format='json')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_404_NOT_FOUND,
+            'Expected a failed GET request.'
+        )
+
+    def test_get_payment_conditional(self):
+        """Ensure conditional GETs of payments return 304 until the payments change."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        payment = Payment.objects.filter(customer=customer).first()
+
+        self.client.force_authenticate(user=user)
+
+        for url in [
+            self.domain + reverse('payment-list'),
+            self.domain + reverse('payment-list') + '?amount_gte=30',
+            self.domain + reverse('payment-detail', args=[payment.payment_id]),
+        ]:
+            etag = self.client.get(url, format='json')['ETag']
+
+            response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_304_NOT_MODIFIED,
+                'Expected a not modified GET request.'
+            )
+
+        # A new payment changes the payment list
+        url = self.domain + reverse('payment-list')
+        etag = self.client.get(url, format='json')['ETag']
+        invoice = Invoice.objects.filter(customer=customer, balance__gt=0).first()
+        self.client.post(url, {'invoice': str(invoice.invoice_id), 'amount': '1.00'}, format='json')
+
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+
     def test_get_payment_list_by_param(self):
         """Ensure GET retreives a list of customer payments based on givern params."""
         user = User.objects.get(username=self.persons[0]['username'])
@@ -532,6 +791,174 @@ class PaymentAPITests(APITestCase):
             'Expected a failed GET request.'
         )
 
+        # Test params that are not numbers
+        for query in ('?amount_gte=abc', '?amount_lte=NaN', '?amount_gte=Infinity'):
+            url = self.domain + reverse('payment-list') + query
+            response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST,
+                'Expected a failed GET request.'
+            )
+
+    def test_get_payment_list_by_invoices(self):
+        """Ensure GET filters payments by several invoices in a single query."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        invoice_ids = [str(invoice_id) for invoice_id in customer.invoices.values_list('invoice_id', flat=True)[:3]]
+        other_invoice = Invoice.objects.exclude(customer=customer).first()
+
+        self.client.force_authenticate(user=user)
+
+        # Repeated and comma separated params
+        for query in (
+            '?invoice=' + '&invoice='.join(invoice_ids),
+            '?invoice=' + ','.join(invoice_ids),
+            f'?invoice={invoice_ids[0]},{invoice_ids[1]}&invoice={invoice_ids[2]}',
+        ):
+            url = self.domain + reverse('payment-list') + query
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+            self.assertEqual(
+                response.data['count'],
+                3,
+                'Incorrect number of payments returned.'
+            )
+            # The invoices are joined, not looked up first
+            self.assertFalse(
+                [query['sql'] for query in queries if query['sql'].startswith('SELECT "invoices_invoice"')],
+                'Expected no invoice queries.'
+            )
+
+        # Other customers' invoices match no payment
+        url = self.domain + reverse('payment-list') + f'?invoice={invoice_ids[0]},{other_invoice.invoice_id}'
+        response = self.client.get(url, format='json')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+        self.assertEqual(
+            response.data['count'],
+            1,
+            'Incorrect number of payments returned.'
+        )
+
+        # Combined with an amount range
+        url = self.domain + reverse('payment-list') + '?invoice=' + ','.join(invoice_ids) + '&amount_gte=50'
+        response = self.client.get(url, format='json')
+
+        self.assertEqual(
+            response.data['count'],
+            Payment.objects.filter(invoice__invoice_id__in=invoice_ids, amount__gte=50).count(),
+            'Incorrect number of payments returned.'
+        )
+
+        # Invalid and too many invoice ids
+        for query in ('?invoice=abc', f'?invoice={invoice_ids[0]},abc', '?invoice=' + ','.join([invoice_ids[0]] * 101)):
+            url = self.domain + reverse('payment-list') + query
+            response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST,
+                'Expected a failed GET request.'
+            )
+
+    def test_get_payment_list_by_created(self):
+        """Ensure GET filters payments by a created date or datetime range."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        payments = Payment.objects.filter(customer=customer)
+        # Spread the payments over 21 days, one a day from March 1st 2023 at noon
+        start = datetime.datetime(2023, 3, 1, 12, tzinfo=datetime.timezone.utc)
+        for i, payment in enumerate(payments.order_by('pk')):
+            payments.filter(pk=payment.pk).update(created=start + datetime.timedelta(days=i))
+
+        self.client.force_authenticate(user=user)
+
+        for query, count in (
+            ('?created_gte=2023-03-05', 17),
+            ('?created_lte=2023-03-05', 5),
+            ('?created_gte=2023-03-05&created_lte=2023-03-05', 1),
+            ('?created_gte=2023-03-05T12:00:00Z&created_lte=2023-03-07T11:59:59Z', 2),
+            ('?created_gte=2023-03-05T13:00:00%2B01:00&created_lte=2023-03-06', 2),
+            ('?created_gte=2023-03-05&amount_gte=50', payments.filter(created__gte='2023-03-05', amount__gte=50).count()),
+            ('?created_gte=2023-03-21T12:00:00', 1),
+        ):
+            url = self.domain + reverse('payment-list') + query
+            response = self.client.get(url, format='json')
+
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_200_OK,
+                'Expected a successful GET request.'
+            )
+            self.assertEqual(
+                response.data['count'],
+                count,
+                f'Incorrect number of payments returned for {query}.'
+            )
+
+        # Invalid dates and range
+        for query in (
+            '?created_gte=abc',
+            '?created_lte=2023-02-30',
+            '?created_gte=2023-03-06&created_lte=2023-03-05',
+            # Out of the datetime range
+            '?created_lte=9999-12-31',
+            '?created_gte=9999-12-31T23:59:59-05:00',
+            '?created_gte=0001-01-01T00:00:00%2B01:00',
+        ):
+            for name in ('payment-list', 'payment-export'):
+                url = self.domain + reverse(name) + query
+                response = self.client.get(url, format='json')
+
+                self.assertEqual(
+                    response.status_code,
+                    status.HTTP_400_BAD_REQUEST,
+                    'Expected a failed GET request.'
+                )
+
+    def test_export_payments(self):
+        """Ensure GET streams the filtered customer payments."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        expected = PaymentSerializer(
+            Payment.objects.filter(customer=customer, amount__gte=30, amount__lte=60),
+            many=True
+        ).data
+
+        self.client.force_authenticate(user=user)
+
+        url = self.domain + reverse('payment-export') + '?amount_gte=30&amount_lte=60'
+        response = self.client.get(url)
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [dict(payment) for payment in expected], 'Incorrect payments exported.')
+
+        # Invalid params range
+        url = self.domain + reverse('payment-export') + '?amount_gte=60&amount_lte=30'
+        response = self.client.get(url)
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            'Expected a failed GET request.'
+        )
 
     def test_get_payment_detail(self):
         """Ensure GET retrieves a detailed payment."""
@@ -677,3 +1104,110 @@ class PaymentAPITests(APITestCase):
 
 
 
+    def test_post_payment_query_count(self):
+        """Ensure POST applies any number of payments in a constant number of queries."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        invoices = list(Invoice.objects.filter(customer=customer).exclude(balance=0))
+
+        self.client.force_authenticate(user=user)
+        url = self.domain + reverse('payment-list')
+
+        # customer, savepoint, invoices, payments, balances, account summary, release savepoint
+        # A single payment
+        payments = [{'invoice': str(invoices[0].invoice_id), 'amount': '1.00'}]
+        with self.assertNumQueries(7):
+            response = self.client.post(url, payments, format='json')
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED,
+            'Expected a successful POST request.'
+        )
+
+        # One payment per invoice
+        payments = [{'invoice': str(invoice.invoice_id), 'amount': '1.00'} for invoice in invoices]
+        self.client.force_authenticate(user=User.objects.get(pk=user.pk))
+        with self.assertNumQueries(7):
+            response = self.client.post(url, payments, format='json')
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_201_CREATED,
+            'Expected a successful POST request.'
+        )
+        self.assertEqual(
+            len(response.data),
+            len(payments),
+            'Incorrect number of payments created.'
+        )
+
+        for i, invoice in enumerate(invoices):
+            balance = invoice.balance
+            invoice.refresh_from_db()
+            self.assertEqual(
+                invoice.balance,
+                balance - (2 if i == 0 else 1),
+                'POST failed to update Invoice.balance'
+            )
+
+    def test_post_payment_all_or_nothing(self):
+        """Ensure POST does not apply any payment if one of them is invalid."""
+        user = User.objects.get(username=self.persons[0]['username'])
+        customer = Customer.objects.get(user=user)
+        invoice = Invoice.objects.filter(customer=customer).first()
+        payments_count = Payment.objects.count()
+
+        self.client.force_authenticate(user=user)
+        url = self.domain + reverse('payment-list')
+
+        # The second payment exhausts the invoice balance left by the first one
+        payments = [
+            {'invoice': str(invoice.invoice_id), 'amount': str(invoice.balance)},
+            {'invoice': str(invoice.invoice_id), 'amount': '0.01'},
+        ]
+        response = self.client.post(url, payments, format='json')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            'Expected a failed POST request.'
+        )
+
+        # Invoice of another customer
+        other_invoice = Invoice.objects.exclude(customer=customer).first()
+        payments = [
+            {'invoice': str(invoice.invoice_id), 'amount': '1.00'},
+            {'invoice': str(other_invoice.invoice_id), 'amount': '1.00'},
+        ]
+        response = self.client.post(url, payments, format='json')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_404_NOT_FOUND,
+            'Expected a failed POST request.'
+        )
+
+        # Invalid amount
+        payments = [
+            {'invoice': str(invoice.invoice_id), 'amount': '1.00'},
+            {'invoice': str(invoice.invoice_id), 'amount': 'one'},
+        ]
+        response = self.client.post(url, payments, format='json')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            'Expected a failed POST request.'
+        )
+
+        balance = invoice.balance
+        invoice.refresh_from_db()
+        self.assertEqual(
+            invoice.balance,
+            balance,
+            'POST modified Invoice.balance'
+        )
+        self.assertEqual(
+            Payment.objects.count(),
+            payments_count,
+            'POST created payments'
+        )
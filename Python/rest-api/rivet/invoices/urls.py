@@ -1,9 +1,19 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('api/invoices/', views.InvoiceListView.as_view(), name='invoice-list'),
+    path('api/invoices/export/', views.InvoiceExportView.as_view(), name='invoice-export'),
+    path('api/invoices/import/', views.InvoiceImportView.as_view(), name='invoice-import'),
     path('api/invoices/<uuid:invoice_id>/', views.InvoiceDetailView.as_view(), name='invoice-detail'),
     path('api/payments/', views.PaymentListView.as_view(), name='payment-list'),
+    path('api/payments/export/', views.PaymentExportView.as_view(), name='payment-export'),
+    path('api/payments/groups/', views.PaymentGroupListView.as_view(), name='payment-group-list'),
+    path('api/payments/jobs/<uuid:job_id>/', views.PaymentBatchJobDetailView.as_view(), name='payment-job-detail'),
     path('api/payments/<uuid:payment_id>/', views.PaymentDetailView.as_view(), name='payment-detail'),
+    path('api/summary/', views.AccountSummaryView.as_view(), name='account-summary'),
+    path('api/async/invoices/', async_views.invoice_list, name='async-invoice-list'),
+    path('api/async/invoices/<uuid:invoice_id>/', async_views.invoice_detail, name='async-invoice-detail'),
+    path('api/async/payments/', async_views.payment_list, name='async-payment-list'),
+    path('api/async/payments/<uuid:payment_id>/', async_views.payment_detail, name='async-payment-detail'),
 ]
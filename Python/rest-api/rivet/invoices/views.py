@@ -1,43 +1,91 @@
-import uuid
-import decimal
+import copy
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import transaction
-from django.db.models import Prefetch
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Prefetch, Sum
 from django.http import QueryDict
 from django.shortcuts import get_list_or_404, get_object_or_404
+from django.urls import reverse
 
 from rest_framework import generics, permissions, serializers, status
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-
-from .serializers import InvoiceSerializer, PaymentSerializer, PaymentPostSerializer
-
+from rest_framework.views import APIView
+
+from . import cache, idempotency, imports, jobs, summary
+from .conditional import ConditionalGetMixin, conditional_response
+from .encoders import INVOICE_ROW_FIELDS, PAYMENT_ROW_FIELDS, RowEncoder, customer_constants
+from .export import export_response
+from .filters import PaymentFilterBackend, filter_payments
+from .pagination import PaymentGroupPagination, SelectablePagination
+from .payments import apply_payments, parse_payment_items
+from .serializers import (
+    CustomerAccountSummarySerializer, InvoiceRowSerializer, InvoiceSerializer, PaymentBatchJobSerializer,
+    PaymentGroupSerializer, PaymentPostSerializer, PaymentRowSerializer, PaymentSerializer
+)
+
+from customers.cache import customer_cache
 from customers.models import Customer
-from .models import Invoice, Payment
+from .models import CustomerAccountSummary, Invoice, Payment, PaymentBatchJob
 
 
 def get_customer(user: User) -> Customer:
-    """Get a costumer matching User else raise PermissionDenied exception."""
+    """Get a costumer matching User else raise PermissionDenied exception.
+
+    The Customer is cached on the User (user.customer) so it is resolved at most once per request,
+    CustomerTokenAuthentication preloads it with the token. Customers can also be cached across
+    requests for settings.CUSTOMER_CACHE_TTL seconds (0 disables the cache).
+    """
     if not isinstance(user, User):
         raise TypeError(f"Argument 'user' must be of type User")
 
+    ttl = getattr(settings, 'CUSTOMER_CACHE_TTL', 0)
+    cache_miss = False
+    if ttl and not User.customer.is_cached(user):
+        cached = customer_cache.get(user.pk)
+        if cached is not None:
+            # Setting Customer.user also caches the customer on the user
+            copy.copy(cached).user = user
+        else:
+            cache_miss = True
+
     try:
-        customer = Customer.objects.get(user=user)
+        customer = user.customer
     except ObjectDoesNotExist:
         raise PermissionDenied(f"User '{user}' is not a customer.")
 
+    if cache_miss:
+        cached = copy.copy(customer)
+        Customer._meta.get_field('user').delete_cached_value(cached)
+        customer_cache.set(user.pk, cached, ttl)
+
     return customer
 
 
-class InvoiceListView(generics.ListAPIView):
+def get_rows(queryset: 'QuerySet', serializer_class: type) -> 'QuerySet':
+    """Get the .values() rows rendered by a RowSerializer, with the pk for the keyset pagination position."""
+    return queryset.values('id', *serializer_class.get_lookups())
+
+
+class InvoiceListView(ConditionalGetMixin, generics.ListAPIView):
     """Methods: GET.
 
     GET a list of invoices for a customer.
+    Responses carry ETag/Last-Modified headers, conditional requests get a 304 if nothing changed.
+    Serialized pages are cached (see invoices.cache), the X-Cache header tells whether it was a HIT or a MISS.
+    Invoices are rendered from .values() rows by InvoiceRowSerializer (same fields as InvoiceSerializer).
+    Params (not required):
+    pagination - 'cursor' switches to keyset pagination which follows 'next' links at a constant cost per page.
+
+    Example API call:
+    /api/invoices/?pagination=cursor
     """
-    serializer_class = InvoiceSerializer
+    serializer_class = InvoiceRowSerializer
+    pagination_class = SelectablePagination
 
     def get_queryset(self) -> 'QuerySet':
         user = self.request.user
@@ -45,15 +93,45 @@ class InvoiceListView(generics.ListAPIView):
 
         return Invoice.objects.filter(customer=customer)
 
+    def get(self, request: 'Request', *args, **kwargs) -> Response:
+        customer = get_customer(request.user)
+        self.cache_key = cache.page_key(customer.pk, request)
+
+        entry = cache.get_page(self.cache_key)
+        if entry is None:
+            return super().get(request, *args, **kwargs)
+
+        # The page is cached with its validators: a hit (or a 304) runs no query
+        data, validators = entry
+        return conditional_response(request, validators, lambda: Response(data, headers={'X-Cache': 'HIT'}))
+
+    def list(self, request: 'Request', *args, **kwargs) -> Response:
+        customer = get_customer(request.user)
+
+        queryset = get_rows(self.filter_queryset(self.get_queryset()), self.get_serializer_class())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True, customer=customer)
+
+        response = self.get_paginated_response(serializer.data)
+        cache.set_page(self.cache_key, (response.data, self.validators))
+        response['X-Cache'] = 'MISS'
+
+        return response
 
-class InvoiceDetailView(generics.RetrieveUpdateAPIView):
+
+class InvoiceDetailView(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     """Methods: GET, PATCH.
 
     GET or PATCH a specific customer invoice.
+    GET responses carry ETag/Last-Modified headers, conditional requests get a 304 if nothing changed.
     """
-    queryset = Invoice.objects.all()
+    queryset = Invoice.objects.select_related('customer')
     serializer_class = InvoiceSerializer
 
+    def get_validator_queryset(self) -> 'QuerySet':
+        customer = get_customer(self.request.user)
+        return Invoice.objects.filter(customer=customer, invoice_id=self.kwargs.get('invoice_id'))
+
     def get_object(self) -> Invoice:
         """Get an invoice only if its customer is the caller."""
         user = self.request.user
@@ -76,32 +154,81 @@ class InvoiceDetailView(generics.RetrieveUpdateAPIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class PaymentListView(generics.ListCreateAPIView):
+class InvoiceImportView(APIView):
+    """Methods: POST.
+
+    POST a batch of a customer's invoices to create or update (billing system imports).
+    Params (one object per invoice):
+    invoice_id - invoice id (UUID) (not required), an existing invoice is updated, a new invoice is created
+    (with a new id if none is given).
+    amount - invoice amount (required).
+    balance - remaining balance, less than or equal to amount (required).
+
+    Invalid rows and other customers' invoice ids are reported by index in 'errors' and skipped, the other rows are
+    imported in chunks of settings.INVOICE_IMPORT_CHUNK_SIZE (see invoices.imports). The response is a 400 (with the
+    same body) when no invoice was imported.
+
+    Example API call:
+    /api/invoices/import/
+    payload = [
+        {"invoice_id": "feb7f5a7-cbf0-4f3d-ab3a-b611e03cd1e2", "amount": 100, "balance": 50},
+        {"amount": 200, "balance": 200}
+    ]
+    response = {"created": 1, "updated": 1, "errors": []}
+    """
+
+    def post(self, request: 'Request', *args, **kwargs) -> Response:
+        customer = get_customer(request.user)
+        result = imports.import_invoices(customer, request.data)
+
+        if result['errors'] and not (result['created'] or result['updated']):
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class PaymentListView(ConditionalGetMixin, generics.ListCreateAPIView):
     """Methods: GET, POST.
 
     GET a list of payments made by a customer.
-    Params (not required):
+    Responses carry ETag/Last-Modified headers, conditional requests get a 304 if nothing changed.
+    Params (not required), combined in a single query (see invoices.filters.PaymentFilterBackend):
     amount_gte - filters for payment amount greater than or equal to (not required).
     amount_lte - filters for payment amount less than or equal to (not required).
-    invoice - filters for payments that have been applied to a specific invoice id (not required).
+    created_gte - filters for payments created at or after an ISO 8601 date or datetime (not required).
+    created_lte - filters for payments created at or before an ISO 8601 date (the whole day) or datetime (not required).
+    invoice - filters for payments that have been applied to one or more invoice ids, repeated or comma separated
+    (not required).
+    pagination - 'cursor' switches to keyset pagination which follows 'next' links at a constant cost per page.
 
     Example API call:
-    /api/payments/?invoice=0e0f993b-4dac-4331-b7db-a42266bd92bc&amount_gre=50
+    /api/payments/?invoice=0e0f993b-4dac-4331-b7db-a42266bd92bc&amount_gte=50
+    /api/payments/?invoice=0e0f993b-4dac-4331-b7db-a42266bd92bc,feb7f5a7-cbf0-4f3d-ab3a-b611e03cd1e2
+    /api/payments/?created_gte=2023-03-01&created_lte=2023-03-31
+    /api/payments/?pagination=cursor
 
 
     POST a payment to one or more customer's invoices.
     Params:
     invoice - invoice id (UUID) (required).
     amount - amount of payment to apply to the remaining balance of the invoice (required).
+    mode - 'async' (not required) stores the payments as a job applied in the background by the
+    run_payment_worker command and returns 202 with the job, follow its Location header for the progress.
+    Headers:
+    Idempotency-Key - a unique client key (not required), requests retried with the same key and payload
+    get the original 201 response back and the payments are applied only once.
 
     Example API call:
     /api/payments/
+    /api/payments/?mode=async
     payload = [
         {"invoice": "feb7f5a7-cbf0-4f3d-ab3a-b611e03cd1e2", "amount": 50},
         {"invoice": "0e0f993b-4dac-4331-b7db-a42266bd92bc", "amount": 100}
     ]
     """
-    serializer_class = PaymentSerializer
+    serializer_class = PaymentRowSerializer
+    pagination_class = SelectablePagination
+    filter_backends = [PaymentFilterBackend]
 
     def get_queryset(self) -> 'QuerySet':
         user = self.request.user
@@ -113,47 +240,23 @@ class PaymentListView(generics.ListCreateAPIView):
         if self.request.method == 'POST':
             return PaymentPostSerializer
 
-        return PaymentSerializer
+        return PaymentRowSerializer
 
-    def get(self, request: 'Request', *args, **kwargs) -> Response:
+    def list(self, request: 'Request', *args, **kwargs) -> Response:
         """GET a list of payments made by a customer.
 
-        Results can be filtered by amount_gte, amount_lte, invoice.
+        Results can be filtered by amount_gte, amount_lte, created_gte, created_lte, invoice.
+        Payments are rendered from .values() rows by PaymentRowSerializer (same fields as PaymentSerializer).
         """
-        queryset = self.get_queryset()
-
-        # Validate params passed in API request
-        # amount_gte: int/float
-        amount_gte = request.query_params.get('amount_gte')
-        if amount_gte:
-            amount_gte = float(amount_gte)
-            if amount_gte <= 0:
-                raise ValidationError("Param 'amount_gte' must be greater than 0.")
-            queryset = queryset.filter(amount__gte=amount_gte)
-
-        # amount_lte: int/float
-        amount_lte = request.query_params.get('amount_lte')
-        if amount_lte:
-            amount_lte = float(amount_lte)
-            if amount_lte <= 0:
-                raise ValidationError("Param 'amount_lte' must be greater than 0.")
-            queryset = queryset.filter(amount__lte=amount_lte)
-
-        if amount_gte and amount_lte and amount_gte > amount_lte:
-            raise ValidationError("Param 'amount_gte' must be less than or equal to amount_lte.")
-
-        # invoice: UUID
-        invoice_id = request.query_params.get('invoice')
-        if invoice_id:
-            invoice = get_object_or_404(Invoice, invoice_id=invoice_id)
-            queryset = queryset.filter(invoice=invoice)
+        customer = get_customer(request.user)
+        queryset = get_rows(self.filter_queryset(self.get_queryset()), self.get_serializer_class())
 
         page = self.paginate_queryset(queryset)
-        if page:
-            serializer = self.get_serializer(page, many=True)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True, customer=customer)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(queryset, many=True, customer=customer)
         return Response(serializer.data)
 
     def post(self, request: 'Request', *args, **kwargs) -> Response:
@@ -166,56 +269,88 @@ class PaymentListView(generics.ListCreateAPIView):
         """
         user = request.user
         customer = get_customer(user)
-        payment_id = uuid.uuid4()
-        request_data = request.data.copy()
-
-        # Wrap the payload in a list if we just got a single dict param
-        if isinstance(request_data, dict):
-            request_data = [request_data]
-
-        # Validate params passed in API request
-        for item in request_data:
-            if 'invoice' not in item:
-                raise ValidationError("Param 'invoice' is required.")
-            # Replace invoice_id with corresponding object.id
-            # invoice: UUID string or pk of object (from serializer)
-            invoice = get_object_or_404(Invoice, customer=customer, invoice_id=item['invoice'])
-            item['invoice'] = invoice.id
-
-            if 'amount' not in item:
-                raise ValidationError("Param 'amount' is required.")
-
-            item['amount'] = decimal.Decimal(item['amount']).quantize(decimal.Decimal('0.01'))
-
-            if item['amount'] < 0.01:
-                raise ValidationError("Param 'amount' must be greater than 0.")
-
-            if item['amount'] > invoice.balance:
-                raise ValidationError(
-                    f'Unable to apply a payment in the amount of {item["amount"]} to the invoice {invoice.invoice_id}. ' +
-                    f'The payment amount exceeds the invoice balance of {invoice.balance} .'
-                )
-
-        # Make sure that either all or none of the payments in this request succeed
-        with transaction.atomic():
-            serializer = self.get_serializer(data=request_data, many=True)
-            serializer.is_valid(raise_exception=True)
-            created = serializer.save(
-                customer=customer,
-                payment_id=payment_id
-            )
-            serializer = PaymentSerializer(created, many=True)
-
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-
-class PaymentDetailView(generics.ListAPIView):
+
+        mode = request.query_params.get('mode')
+        if mode == 'async':
+            create = self.create_job
+        elif mode:
+            raise ValidationError("Param 'mode' must be 'async'.")
+        else:
+            create = self.create_payments
+
+        key = idempotency.get_key(request)
+        if key is None:
+            return create(customer, request.data)
+
+        # A retried request gets the stored response, the payload is not validated again
+        request_hash = idempotency.get_request_hash(request.data)
+        response = idempotency.replay(customer, key, request_hash)
+        if response is not None:
+            return response
+
+        try:
+            # The payments and the stored response are committed together
+            with transaction.atomic():
+                response = create(customer, request.data)
+                idempotency.store(customer, key, request_hash, response)
+        except IntegrityError:
+            # A concurrent request with the same key won, its payments were applied
+            response = idempotency.replay(customer, key, request_hash)
+            if response is None:
+                raise
+
+        return response
+
+    def create_payments(self, customer: Customer, request_data) -> Response:
+        items = parse_payment_items(request_data)
+
+        # Invoices are fetched, checked and updated in bulk.
+        # Make sure that either all or none of the payments in this request succeed.
+        created = apply_payments(customer, items)
+        serializer = PaymentSerializer(created, many=True)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def create_job(self, customer: Customer, request_data) -> Response:
+        items = parse_payment_items(request_data)
+
+        # Validated now, applied in chunks by the run_payment_worker command
+        job = jobs.create_job(customer, items)
+        serializer = PaymentBatchJobSerializer(job)
+        location = reverse('payment-job-detail', args=[job.job_id])
+
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+class PaymentBatchJobDetailView(generics.RetrieveAPIView):
+    """Methods: GET.
+
+    GET the status and progress of a customer's payment batch job (POST /api/payments/?mode=async):
+    pending, running, succeeded or failed (with an error), processed out of total payments. A failed job is not
+    rolled back: its first 'processed' payments stay applied, the error says so. The payments of the job
+    share its payment_id, see /api/payments/<payment_id>/.
+    """
+    serializer_class = PaymentBatchJobSerializer
+
+    def get_object(self) -> PaymentBatchJob:
+        customer = get_customer(self.request.user)
+        queryset = PaymentBatchJob.objects.defer('items')
+
+        return get_object_or_404(queryset, customer=customer, job_id=self.kwargs.get('job_id'))
+
+
+class PaymentDetailView(ConditionalGetMixin, generics.ListAPIView):
     """Methods: GET.
 
     GET a detailed payment info which could actually be represented by multiple objects (one object per invoice payment).
+    Responses carry ETag/Last-Modified headers, conditional requests get a 304 if nothing changed.
     """
     serializer_class = PaymentSerializer
 
+    def get_validator_queryset(self) -> 'QuerySet':
+        customer = get_customer(self.request.user)
+        return Payment.objects.filter(customer=customer, payment_id=self.kwargs.get('payment_id'))
+
     def get_queryset(self) -> 'QuerySet':
         user = self.request.user
         customer = get_customer(user)
@@ -224,4 +359,106 @@ class PaymentDetailView(generics.ListAPIView):
             'customer': customer,
             'payment_id': self.kwargs.get('payment_id')
         }
-        return get_list_or_404(Payment, **filter)
+        queryset = Payment.objects.select_related('customer', 'invoice')
+        return get_list_or_404(queryset, **filter)
+
+
+class PaymentGroupListView(generics.ListAPIView):
+    """Methods: GET.
+
+    GET a list of a customer's payments grouped by payment_id (the payments of a POST request or job), one row per
+    payment_id with the total amount, the number of invoices paid and the first and last created times.
+    The groups are computed by the database in a single GROUP BY query and paginated by payment_id with a cursor,
+    follow the 'next' links to walk them all.
+
+    Example API call:
+    /api/payments/groups/
+    """
+    serializer_class = PaymentGroupSerializer
+    pagination_class = PaymentGroupPagination
+
+    def get_queryset(self) -> 'QuerySet':
+        customer = get_customer(self.request.user)
+
+        # order_by() drops the default -created ordering, which would otherwise be added to the GROUP BY
+        return Payment.objects.filter(customer=customer).order_by().values('payment_id').annotate(
+            total_amount=Sum('amount'),
+            invoice_count=Count('invoice', distinct=True),
+            first_created=Min('created'),
+            last_created=Max('created')
+        )
+
+
+class AccountSummaryView(generics.RetrieveAPIView):
+    """Methods: GET.
+
+    GET a customer's account summary: total billed, open balance, number of open invoices and last payment time.
+    The summary is maintained as invoices and payments change (see invoices.summary), so it is read with a single query.
+
+    Example API call:
+    /api/summary/
+    """
+    serializer_class = CustomerAccountSummarySerializer
+
+    def get_object(self) -> CustomerAccountSummary:
+        customer = get_customer(self.request.user)
+        try:
+            account_summary = CustomerAccountSummary.objects.get(customer=customer)
+        except CustomerAccountSummary.DoesNotExist:
+            # No invoice changed since the summaries were introduced
+            summary.rebuild([customer.pk])
+            account_summary = CustomerAccountSummary.objects.get(customer=customer)
+
+        account_summary.customer = customer
+        return account_summary
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Use the first parser/renderer whatever the client accepts, the export views pick their own content type."""
+
+    def select_parser(self, request: 'Request', parsers: list):
+        return parsers[0]
+
+    def select_renderer(self, request: 'Request', renderers: list, format_suffix: str = None) -> tuple:
+        return (renderers[0], renderers[0].media_type)
+
+
+class InvoiceExportView(APIView):
+    """Methods: GET.
+
+    GET a streamed export of all the invoices of a customer.
+    Params (not required):
+    output - ndjson (default) or csv.
+
+    Example API call:
+    /api/invoices/export/?output=csv
+    """
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request: 'Request', *args, **kwargs) -> 'StreamingHttpResponse':
+        customer = get_customer(request.user)
+        queryset = Invoice.objects.filter(customer=customer)
+        encoder = RowEncoder(INVOICE_ROW_FIELDS, constants=customer_constants(customer))
+
+        return export_response(queryset, encoder, request.query_params.get('output'), 'invoices')
+
+
+class PaymentExportView(APIView):
+    """Methods: GET.
+
+    GET a streamed export of all the payments made by a customer.
+    Params (not required):
+    output - ndjson (default) or csv.
+    amount_gte, amount_lte, created_gte, created_lte, invoice - same filters as GET /api/payments/.
+
+    Example API call:
+    /api/payments/export/?output=csv&amount_gte=50
+    """
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request: 'Request', *args, **kwargs) -> 'StreamingHttpResponse':
+        customer = get_customer(request.user)
+        queryset = filter_payments(Payment.objects.filter(customer=customer), request.query_params)
+        encoder = RowEncoder(PAYMENT_ROW_FIELDS, constants=customer_constants(customer))
+
+        return export_response(queryset, encoder, request.query_params.get('output'), 'payments')
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rivet.settings')
+# Only async capable middleware, so the async views run on the event loop (see MIDDLEWARE in the settings)
+os.environ['RIVET_ASGI'] = '1'
 
 application = get_asgi_application()
@@ -0,0 +1,80 @@
+"""Database configuration from the environment and per connection SQLite settings.
+
+get_database() builds settings.DATABASES['default'] from DATABASE_* environment variables:
+
+    DATABASE_ENGINE - sqlite3 (default, the bundled db.sqlite3) or postgresql
+    DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST, DATABASE_PORT - connection parameters
+    DATABASE_CONN_MAX_AGE - seconds a connection is reused across requests (default 60, 0 closes it after every request)
+    DATABASE_CONN_HEALTH_CHECKS - check a reused connection is still usable before a request (default 1)
+    DATABASE_PGBOUNCER - set to 1 when connecting through PgBouncer in transaction pooling mode
+    DATABASE_TEST_NAME - SQLite file of the test database (default: base_dir / test_db.sqlite3)
+
+apply_sqlite_pragmas() (connected to connection_created by RivetConfig) runs settings.SQLITE_PRAGMAS on every new
+SQLite connection.
+"""
+import os
+
+from django.conf import settings
+
+
+ENGINES = {
+    'sqlite3': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+}
+
+
+def get_bool(environ, name: str, default: bool) -> bool:
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_database(base_dir, environ=os.environ) -> dict:
+    """Build the default database settings from the environment, falling back to base_dir / db.sqlite3."""
+    engine = environ.get('DATABASE_ENGINE', 'sqlite3')
+    if engine not in ENGINES:
+        raise ValueError(f"DATABASE_ENGINE must be one of: {', '.join(ENGINES)}.")
+
+    database = {
+        'ENGINE': ENGINES[engine],
+        'NAME': environ.get('DATABASE_NAME') or (base_dir / 'db.sqlite3' if engine == 'sqlite3' else 'rivet'),
+        # Persistent connections: Django closes a connection at the end of a request only once it is this old
+        'CONN_MAX_AGE': int(environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        # ... and checks it before reusing it for a new request, so a dropped connection is replaced, not an error
+        'CONN_HEALTH_CHECKS': get_bool(environ, 'DATABASE_CONN_HEALTH_CHECKS', True),
+    }
+
+    if engine == 'sqlite3':
+        # A file rather than Django's in-memory shared cache database, which fails concurrent writers with
+        # 'database table is locked' right away: tests get the locking (SQLITE_PRAGMAS busy_timeout) of production
+        database['TEST'] = {'NAME': environ.get('DATABASE_TEST_NAME') or base_dir / 'test_db.sqlite3'}
+
+    if engine == 'postgresql':
+        database.update(
+            USER=environ.get('DATABASE_USER', ''),
+            PASSWORD=environ.get('DATABASE_PASSWORD', ''),
+            HOST=environ.get('DATABASE_HOST', 'localhost'),
+            PORT=environ.get('DATABASE_PORT', '5432'),
+        )
+        if get_bool(environ, 'DATABASE_PGBOUNCER', False):
+            # Transaction pooling hands every transaction a different server connection: cursors cannot outlive a
+            # transaction, so the exports' iterator(chunk_size) must not use server-side (named) cursors
+            database['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+    return database
+
+
+def set_pragmas(sqlite_connection: 'sqlite3.Connection', pragmas: dict):
+    """Run {pragma: value} PRAGMAs on a sqlite3 connection, in order (eg: journal_mode before synchronous)."""
+    for name, value in pragmas.items():
+        sqlite_connection.execute(f'PRAGMA {name} = {value}')
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created receiver, runs the settings.SQLITE_PRAGMAS {pragma: value} on new SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+
+    # On the sqlite3 connection itself (like the backend's own PRAGMA foreign_keys), so they are not logged as queries
+    set_pragmas(connection.connection, getattr(settings, 'SQLITE_PRAGMAS', {}))
@@ -0,0 +1,106 @@
+import time
+import random
+import logging
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('rivet.queries')
+
+
+class QueryStats:
+    """A connection.execute_wrapper() that counts queries and their total duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class QueryInstrumentationMiddleware:
+    """Count the SQL queries and DB time of a sample of requests.
+
+    The numbers are sent in a Server-Timing response header, eg:
+    Server-Timing: db;dur=1.520;desc="3 queries", app;dur=6.210
+    and logged to the 'rivet.queries' logger (INFO) with the resolved view name (eg: invoice-list).
+
+    settings.QUERY_INSTRUMENTATION_SAMPLE_RATE - fraction of the requests to instrument (0 disables it).
+    Queries run while a streaming response is being sent are not counted.
+    Works in both sync (WSGI) and async (ASGI) middleware chains, so async views are not pushed to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            # Mark the instance as a coroutine function, so Django awaits it in an async middleware chain
+            markcoroutinefunction(self)
+
+    def is_sampled(self) -> bool:
+        sample_rate = getattr(settings, 'QUERY_INSTRUMENTATION_SAMPLE_RATE', 0)
+        return sample_rate > 0 and (sample_rate >= 1 or random.random() < sample_rate)
+
+    def instrument(self, stats: QueryStats) -> ExitStack:
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        return stack
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        if not self.is_sampled():
+            return self.get_response(request)
+
+        stats = QueryStats()
+        start = time.perf_counter()
+        with self.instrument(stats):
+            response = self.get_response(request)
+
+        return self.process_stats(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.is_sampled():
+            return await self.get_response(request)
+
+        stats = QueryStats()
+        start = time.perf_counter()
+        with self.instrument(stats):
+            response = await self.get_response(request)
+
+        return self.process_stats(request, response, stats, time.perf_counter() - start)
+
+    def process_stats(self, request, response, stats: QueryStats, duration: float):
+        """Add the Server-Timing header to the response and log the stats."""
+        server_timing = f'db;dur={stats.duration * 1000:.3f};desc="{stats.count} queries", app;dur={duration * 1000:.3f}'
+        if response.has_header('Server-Timing'):
+            server_timing = f"{response['Server-Timing']}, {server_timing}"
+        response['Server-Timing'] = server_timing
+
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        logger.info(
+            'view=%s method=%s status=%s queries=%s db_ms=%.3f total_ms=%.3f',
+            view_name, request.method, response.status_code, stats.count, stats.duration * 1000, duration * 1000,
+            extra={
+                'view': view_name,
+                'method': request.method,
+                'status': response.status_code,
+                'queries': stats.count,
+                'db_ms': round(stats.duration * 1000, 3),
+                'total_ms': round(duration * 1000, 3),
+            }
+        )
+
+        return response
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from rivet.db import get_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,11 +47,13 @@ INSTALLED_APPS = [
     'debug_toolbar',
     'rest_framework',
     'rest_framework.authtoken',
+    'rivet.apps.RivetConfig',
     'customers.apps.CustomersConfig',
     'invoices.apps.InvoicesConfig',
 ]
 
 MIDDLEWARE = [
+    'rivet.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,9 +61,14 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# The debug toolbar middleware is sync only: in the ASGI handler's middleware chain it would run every request,
+# and the async views (invoices.async_views), in a thread. It is only added for WSGI (eg: runserver), rivet/asgi.py
+# sets RIVET_ASGI.
+if DEBUG and not os.environ.get('RIVET_ASGI'):
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'rivet.urls'
 
 TEMPLATES = [
@@ -83,13 +93,44 @@ WSGI_APPLICATION = 'rivet.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Configured with DATABASE_* environment variables (eg: DATABASE_ENGINE=postgresql), see rivet.db.get_database()
 DATABASES = {
+    'default': get_database(BASE_DIR),
+}
+
+# PRAGMAs run on every new SQLite connection (rivet.db.apply_sqlite_pragmas), see run_benchmark --sqlite-stress
+SQLITE_PRAGMAS = {
+    # Readers do not block the writer and the writer does not block readers
+    'journal_mode': 'wal',
+    # fsync at checkpoints only: still safe from corruption in WAL mode, a power loss may lose the last commits
+    'synchronous': 'normal',
+    # Read the database file through a 256 MB memory map instead of read() calls
+    'mmap_size': 256 * 1024 * 1024,
+    # 64 MB page cache per connection (negative values are KiB)
+    'cache_size': -64 * 1024,
+    # Wait up to 5 s for the write lock instead of failing with 'database is locked'
+    'busy_timeout': 5000,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# The local memory cache is per process, which only works for a single process (eg: runserver): the invoice list
+# cache is invalidated in the process making a change only. Deployments with several processes must share a cache,
+# eg: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379 (redis-py).
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'rivet'),
     }
 }
 
+# Cache (alias) and timeout (seconds) of the serialized invoice list pages, see invoices.cache. The cache must be
+# shared by every process serving the API (see CACHES)
+INVOICE_LIST_CACHE = 'default'
+INVOICE_LIST_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -112,9 +153,10 @@ AUTH_PASSWORD_VALIDATORS = [
 
 # DRF settings
 REST_FRAMEWORK = {
+    # Token first: API clients should use tokens, Basic credentials cost a password hash (see BASIC_AUTH_CACHE_TTL)
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'customers.authentication.CustomerTokenAuthentication',
+        'customers.authentication.CachedBasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -123,6 +165,39 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Seconds a Customer stays in the process-local cache used by invoices.views.get_customer() (0 disables the cache)
+CUSTOMER_CACHE_TTL = 0
+
+# Seconds an authentication Token (with its User and Customer) stays in the process-local cache used by
+# customers.authentication.CustomerTokenAuthentication (0 disables the cache). Saves and deletes invalidate the cache
+# of the process making them only, other processes may accept a revoked token for up to this long.
+TOKEN_CACHE_TTL = 5
+
+# Seconds a successful Basic credentials check (the User, keyed by an HMAC of the credentials) stays in the
+# process-local cache used by customers.authentication.CachedBasicAuthentication, so repeated requests skip the
+# password hasher (0 disables the cache). Invalidated like TOKEN_CACHE_TTL, eg: when the password changes.
+BASIC_AUTH_CACHE_TTL = 30
+
+# Seconds the response of a POST /api/payments/ request sent with an Idempotency-Key header is replayed for,
+# see invoices.idempotency and the purge_idempotency_keys command
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# POST /api/payments/?mode=async jobs (invoices.jobs): payments applied per transaction by run_payment_worker, and
+# seconds without progress after which a running job is considered abandoned and claimed by another worker
+PAYMENT_BATCH_CHUNK_SIZE = 500
+PAYMENT_BATCH_JOB_TIMEOUT = 300
+
+# Invoices upserted per transaction by POST /api/invoices/import/ and the import_invoices command (invoices.imports)
+INVOICE_IMPORT_CHUNK_SIZE = 1000
+
+# Number of rows fetched from the database at a time by the streaming export views
+EXPORT_CHUNK_SIZE = 2000
+
+# Fraction of the requests whose SQL queries are counted and timed by rivet.middleware.QueryInstrumentationMiddleware
+# (0 disables it). Results are sent in a Server-Timing header and logged to the 'rivet.queries' logger (INFO).
+# 1% keeps the overhead negligible, raise it while profiling, eg: QUERY_INSTRUMENTATION_SAMPLE_RATE=1
+QUERY_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('QUERY_INSTRUMENTATION_SAMPLE_RATE', 0.01))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
@@ -0,0 +1,74 @@
+import os
+import tempfile
+from pathlib import Path
+
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+
+from rivet.db import get_database
+
+
+class GetDatabaseTests(SimpleTestCase):
+    def test_sqlite(self):
+        """Ensure the bundled SQLite database with persistent, health checked connections is the default."""
+        database = get_database(Path('/web'), environ={})
+
+        self.assertEqual(database['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(database['NAME'], Path('/web/db.sqlite3'))
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertEqual(database['TEST']['NAME'], Path('/web/test_db.sqlite3'))
+
+    def test_postgresql(self):
+        environ = {
+            'DATABASE_ENGINE': 'postgresql',
+            'DATABASE_NAME': 'invoices',
+            'DATABASE_USER': 'rivet',
+            'DATABASE_PASSWORD': 'secret',
+            'DATABASE_HOST': 'db',
+            'DATABASE_CONN_MAX_AGE': '0',
+            'DATABASE_CONN_HEALTH_CHECKS': 'false',
+        }
+        database = get_database(Path('/web'), environ=environ)
+
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(database['NAME'], 'invoices')
+        self.assertEqual(database['USER'], 'rivet')
+        self.assertEqual(database['PASSWORD'], 'secret')
+        self.assertEqual(database['HOST'], 'db')
+        self.assertEqual(database['PORT'], '5432')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertFalse(database['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('DISABLE_SERVER_SIDE_CURSORS', database)
+
+        database = get_database(Path('/web'), environ={**environ, 'DATABASE_PGBOUNCER': '1'})
+        self.assertTrue(database['DISABLE_SERVER_SIDE_CURSORS'])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            get_database(Path('/web'), environ={'DATABASE_ENGINE': 'oracle'})
+
+
+class SQLitePragmasTests(SimpleTestCase):
+    def get_pragma(self, name: str, settings_dict: dict):
+        connection = connections.create_connection('default')
+        connection.settings_dict = settings_dict
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA {name}')
+                return cursor.fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_pragmas(self):
+        """Ensure new SQLite connections run settings.SQLITE_PRAGMAS."""
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connections['default'].settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')}
+
+            self.assertEqual(self.get_pragma('journal_mode', settings_dict), 'wal')
+            self.assertEqual(self.get_pragma('synchronous', settings_dict), 1)  # NORMAL
+            self.assertEqual(self.get_pragma('cache_size', settings_dict), -64 * 1024)
+            self.assertEqual(self.get_pragma('busy_timeout', settings_dict), 5000)
+
+            with override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234}):
+                self.assertEqual(self.get_pragma('busy_timeout', settings_dict), 1234)
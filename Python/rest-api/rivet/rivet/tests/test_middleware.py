@@ -0,0 +1,74 @@
+import re
+from unittest import mock
+
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from django.contrib.auth.models import User
+from customers.models import Customer
+from invoices.models import Invoice
+
+
+class QueryInstrumentationMiddlewareTests(APITestCase):
+    def setUp(self):
+        self.domain = 'http://localhost:8000'
+        user = User.objects.create(
+            username='customer',
+            password='password',
+            first_name='John',
+            last_name='Doe'
+        )
+        customer = Customer.objects.create(
+            user=user
+        )
+        Invoice.objects.create(
+            customer=customer,
+            amount=100,
+            balance=100
+        )
+        self.client.force_authenticate(user=user)
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_server_timing(self):
+        """Ensure instrumented requests report their queries in the Server-Timing header and the log."""
+        url = self.domain + reverse('invoice-list')
+        with self.assertLogs('rivet.queries', level='INFO') as logs:
+            response = self.client.get(url, format='json')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            'Expected a successful GET request.'
+        )
+        match = re.match(r'db;dur=[\d.]+;desc="(\d+) queries", app;dur=[\d.]+$', response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        # validators, count, page (the customer is already cached on the user)
+        self.assertEqual(match.group(1), '3')
+
+        record = logs.records[0]
+        self.assertEqual(record.view, 'invoice-list')
+        self.assertEqual(record.queries, 3)
+        self.assertEqual(record.status, 200)
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_disabled(self):
+        url = self.domain + reverse('invoice-list')
+        response = self.client.get(url, format='json')
+
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=0.1)
+    def test_sampling(self):
+        """Ensure only the sampled requests are instrumented."""
+        url = self.domain + reverse('invoice-list')
+
+        with mock.patch('rivet.middleware.random.random', return_value=0.5):
+            response = self.client.get(url, format='json')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+        with mock.patch('rivet.middleware.random.random', return_value=0.05):
+            response = self.client.get(url, format='json')
+        self.assertTrue(response.has_header('Server-Timing'))